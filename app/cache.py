@@ -0,0 +1,166 @@
+import sys
+import time
+from collections import OrderedDict
+from functools import wraps
+from .timing import describe
+
+# All caches created through create_cache, by name, so they can be inspected
+# and flushed together
+caches = {}
+
+_MISSING = object()
+
+class TTLCache:
+    """
+    Bounded least-recently-used cache whose entries also expire after a fixed time.
+
+    Intended for use from the event loop: get and set never await, so no
+    locking is needed between coroutines. The generation counter goes up on
+    every clear(), so a value computed before a flush can be told apart from
+    one computed after it.
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: float, maxbytes: int = None):
+        """
+        Args:
+            name (str): The name the cache is reported under.
+            maxsize (int): The maximum number of entries; the least recently used entry
+                is evicted when it is exceeded. 0 disables the cache.
+            ttl (float): The number of seconds an entry stays valid.
+            maxbytes (int, optional): The maximum total size of the cached values, counted
+                as the length of bytes and str values. Least recently used entries are
+                evicted when it is exceeded. None leaves the size unbounded.
+        """
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxbytes = maxbytes
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0
+        self.bytes = 0
+        self._entries = OrderedDict()
+
+    def get(self, key, default=None):
+        """
+        Returns the cached value for key, or default if it is missing or expired.
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, size, value = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._entries[key]
+            self.bytes -= size
+        self.misses += 1
+        return default
+
+    def set(self, key, value, generation: int = None):
+        """
+        Stores value under key, evicting least recently used entries while the cache
+        is over its entry or byte limit. A value larger than the byte limit is not stored.
+
+        Args:
+            key: The cache key.
+            value: The value to store.
+            generation (int, optional): The generation the value was computed in. The
+                value is dropped if the cache has been cleared since.
+        """
+        if self.maxsize <= 0 or (generation is not None and generation != self.generation):
+            return
+        size = _size(value)
+        if self.maxbytes is not None and size > self.maxbytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.bytes -= previous[1]
+        self._entries[key] = (time.monotonic() + self.ttl, size, value)
+        self.bytes += size
+        while len(self._entries) > self.maxsize or (self.maxbytes is not None and self.bytes > self.maxbytes):
+            _, (_, evicted_size, _) = self._entries.popitem(last=False)
+            self.bytes -= evicted_size
+
+    def clear(self):
+        """
+        Removes all entries and starts a new generation. Hit and miss counters are kept.
+        """
+        self._entries.clear()
+        self.bytes = 0
+        self.generation += 1
+
+    def stats(self) -> dict:
+        """
+        Returns the size, limits and hit/miss counters of the cache.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "bytes": self.bytes,
+            "maxbytes": self.maxbytes,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else None
+        }
+
+def _size(value) -> int:
+    """
+    Returns the size a value is counted with against a cache's byte limit.
+    """
+    if isinstance(value, (bytes, str)):
+        return len(value)
+    return sys.getsizeof(value)
+
+def create_cache(name: str, maxsize: int, ttl: float, maxbytes: int = None) -> TTLCache:
+    """
+    Creates a TTLCache and registers it under name.
+    """
+    cache = TTLCache(name, maxsize, ttl, maxbytes)
+    caches[name] = cache
+    return cache
+
+def cached(cache: TTLCache, key):
+    """
+    Decorator that caches the results of an async function. None results (e.g. an
+    ID that was not found) are not cached, and neither are results of calls that
+    were in flight while the cache was cleared, as they may predate the flush.
+
+    Args:
+        cache (TTLCache): The cache to store results in.
+        key (callable): Builds the cache key from the function's arguments.
+
+    Returns:
+        callable: The decorator.
+    """
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            cache_key = key(*args, **kwargs)
+            value = cache.get(cache_key, _MISSING)
+            if value is _MISSING:
+                describe("cache", "miss")
+                generation = cache.generation
+                value = await func(*args, **kwargs)
+                if value is not None:
+                    cache.set(cache_key, value, generation)
+            else:
+                describe("cache", "hit")
+            return value
+        return wrapper
+    return decorator
+
+def clear_caches():
+    """
+    Removes all entries from every registered cache.
+    """
+    for cache in caches.values():
+        cache.clear()
+
+def cache_stats() -> dict:
+    """
+    Returns the statistics of every registered cache, by name.
+    """
+    return {name: cache.stats() for name, cache in caches.items()}
@@ -0,0 +1,325 @@
+import argparse
+import asyncio
+import asyncpg
+import logging
+from . import config
+
+logger = logging.getLogger(__name__)
+
+# Whether detail requests read transitive hierarchies from structure_closure.
+# Set by detect_closure_table on connect, after every hierarchy reload and by
+# the health monitor until the table is found.
+closure_enabled = False
+
+# The channel on which structure_parents announces changes, so the application
+# can reload its in-memory hierarchy index
+CHANGE_CHANNEL = "structure_parents_changed"
+
+# structure_closure holds one row per (hierarchy model, ancestor, descendant)
+# pair, with the length of the shortest path between them. A structure is not
+# its own ancestor, even inside a cycle, matching the recursive queries.
+CLOSURE_TABLE_DDL = """
+    CREATE TABLE IF NOT EXISTS structure_closure (
+        hierarchy_model_name text NOT NULL,
+        ancestor_id integer NOT NULL,
+        descendant_id integer NOT NULL,
+        depth integer NOT NULL,
+        PRIMARY KEY (hierarchy_model_name, ancestor_id, descendant_id)
+    );
+    CREATE INDEX IF NOT EXISTS idx_structure_closure_descendant
+        ON structure_closure (hierarchy_model_name, descendant_id, depth);
+    """
+
+# The refresh functions run from row-level triggers on structure_parents.
+# Writers are serialized on structure_closure, so concurrent edge changes are
+# applied one after the other; readers are never blocked.
+CLOSURE_FUNCTIONS_DDL = """
+    -- Repopulates the whole table, one depth level at a time (shortest depth first)
+    CREATE OR REPLACE FUNCTION structure_closure_rebuild() RETURNS void AS $$
+    DECLARE
+        level integer := 1;
+        added bigint;
+    BEGIN
+        LOCK TABLE structure_closure IN SHARE ROW EXCLUSIVE MODE;
+        TRUNCATE structure_closure;
+        INSERT INTO structure_closure (hierarchy_model_name, ancestor_id, descendant_id, depth)
+        SELECT DISTINCT hierarchy_model_name, parent_id, child_id, 1
+        FROM structure_parents
+        WHERE hierarchy_model_name IS NOT NULL AND parent_id <> child_id;
+        LOOP
+            INSERT INTO structure_closure (hierarchy_model_name, ancestor_id, descendant_id, depth)
+            SELECT c.hierarchy_model_name, c.ancestor_id, sp.child_id, level + 1
+            FROM structure_closure c
+            JOIN structure_parents sp
+              ON sp.parent_id = c.descendant_id AND sp.hierarchy_model_name = c.hierarchy_model_name
+            WHERE c.depth = level AND sp.child_id <> c.ancestor_id
+            ON CONFLICT DO NOTHING;
+            GET DIAGNOSTICS added = ROW_COUNT;
+            EXIT WHEN added = 0;
+            level := level + 1;
+        END LOOP;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    -- Adds the paths through a new parent -> child edge
+    CREATE OR REPLACE FUNCTION structure_closure_add_edge(model text, parent integer, child integer)
+    RETURNS void AS $$
+    BEGIN
+        IF model IS NULL OR parent = child THEN
+            RETURN;
+        END IF;
+        LOCK TABLE structure_closure IN SHARE ROW EXCLUSIVE MODE;
+        INSERT INTO structure_closure (hierarchy_model_name, ancestor_id, descendant_id, depth)
+        SELECT model, a.id, d.id, MIN(a.depth + 1 + d.depth)
+        FROM (
+            SELECT parent AS id, 0 AS depth
+            UNION ALL
+            SELECT ancestor_id, depth FROM structure_closure
+            WHERE hierarchy_model_name = model AND descendant_id = parent
+        ) a
+        CROSS JOIN (
+            SELECT child AS id, 0 AS depth
+            UNION ALL
+            SELECT descendant_id, depth FROM structure_closure
+            WHERE hierarchy_model_name = model AND ancestor_id = child
+        ) d
+        WHERE a.id <> d.id
+        GROUP BY a.id, d.id
+        ON CONFLICT (hierarchy_model_name, ancestor_id, descendant_id)
+        DO UPDATE SET depth = LEAST(structure_closure.depth, EXCLUDED.depth);
+    END;
+    $$ LANGUAGE plpgsql;
+
+    -- Recomputes the ancestors of everything below a removed parent -> child edge.
+    -- Only pairs whose descendant is the child or one of its descendants can change.
+    CREATE OR REPLACE FUNCTION structure_closure_remove_edge(model text, parent integer, child integer)
+    RETURNS void AS $$
+    DECLARE
+        affected integer[];
+        level integer := 1;
+        added bigint;
+    BEGIN
+        IF model IS NULL OR parent = child THEN
+            RETURN;
+        END IF;
+        LOCK TABLE structure_closure IN SHARE ROW EXCLUSIVE MODE;
+        SELECT array_agg(id) INTO affected FROM (
+            SELECT child AS id
+            UNION
+            SELECT descendant_id FROM structure_closure
+            WHERE hierarchy_model_name = model AND ancestor_id = child
+        ) s;
+        DELETE FROM structure_closure
+        WHERE hierarchy_model_name = model AND descendant_id = ANY(affected);
+        INSERT INTO structure_closure (hierarchy_model_name, ancestor_id, descendant_id, depth)
+        SELECT DISTINCT model, sp.parent_id, sp.child_id, 1
+        FROM structure_parents sp
+        WHERE sp.hierarchy_model_name = model AND sp.child_id = ANY(affected) AND sp.parent_id <> sp.child_id;
+        LOOP
+            INSERT INTO structure_closure (hierarchy_model_name, ancestor_id, descendant_id, depth)
+            SELECT model, sp.parent_id, c.descendant_id, level + 1
+            FROM structure_closure c
+            JOIN structure_parents sp
+              ON sp.child_id = c.ancestor_id AND sp.hierarchy_model_name = model
+            WHERE c.hierarchy_model_name = model AND c.descendant_id = ANY(affected)
+              AND c.depth = level AND sp.parent_id <> c.descendant_id
+            ON CONFLICT DO NOTHING;
+            GET DIAGNOSTICS added = ROW_COUNT;
+            EXIT WHEN added = 0;
+            level := level + 1;
+        END LOOP;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    -- Announces a change to structure_parents, once per statement. Notifications
+    -- are delivered when the transaction commits, and identical ones are merged.
+    CREATE OR REPLACE FUNCTION structure_parents_notify() RETURNS trigger AS $$
+    BEGIN
+        PERFORM pg_notify('""" + CHANGE_CHANNEL + """', '');
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION structure_closure_refresh() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'TRUNCATE' THEN
+            TRUNCATE structure_closure;
+            RETURN NULL;
+        END IF;
+        IF TG_OP IN ('DELETE', 'UPDATE') THEN
+            PERFORM structure_closure_remove_edge(OLD.hierarchy_model_name, OLD.parent_id, OLD.child_id);
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            PERFORM structure_closure_add_edge(NEW.hierarchy_model_name, NEW.parent_id, NEW.child_id);
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+    """
+
+CLOSURE_TRIGGERS_DDL = """
+    DROP TRIGGER IF EXISTS structure_closure_refresh ON structure_parents;
+    CREATE TRIGGER structure_closure_refresh
+        AFTER INSERT OR UPDATE OR DELETE ON structure_parents
+        FOR EACH ROW EXECUTE PROCEDURE structure_closure_refresh();
+    DROP TRIGGER IF EXISTS structure_closure_truncate ON structure_parents;
+    CREATE TRIGGER structure_closure_truncate
+        AFTER TRUNCATE ON structure_parents
+        FOR EACH STATEMENT EXECUTE PROCEDURE structure_closure_refresh();
+    DROP TRIGGER IF EXISTS structure_parents_notify ON structure_parents;
+    CREATE TRIGGER structure_parents_notify
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON structure_parents
+        FOR EACH STATEMENT EXECUTE PROCEDURE structure_parents_notify();
+    """
+
+CLOSURE_DROP_DDL = """
+    DROP TRIGGER IF EXISTS structure_closure_refresh ON structure_parents;
+    DROP TRIGGER IF EXISTS structure_closure_truncate ON structure_parents;
+    DROP TRIGGER IF EXISTS structure_parents_notify ON structure_parents;
+    DROP FUNCTION IF EXISTS structure_closure_refresh();
+    DROP FUNCTION IF EXISTS structure_parents_notify();
+    DROP FUNCTION IF EXISTS structure_closure_add_edge(text, integer, integer);
+    DROP FUNCTION IF EXISTS structure_closure_remove_edge(text, integer, integer);
+    DROP FUNCTION IF EXISTS structure_closure_rebuild();
+    DROP TABLE IF EXISTS structure_closure;
+    """
+
+async def build_closure(conn):
+    """
+    Creates structure_closure with its refresh triggers and populates it from structure_parents.
+    Also installs a trigger that announces edge changes on CHANGE_CHANNEL, which
+    the application listens to, and announces the new table there itself.
+    Running it again repopulates the table from scratch.
+
+    Args:
+        conn (asyncpg.Connection): The connection to build the table on.
+
+    Returns:
+        int: The number of rows in the closure table.
+    """
+    async with conn.transaction():
+        await conn.execute(CLOSURE_TABLE_DDL)
+        await conn.execute(CLOSURE_FUNCTIONS_DDL)
+        # Hold off edge changes until the triggers are in place and the table is populated
+        await conn.execute("LOCK TABLE structure_parents IN SHARE ROW EXCLUSIVE MODE")
+        await conn.execute(CLOSURE_TRIGGERS_DDL)
+        await conn.execute("SELECT structure_closure_rebuild()")
+        # Delivered on commit; a listening application reloads and starts using the table
+        await conn.execute("SELECT pg_notify($1, '')", CHANGE_CHANNEL)
+    await conn.execute("ANALYZE structure_closure")
+    return await conn.fetchval("SELECT COUNT(*) FROM structure_closure")
+
+async def drop_closure(conn):
+    """
+    Removes structure_closure and its triggers. Hierarchies are then queried recursively again.
+    A listening application is told on CHANGE_CHANNEL, so it stops using the table.
+
+    Args:
+        conn (asyncpg.Connection): The connection to drop the table on.
+    """
+    async with conn.transaction():
+        await conn.execute(CLOSURE_DROP_DDL)
+        await conn.execute("SELECT pg_notify($1, '')", CHANGE_CHANNEL)
+
+async def detect_closure_table(pool):
+    """
+    Enables closure table lookups when structure_closure exists and is kept up to
+    date by its trigger, unless disabled through config.HIERARCHY_USE_CLOSURE.
+    Lookups keep their current setting while the check runs, so it can be
+    repeated at any time.
+
+    Args:
+        pool (asyncpg.pool.Pool): The database connection pool.
+
+    Returns:
+        bool: Whether closure table lookups are enabled.
+    """
+    global closure_enabled
+    if not config.HIERARCHY_USE_CLOSURE:
+        closure_enabled = False
+        return False
+
+    async with pool.acquire() as conn:
+        maintained = await conn.fetchval(
+            """
+            SELECT to_regclass('structure_closure') IS NOT NULL
+               AND EXISTS (
+                   SELECT 1 FROM pg_trigger
+                   WHERE tgname = 'structure_closure_refresh'
+                     AND tgrelid = 'structure_parents'::regclass
+               )
+            """
+        )
+
+    if bool(maintained) != closure_enabled:
+        if maintained:
+            logger.info("Using structure_closure for hierarchy lookups")
+        else:
+            logger.info("structure_closure is not available, using recursive hierarchy queries")
+    closure_enabled = bool(maintained)
+    return closure_enabled
+
+async def detect_change_notifications(pool) -> bool:
+    """
+    Checks whether structure_parents announces its changes on CHANGE_CHANNEL.
+    The notification trigger is installed together with structure_closure.
+
+    Args:
+        pool (asyncpg.pool.Pool): The database connection pool.
+
+    Returns:
+        bool: Whether the notification trigger is installed.
+    """
+    async with pool.acquire() as conn:
+        return await conn.fetchval(
+            """
+            SELECT EXISTS (
+                SELECT 1 FROM pg_trigger
+                WHERE tgname = 'structure_parents_notify'
+                  AND tgrelid = to_regclass('structure_parents')
+            )
+            """
+        )
+
+def is_closure_enabled() -> bool:
+    """
+    Returns whether transitive hierarchies are read from structure_closure.
+    """
+    return closure_enabled
+
+def disable_closure():
+    """
+    Stops closure table lookups, e.g. after the table was dropped or the connection was closed.
+    """
+    global closure_enabled
+    closure_enabled = False
+
+async def _main(args):
+    conn = await asyncpg.connect(args.dsn)
+    try:
+        if args.command == "build":
+            rows = await build_closure(conn)
+            print(f"Built structure_closure with {rows} rows")
+        else:
+            await drop_closure(conn)
+            print("Dropped structure_closure")
+    finally:
+        await conn.close()
+
+def main():
+    """
+    Command-line entry point: python -m app.closure {build,drop} [--dsn DSN]
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m app.closure",
+        description="Manage the structure_closure table used for brain structure hierarchy lookups."
+    )
+    parser.add_argument("command", choices=["build", "drop"],
+                        help="build: create (or repopulate) the table and its refresh triggers; "
+                             "drop: remove them")
+    parser.add_argument("--dsn", default=None,
+                        help="PostgreSQL connection URL. Defaults to the standard PG* environment variables.")
+    asyncio.run(_main(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+import asyncio
+import gzip
+import logging
+import mimetypes
+import os
+import zlib
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse
+
+logger = logging.getLogger(__name__)
+
+# brotli is optional; without it only gzip is offered
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Suffixes that set the ETag of a compressed variant apart from the file's own
+ETAG_SUFFIXES = {"br": "br", "gzip": "gz"}
+
+# Content types worth compressing; everything else (images, fonts, ...) is sent as-is
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+)
+
+def available_encodings() -> tuple:
+    """
+    Returns the supported content encodings, most preferred first.
+    """
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+def choose_encoding(accept_encoding: str):
+    """
+    Picks the best content encoding the client accepts.
+
+    Args:
+        accept_encoding (str): The value of the request's Accept-Encoding header.
+
+    Returns:
+        str: "br" or "gzip", or None if the client accepts neither.
+    """
+    accepted = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[token] = quality
+
+    for encoding in available_encodings():
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+def variant_etag(etag: str, encoding: str) -> str:
+    """
+    Derives the entity tag of a compressed variant from the uncompressed file's,
+    e.g. "abc" becomes "abc-gz". Each encoding is a different representation, so
+    it must not share a validator with the uncompressed bytes.
+    """
+    suffix = ETAG_SUFFIXES[encoding]
+    if etag.endswith('"'):
+        return f'{etag[:-1]}-{suffix}"'
+    return f"{etag}-{suffix}"
+
+def is_compressible(content_type: str) -> bool:
+    """
+    Returns whether a response with this content type should be compressed.
+    """
+    return content_type.split(";")[0].strip().lower().startswith(COMPRESSIBLE_TYPES)
+
+def compress(data: bytes, encoding: str, level: int) -> bytes:
+    """
+    Compresses a complete body.
+
+    Args:
+        data (bytes): The body to compress.
+        encoding (str): "br" or "gzip".
+        level (int): The brotli quality (0-11) or gzip level (1-9).
+
+    Returns:
+        bytes: The compressed body.
+    """
+    if encoding == "br":
+        return brotli.compress(data, quality=level)
+    return gzip.compress(data, compresslevel=level)
+
+class _StreamCompressor:
+    """
+    Incremental compressor for a streamed body.
+    """
+
+    def __init__(self, encoding: str, level: int):
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=level)
+        else:
+            # wbits=31 selects the gzip container format
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        """
+        Compresses the next chunk. Non-final chunks are flushed so clients receive
+        them without waiting for the rest of the stream.
+        """
+        if self.encoding == "br":
+            output = self._compressor.process(data)
+            return output + (self._compressor.finish() if final else self._compressor.flush())
+        output = self._compressor.compress(data)
+        return output + self._compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+class CompressionMiddleware:
+    """
+    ASGI middleware that compresses responses with gzip or brotli, as negotiated
+    through Accept-Encoding.
+
+    Only responses under path_prefix with a compressible content type are
+    compressed, and complete bodies smaller than minimum_size are sent as-is.
+    Streamed bodies are compressed chunk by chunk.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6,
+                 brotli_quality: int = 4, path_prefix: str = "/api"):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.levels = {"gzip": gzip_level, "br": brotli_quality}
+        self.path_prefix = path_prefix
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.path_prefix):
+            await self.app(scope, receive, send)
+            return
+
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressingResponder(send, encoding, self.levels[encoding], self.minimum_size)
+        await self.app(scope, receive, responder.send)
+
+class _CompressingResponder:
+    """
+    Wraps the ASGI send callable of one response. The start message is held back
+    until the first body chunk shows whether the response should be compressed.
+    """
+
+    def __init__(self, send, encoding: str, level: int, minimum_size: int):
+        self._send = send
+        self.encoding = encoding
+        self.level = level
+        self.minimum_size = minimum_size
+        self.start_message = None
+        self.compressor = None
+        self.passthrough = False
+
+    async def send(self, message):
+        message_type = message["type"]
+        if message_type == "http.response.start":
+            self.start_message = message
+            return
+        if message_type != "http.response.body":
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.start_message is not None:
+            start_message, self.start_message = self.start_message, None
+            headers = MutableHeaders(raw=start_message["headers"])
+            compressible = is_compressible(headers.get("content-type", ""))
+            if compressible:
+                headers.add_vary_header("Accept-Encoding")
+
+            if (not compressible or "content-encoding" in headers
+                    or (not more_body and len(body) < self.minimum_size)):
+                self.passthrough = True
+                await self._send(start_message)
+                await self._send(message)
+                return
+
+            headers["Content-Encoding"] = self.encoding
+            if not more_body:
+                body = compress(body, self.encoding, self.level)
+                headers["Content-Length"] = str(len(body))
+                await self._send(start_message)
+                await self._send({"type": "http.response.body", "body": body})
+                return
+
+            # Streamed response: the compressed length is not known up front
+            del headers["Content-Length"]
+            self.compressor = _StreamCompressor(self.encoding, self.level)
+            await self._send(start_message)
+
+        if self.passthrough:
+            await self._send(message)
+            return
+
+        await self._send({
+            "type": "http.response.body",
+            "body": self.compressor.compress(body, final=not more_body),
+            "more_body": more_body
+        })
+
+class PrecompressedStaticFiles(StaticFiles):
+    """
+    StaticFiles that compresses compressible files once, when it is created,
+    and serves those variants to clients that accept them.
+
+    A variant is rebuilt in a worker thread if the file's size or modification
+    time has changed since it was compressed, so edited files are never served
+    stale; until it is ready, the file is sent uncompressed. Each variant has an
+    entity tag of its own, and conditional requests are answered for the
+    variant that would be sent.
+    """
+
+    def __init__(self, *args, gzip_level: int = 9, brotli_quality: int = 11, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.levels = {"gzip": gzip_level, "br": brotli_quality}
+        # Maps a file's real path to ((size, mtime), {encoding: compressed bytes})
+        self.variants = {}
+        # Recompressions in progress, by real path
+        self.pending = {}
+        if self.directory is not None and os.path.isdir(self.directory):
+            for root, _, files in os.walk(self.directory):
+                for name in files:
+                    self._compress_file(os.path.realpath(os.path.join(root, name)))
+
+    def _compress_file(self, full_path: str):
+        """
+        Compresses a file with every available encoding and stores the variants.
+        """
+        media_type, _ = mimetypes.guess_type(full_path)
+        if not media_type or not is_compressible(media_type):
+            return None
+        stat_result = os.stat(full_path)
+        with open(full_path, "rb") as f:
+            data = f.read()
+        encoded = {}
+        for encoding in available_encodings():
+            compressed = compress(data, encoding, self.levels[encoding])
+            # Only keep variants that are actually smaller
+            if len(compressed) < len(data):
+                encoded[encoding] = compressed
+        entry = ((stat_result.st_size, stat_result.st_mtime), encoded)
+        self.variants[full_path] = entry
+        return entry
+
+    def _recompress(self, full_path: str):
+        """
+        Compresses a new or changed file in a worker thread, off the event loop.
+        """
+        if full_path in self.pending:
+            return
+        future = asyncio.get_running_loop().run_in_executor(None, self._compress_file, full_path)
+        self.pending[full_path] = future
+        future.add_done_callback(lambda done: self._recompressed(full_path, done))
+
+    def _recompressed(self, full_path: str, future):
+        self.pending.pop(full_path, None)
+        if not future.cancelled() and future.exception() is not None:
+            logger.warning("Error compressing %s: %s", full_path, future.exception())
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200):
+        request_headers = Headers(scope=scope)
+        response = FileResponse(full_path, status_code=status_code, stat_result=stat_result)
+        if status_code == 200 and is_compressible(response.media_type):
+            response = self._choose_variant(response, os.path.realpath(full_path), stat_result, request_headers)
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+    def _choose_variant(self, response: FileResponse, full_path: str, stat_result, request_headers: Headers):
+        """
+        Returns the compressed variant of a file the client accepts, or the
+        uncompressed response if there is none (yet).
+        """
+        response.headers.add_vary_header("Accept-Encoding")
+        entry = self.variants.get(full_path)
+        if entry is None or entry[0] != (stat_result.st_size, stat_result.st_mtime):
+            self._recompress(full_path)
+            return response
+
+        encoding = choose_encoding(request_headers.get("accept-encoding", ""))
+        if encoding is None or encoding not in entry[1]:
+            return response
+
+        headers = {
+            key: value for key, value in response.headers.items()
+            if key not in ("content-length", "content-type")
+        }
+        headers["content-encoding"] = encoding
+        headers["etag"] = variant_etag(response.headers["etag"], encoding)
+        return Response(
+            content=entry[1][encoding],
+            status_code=response.status_code,
+            headers=headers,
+            media_type=response.media_type
+        )
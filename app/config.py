@@ -0,0 +1,81 @@
+import os
+
+def _env_int(name: str, default: int) -> int:
+    """
+    Reads an integer setting from the environment, falling back to a default.
+    """
+    value = os.environ.get(name)
+    return int(value) if value not in (None, "") else default
+
+def _env_float(name: str, default: float) -> float:
+    """
+    Reads a float setting from the environment, falling back to a default.
+    """
+    value = os.environ.get(name)
+    return float(value) if value not in (None, "") else default
+
+def _env_bool(name: str, default: bool) -> bool:
+    """
+    Reads a boolean setting ("1"/"true"/"yes"/"on") from the environment, falling back to a default.
+    """
+    value = os.environ.get(name)
+    if value in (None, ""):
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+# Connection pool settings, passed to asyncpg.create_pool. Each of them can be
+# overridden per connection through the /api/connect payload.
+POOL_SETTINGS = {
+    "min_size": _env_int("DB_POOL_MIN_SIZE", 2),
+    "max_size": _env_int("DB_POOL_MAX_SIZE", 20),
+    "command_timeout": _env_float("DB_COMMAND_TIMEOUT", 30.0),
+    "max_inactive_connection_lifetime": _env_float("DB_MAX_INACTIVE_CONNECTION_LIFETIME", 300.0),
+    "statement_cache_size": _env_int("DB_STATEMENT_CACHE_SIZE", 100),
+}
+
+# Maximum number of pooled connections a single detail request may use at once
+# for its independent sub-queries
+DETAIL_QUERY_CONCURRENCY = _env_int("DETAIL_QUERY_CONCURRENCY", 3)
+
+# Database health monitor settings (seconds)
+HEALTH_CHECK_INTERVAL = _env_float("DB_HEALTH_CHECK_INTERVAL", 30.0)
+RECONNECT_BACKOFF_INITIAL = _env_float("DB_RECONNECT_BACKOFF_INITIAL", 1.0)
+RECONNECT_BACKOFF_MAX = _env_float("DB_RECONNECT_BACKOFF_MAX", 60.0)
+
+# Whether to install pg_trgm and create trigram indexes for search on connect.
+# Off by default: schema changes are left to the database administrator.
+SEARCH_MANAGE_TRIGRAM = _env_bool("SEARCH_MANAGE_TRIGRAM", False)
+
+# Batch detail requests: maximum number of IDs per request, and number of IDs
+# fetched per round of queries. Batches larger than one chunk are streamed.
+BATCH_MAX_SIZE = _env_int("BATCH_MAX_SIZE", 10000)
+BATCH_CHUNK_SIZE = _env_int("BATCH_CHUNK_SIZE", 500)
+
+# Whether to read transitive hierarchies from structure_closure when it exists
+# (see python -m app.closure)
+HIERARCHY_USE_CLOSURE = _env_bool("HIERARCHY_USE_CLOSURE", True)
+
+# Seconds to wait after structure_parents announces a change before reloading
+# the hierarchy index, so a burst of changes causes a single reload
+HIERARCHY_RELOAD_DELAY = _env_float("HIERARCHY_RELOAD_DELAY", 0.5)
+
+# Detail response caches: maximum number of entries and of bytes per cache, and
+# entry lifetime (seconds)
+DETAILS_CACHE_SIZE = _env_int("DETAILS_CACHE_SIZE", 1024)
+DETAILS_CACHE_MAX_BYTES = _env_int("DETAILS_CACHE_MAX_BYTES", 32 * 1024 * 1024)
+DETAILS_CACHE_TTL = _env_float("DETAILS_CACHE_TTL", 300.0)
+
+# Encode JSON responses with orjson (when installed) instead of the standard library
+FAST_JSON = _env_bool("FAST_JSON", False)
+
+# API responses whose complete body is smaller than this (bytes) are not compressed
+COMPRESSION_MINIMUM_SIZE = _env_int("COMPRESSION_MINIMUM_SIZE", 1024)
+
+# Logging: minimum level, output format ("text" or "json"), and the share of
+# high-frequency per-request events (e.g. searches) that are kept
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text").lower()
+LOG_SAMPLE_RATE = _env_float("LOG_SAMPLE_RATE", 1.0)
+
+# Add a Server-Timing header with a per-phase breakdown to API responses
+SERVER_TIMING = _env_bool("SERVER_TIMING", True)
@@ -1,11 +1,40 @@
 import asyncpg
-from typing import Optional
 import urllib.parse
 import asyncio
+import logging
+from . import config
+from .cache import clear_caches
+from .closure import detect_closure_table, disable_closure, is_closure_enabled, detect_change_notifications, CHANGE_CHANNEL
+from .hierarchy_index import load_hierarchy_index, clear_hierarchy_index
+from .metrics import acquire, track_query, register_collector, register_error_handler
+from .search import setup_trigram_search, stop_trigram_index_task
+from .search_index import rebuild_search_indexes, clear_search_indexes
+
+logger = logging.getLogger(__name__)
 
 # Global variables
 db_pool = None
 is_connected = False
+health_monitor_task = None
+
+# Set to run the next health check right away. Created with the health monitor
+# task, so it belongs to the running event loop.
+health_check_requested = None
+
+# Dedicated connection that listens for hierarchy changes, and the task that
+# reloads the hierarchy index after one
+change_listener = None
+hierarchy_reload_task = None
+hierarchy_reload_pending = False
+
+# Health monitor settings (seconds)
+HEALTH_CHECK_INTERVAL = config.HEALTH_CHECK_INTERVAL
+RECONNECT_BACKOFF_INITIAL = config.RECONNECT_BACKOFF_INITIAL
+RECONNECT_BACKOFF_MAX = config.RECONNECT_BACKOFF_MAX
+
+# Pool settings used for the current connection and for reconnections
+pool_settings = dict(config.POOL_SETTINGS)
+
 # Store connection credentials for reconnection
 connection_params = {
     "host": None,
@@ -17,7 +46,7 @@ connection_params = {
 
 async def connect_db(host: str = None, port: str = None, 
                     username: str = None, password: str = None, 
-                    database: str = None):
+                    database: str = None, pool_options: dict = None):
     """
     Initializes the database connection pool if it doesn't already exist.
     This function should be called during the application startup or when
@@ -29,14 +58,20 @@ async def connect_db(host: str = None, port: str = None,
         username (str, optional): Database username
         password (str, optional): Database password
         database (str, optional): Database name
+        pool_options (dict, optional): Overrides for the configured pool settings
+            (min_size, max_size, command_timeout, max_inactive_connection_lifetime,
+            statement_cache_size). Options set to None keep their configured value.
 
     Returns:
         asyncpg.pool.Pool: The database connection pool.
     """
-    global db_pool, is_connected, connection_params
+    global db_pool, is_connected, connection_params, pool_settings
 
     # If connection parameters are provided, create a new connection and store them
     if host and port and username and password and database:
+        # Stop the health monitor so it does not verify a pool that is being replaced
+        await stop_health_monitor()
+
         # Store the connection parameters for future reconnections
         connection_params = {
             "host": host,
@@ -45,32 +80,36 @@ async def connect_db(host: str = None, port: str = None,
             "password": password,
             "database": database
         }
+        pool_settings = dict(config.POOL_SETTINGS)
+        if pool_options:
+            pool_settings.update({k: v for k, v in pool_options.items() if v is not None})
+
         # Close existing connection if any
+        await stop_trigram_index_task()
+        await stop_change_listener()
         if db_pool:
             await db_pool.close()
             db_pool = None
 
         # Create connection URL from parameters
-        # URL encode username and password to handle special characters
-        encoded_username = urllib.parse.quote_plus(username)
-        encoded_password = urllib.parse.quote_plus(password)
-
-
-        database_url = f"postgresql://{encoded_username}:{encoded_password}@{host}:{port}/{database}"
+        database_url = _database_url()
 
         try:
-            print(f"Connecting to database at {host}:{port}/{database} with username {username}")
-            db_pool = await asyncpg.create_pool(database_url)
+            logger.info("Connecting to database at %s:%s/%s", host, port, database)
+            logger.debug("Connecting as %s", username)
+            db_pool = await asyncpg.create_pool(database_url, **pool_settings)
 
             # Verify connection by executing a simple query
             async with db_pool.acquire() as conn:
                 await conn.execute("SELECT 1")
 
             is_connected = True
-            print(f"Connection successful! is_connected = {is_connected}")
+            logger.info("Connected to database")
+            await _on_connected()
+            start_health_monitor()
         except Exception as e:
             is_connected = False
-            print(f"Error connecting to database: {str(e)}")
+            logger.warning("Error connecting to database: %s", _describe_error(e))
             if db_pool:
                 await db_pool.close()
                 db_pool = None
@@ -78,42 +117,43 @@ async def connect_db(host: str = None, port: str = None,
     # If we're using an existing connection, verify it's still valid
     elif db_pool:
         try:
-            print("Verifying existing connection...")
+            logger.debug("Verifying existing connection")
             # Verify connection by executing a simple query
             async with db_pool.acquire() as conn:
                 await conn.execute("SELECT 1")
 
             is_connected = True
-            print(f"Existing connection verified successfully. is_connected = {is_connected}")
+            logger.debug("Existing connection verified")
         except Exception as e:
             is_connected = False
-            print(f"Error verifying existing connection: {str(e)}")
+            logger.warning("Error verifying existing connection: %s", _describe_error(e))
+            await stop_trigram_index_task()
+            await stop_change_listener()
             if db_pool:
                 await db_pool.close()
                 db_pool = None
 
     # If not connected but we have stored credentials, try to reconnect
     if not is_connected and not db_pool and all(connection_params.values()):
-        print("Attempting to reconnect using stored credentials...")
+        logger.info("Attempting to reconnect using stored credentials")
         try:
             # Create connection URL from stored parameters
-            encoded_username = urllib.parse.quote_plus(connection_params["username"])
-            encoded_password = urllib.parse.quote_plus(connection_params["password"])
-
-            database_url = f"postgresql://{encoded_username}:{encoded_password}@{connection_params['host']}:{connection_params['port']}/{connection_params['database']}"
+            database_url = _database_url()
 
-            print(f"Reconnecting to database at {connection_params['host']}:{connection_params['port']}/{connection_params['database']} with username {connection_params['username']}")
-            db_pool = await asyncpg.create_pool(database_url)
+            logger.info("Reconnecting to database at %s:%s/%s",
+                        connection_params["host"], connection_params["port"], connection_params["database"])
+            db_pool = await asyncpg.create_pool(database_url, **pool_settings)
 
             # Verify connection by executing a simple query
             async with db_pool.acquire() as conn:
                 await conn.execute("SELECT 1")
 
             is_connected = True
-            print(f"Reconnection successful! is_connected = {is_connected}")
+            logger.info("Reconnected to database")
+            await _on_connected()
         except Exception as e:
             is_connected = False
-            print(f"Error reconnecting to database: {str(e)}")
+            logger.warning("Error reconnecting to database: %s", _describe_error(e))
             if db_pool:
                 await db_pool.close()
                 db_pool = None
@@ -123,15 +163,341 @@ async def connect_db(host: str = None, port: str = None,
 
     return db_pool
 
+def _describe_error(error: Exception) -> str:
+    """
+    Returns an error's message with the stored username and password masked, since
+    connection errors may quote them (e.g. "password authentication failed for user ...").
+    """
+    message = str(error)
+    for secret in (connection_params.get("username"), connection_params.get("password")):
+        if secret:
+            message = message.replace(secret, "***")
+    return message
+
+def get_pool():
+    """
+    Returns the database connection pool for use on the request path.
+    Unlike connect_db(), this does no I/O: connection health is tracked by the
+    background health monitor, which keeps is_connected up to date.
+
+    Returns:
+        asyncpg.pool.Pool: The database connection pool, or None if not connected.
+    """
+    if not is_connected:
+        return None
+    return db_pool
+
+def get_pool_status():
+    """
+    Reports the configuration and current utilization of the connection pool.
+
+    Returns:
+        dict: The pool settings, plus the number of open, idle and in-use connections.
+    """
+    status = {"connected": is_connected, "settings": dict(pool_settings)}
+    if db_pool is None:
+        status.update({"size": 0, "idle": 0, "in_use": 0})
+    else:
+        size = db_pool.get_size()
+        idle = db_pool.get_idle_size()
+        status.update({"size": size, "idle": idle, "in_use": size - idle})
+    return status
+
+class QueryFanOut:
+    """
+    Runs independent queries concurrently, each on its own pooled connection.
+    At most max_connections connections are held at a time, so one request
+    cannot take over the whole pool.
+    """
+
+    def __init__(self, pool, max_connections: int):
+        self._pool = pool
+        self._semaphore = asyncio.Semaphore(max(1, max_connections))
+
+    async def run(self, func, *args):
+        """
+        Acquires a connection and awaits func(conn, *args) on it.
+        """
+        async with self._semaphore:
+            async with acquire(self._pool) as conn:
+                return await func(conn, *args)
+
+    async def fetch(self, name: str, query: str, *args):
+        """
+        Runs conn.fetch(query, *args) on a pooled connection, recorded in the
+        query metrics under name.
+        """
+        return await self.run(_timed, name, "fetch", query, args)
+
+    async def fetchrow(self, name: str, query: str, *args):
+        """
+        Runs conn.fetchrow(query, *args) on a pooled connection, recorded in the
+        query metrics under name.
+        """
+        return await self.run(_timed, name, "fetchrow", query, args)
+
+async def _timed(conn, name: str, method: str, query: str, args: tuple):
+    with track_query(name):
+        return await getattr(conn, method)(query, *args)
+
+def _collect_pool_metrics() -> list:
+    """
+    Reports the connection pool's utilization on every metrics scrape.
+    """
+    status = get_pool_status()
+    lines = []
+    for name, value, documentation in (
+        ("db_pool_size", status["size"], "Open connections in the pool."),
+        ("db_pool_idle", status["idle"], "Idle connections in the pool."),
+        ("db_pool_in_use", status["in_use"], "Connections checked out of the pool."),
+        ("db_pool_max_size", status["settings"].get("max_size", 0), "Maximum number of connections in the pool."),
+    ):
+        lines += [f"# HELP {name} {documentation}", f"# TYPE {name} gauge", f"{name} {value}"]
+    return lines
+
+register_collector(_collect_pool_metrics)
+
+# Errors that mean the connection or the server is gone, rather than a problem
+# with one query. Running out of pooled connections (a timeout) is not one.
+CONNECTION_ERRORS = (
+    asyncpg.exceptions.PostgresConnectionError,
+    asyncpg.exceptions.AdminShutdownError,
+    asyncpg.exceptions.CrashShutdownError,
+    asyncpg.exceptions.CannotConnectNowError,
+    ConnectionError
+)
+
+def _on_query_error(error: BaseException):
+    """
+    Marks the database unavailable on the first connection-level error, so later
+    requests are refused with "Database not connected" instead of failing one by
+    one, and has the health monitor verify the pool right away instead of at its
+    next interval.
+    """
+    global is_connected
+    if not is_connected or not isinstance(error, CONNECTION_ERRORS):
+        return
+    is_connected = False
+    logger.warning("Database connection lost: %s", _describe_error(error))
+    if health_check_requested is not None:
+        health_check_requested.set()
+
+register_error_handler(_on_query_error)
+
+async def _health_monitor():
+    """
+    Periodically verifies the connection pool and reconnects with exponential
+    backoff using the stored credentials when the database becomes unavailable.
+    """
+    backoff = RECONNECT_BACKOFF_INITIAL
+    delay = HEALTH_CHECK_INTERVAL
+    while True:
+        try:
+            await asyncio.wait_for(health_check_requested.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+        health_check_requested.clear()
+        try:
+            # Verifies the existing pool, or reconnects with the stored credentials
+            pool = await connect_db()
+        except Exception as e:
+            logger.warning("Error in database health monitor: %s", _describe_error(e))
+            pool = None
+
+        if pool is not None:
+            backoff = RECONNECT_BACKOFF_INITIAL
+            delay = HEALTH_CHECK_INTERVAL
+            if change_listener is not None and change_listener.is_closed():
+                # Changes made while the listener was down were missed, so reload once
+                logger.warning("Hierarchy change listener disconnected, reconnecting")
+                await _start_change_listener()
+                if change_listener is not None:
+                    _on_hierarchy_change(change_listener, None, CHANGE_CHANNEL, "")
+            elif change_listener is None or not is_closure_enabled():
+                await _detect_hierarchy_changes()
+        else:
+            logger.warning("Database unavailable, retrying in %s seconds", backoff)
+            delay = backoff
+            backoff = min(backoff * 2, RECONNECT_BACKOFF_MAX)
+
+def start_health_monitor():
+    """
+    Starts the background health monitor task if it is not already running.
+    """
+    global health_monitor_task, health_check_requested
+    if health_monitor_task is None or health_monitor_task.done():
+        health_check_requested = asyncio.Event()
+        health_monitor_task = asyncio.create_task(_health_monitor())
+
+async def stop_health_monitor():
+    """
+    Stops the background health monitor task if it is running.
+    """
+    global health_monitor_task
+    if health_monitor_task is not None:
+        health_monitor_task.cancel()
+        try:
+            await health_monitor_task
+        except asyncio.CancelledError:
+            pass
+        health_monitor_task = None
+
+async def _on_connected():
+    """
+    Prepares the in-memory indexes and search backend after a (re)connection.
+    """
+    # Cached responses may come from a different database
+    clear_caches()
+    await _detect_closure_table()
+    await _load_hierarchy_index()
+    await _setup_search()
+    await _build_search_indexes()
+    await _start_change_listener()
+
+async def _setup_search():
+    """
+    Enables trigram search when pg_trgm is available, and starts creating any
+    missing trigram indexes in the background when SEARCH_MANAGE_TRIGRAM is set.
+    A failure is not fatal: searches then use ILIKE matching.
+    """
+    try:
+        await setup_trigram_search(db_pool)
+    except Exception as e:
+        logger.warning("Error setting up trigram search, falling back to ILIKE search: %s", e)
+
+async def _build_search_indexes():
+    """
+    Builds the in-memory search indexes.
+    A failure is not fatal: searches are then answered by the database.
+    """
+    try:
+        await rebuild_search_indexes(db_pool)
+    except Exception as e:
+        clear_search_indexes()
+        logger.warning("Error building search indexes, falling back to database queries: %s", e)
+
+async def _detect_closure_table():
+    """
+    Enables structure_closure lookups when the table is present.
+    A failure is not fatal: hierarchies are then walked with recursive queries.
+    """
+    try:
+        await detect_closure_table(db_pool)
+    except Exception as e:
+        disable_closure()
+        logger.warning("Error detecting structure_closure, using recursive hierarchy queries: %s", e)
+
+async def _detect_hierarchy_changes():
+    """
+    Picks up a structure_closure built after the connection was made. Once
+    structure_parents announces its changes, starts listening for them and
+    reloads the hierarchy index once, as changes made until then were missed.
+    """
+    await _detect_closure_table()
+    if change_listener is None:
+        await _start_change_listener()
+        if change_listener is not None:
+            _on_hierarchy_change(change_listener, None, CHANGE_CHANNEL, "")
+
+async def _load_hierarchy_index():
+    """
+    Loads the in-memory hierarchy index after a (re)connection.
+    A failure is not fatal: brain structure hierarchies are then queried from the database.
+    """
+    try:
+        await load_hierarchy_index(db_pool)
+    except Exception as e:
+        clear_hierarchy_index()
+        logger.warning("Error loading hierarchy index, falling back to database queries: %s", e)
+
+async def _start_change_listener():
+    """
+    Reloads the hierarchy index whenever structure_parents changes, if the table
+    announces its changes (see python -m app.closure build). A failure is not
+    fatal: the index is then only reloaded on request.
+    """
+    global change_listener
+    await stop_change_listener()
+    try:
+        if not await detect_change_notifications(db_pool):
+            return
+        change_listener = await asyncpg.connect(_database_url())
+        await change_listener.add_listener(CHANGE_CHANNEL, _on_hierarchy_change)
+        logger.info("Listening for hierarchy changes")
+    except Exception as e:
+        logger.warning("Error listening for hierarchy changes: %s", _describe_error(e))
+        await stop_change_listener()
+
+def _database_url() -> str:
+    """
+    Builds the connection URL from the stored connection parameters. The username
+    and password are URL encoded to handle special characters.
+    """
+    encoded_username = urllib.parse.quote_plus(connection_params["username"])
+    encoded_password = urllib.parse.quote_plus(connection_params["password"])
+    return (f"postgresql://{encoded_username}:{encoded_password}@"
+            f"{connection_params['host']}:{connection_params['port']}/{connection_params['database']}")
+
+def _on_hierarchy_change(connection, pid, channel, payload):
+    """
+    Schedules a reload of the hierarchy index after structure_parents has changed.
+    Changes that arrive while a reload is waiting or running cause one more reload.
+    """
+    global hierarchy_reload_task, hierarchy_reload_pending
+    hierarchy_reload_pending = True
+    if hierarchy_reload_task is None or hierarchy_reload_task.done():
+        hierarchy_reload_task = asyncio.get_running_loop().create_task(_reload_hierarchy_index())
+
+async def _reload_hierarchy_index():
+    global hierarchy_reload_pending
+    while hierarchy_reload_pending:
+        # Let a burst of changes settle, so it causes a single reload
+        await asyncio.sleep(config.HIERARCHY_RELOAD_DELAY)
+        hierarchy_reload_pending = False
+        # The change may have been structure_closure being rebuilt or dropped
+        await _detect_closure_table()
+        try:
+            await load_hierarchy_index(db_pool)
+            # Cached details were built from the previous index
+            clear_caches()
+        except Exception as e:
+            logger.warning("Error reloading hierarchy index after a change: %s", e)
+
+async def stop_change_listener():
+    """
+    Stops listening for hierarchy changes and cancels a pending reload.
+    """
+    global change_listener, hierarchy_reload_task, hierarchy_reload_pending
+    hierarchy_reload_pending = False
+    if hierarchy_reload_task is not None:
+        hierarchy_reload_task.cancel()
+        try:
+            await hierarchy_reload_task
+        except asyncio.CancelledError:
+            pass
+        hierarchy_reload_task = None
+    if change_listener is not None:
+        try:
+            await change_listener.close()
+        except Exception:
+            change_listener.terminate()
+        change_listener = None
+
 async def close_db():
     """
     Closes the database connection pool if it exists.
     This function should be called during the application shutdown.
     """
-    global db_pool, is_connected, connection_params
+    global db_pool, is_connected, connection_params, pool_settings
+    await stop_health_monitor()
+    await stop_trigram_index_task()
+    await stop_change_listener()
     if db_pool:
         await db_pool.close()
         db_pool = None
+    clear_hierarchy_index()
+    clear_search_indexes()
+    disable_closure()
 
     # Reset connection status and parameters
     is_connected = False
@@ -142,3 +508,4 @@ async def close_db():
         "password": None,
         "database": None
     }
+    pool_settings = dict(config.POOL_SETTINGS)
@@ -0,0 +1,578 @@
+from typing import NamedTuple
+import asyncpg
+import logging
+from .closure import is_closure_enabled, disable_closure
+from .metrics import track_query
+
+logger = logging.getLogger(__name__)
+
+class HierarchyWindow(NamedTuple):
+    """
+    Limits the transitive part of a hierarchy response.
+
+    Entries of each direction are ordered by depth, name and ID. The window
+    skips the first ancestors_offset ancestors and descendants_offset
+    descendants, and returns at most limit entries of each. When direction is
+    "ancestors" or "descendants", the other direction is left out entirely.
+    """
+
+    max_depth: int = None
+    limit: int = None
+    ancestors_offset: int = 0
+    descendants_offset: int = 0
+    direction: str = None
+
+    def includes(self, direction: str) -> bool:
+        """
+        Returns whether the window covers a direction ("ancestors" or "descendants").
+        """
+        return self.direction is None or self.direction == direction
+
+    def page(self, entries: list):
+        """
+        Cuts one direction's page out of its entries.
+
+        Args:
+            entries (list): The entries from the direction's offset onwards. At least
+                limit + 1 are needed to tell whether another page follows.
+
+        Returns:
+            tuple: The entries of the page and whether more entries follow.
+        """
+        if self.limit is None or len(entries) <= self.limit:
+            return entries, False
+        return entries[:self.limit], True
+
+    def paginate(self, ancestors: list, descendants: list) -> dict:
+        """
+        Builds the hierarchy dictionary for this window.
+
+        Args:
+            ancestors (list): The ancestors from ancestors_offset onwards.
+            descendants (list): The descendants from descendants_offset onwards.
+
+        Returns:
+            dict: The "ancestors" and "descendants" pages and the "next_cursor"
+                  for the following page, which is None on the last page.
+        """
+        ancestors, more_ancestors = self.page(ancestors)
+        descendants, more_descendants = self.page(descendants)
+        next_cursor = None
+        if more_ancestors or more_descendants:
+            next_cursor = f"{self.ancestors_offset + len(ancestors)}.{self.descendants_offset + len(descendants)}"
+        return {"ancestors": ancestors, "descendants": descendants, "next_cursor": next_cursor}
+
+# The unrestricted window: every ancestor and descendant at any depth
+FULL_HIERARCHY = HierarchyWindow()
+
+def parse_hierarchy_window(max_depth: int = None, limit: int = None, cursor: str = None,
+                           direction: str = None) -> HierarchyWindow:
+    """
+    Builds a HierarchyWindow from request parameters.
+
+    Args:
+        max_depth (int, optional): Only include structures up to this many levels away.
+        limit (int, optional): The maximum number of ancestors and of descendants per page.
+        cursor (str, optional): The next_cursor of the previous page.
+        direction (str, optional): "ancestors" or "descendants" to return only that direction.
+
+    Returns:
+        HierarchyWindow: The window to apply.
+
+    Raises:
+        ValueError: If a parameter is out of range or the cursor is malformed.
+    """
+    if max_depth is not None and max_depth < 1:
+        raise ValueError("max_depth must be at least 1")
+    if limit is not None and limit < 1:
+        raise ValueError("limit must be at least 1")
+    if direction is not None and direction not in ("ancestors", "descendants"):
+        raise ValueError("direction must be ancestors or descendants")
+    ancestors_offset = descendants_offset = 0
+    if cursor:
+        try:
+            ancestors_offset, descendants_offset = (int(part) for part in cursor.split("."))
+        except ValueError:
+            raise ValueError(f"Invalid cursor: {cursor}")
+        if ancestors_offset < 0 or descendants_offset < 0:
+            raise ValueError(f"Invalid cursor: {cursor}")
+    return HierarchyWindow(max_depth, limit, ancestors_offset, descendants_offset, direction)
+
+# Orders each direction of a closure(direction, id, depth) relation by depth,
+# name and ID, and selects a page of it: $4/$5 are the ancestor/descendant
+# offsets and $6 the limit, plus one row to tell whether another page follows.
+# Names are compared by code point (COLLATE "C"), as the in-memory hierarchy
+# index does, so a cursor from one can be continued by the other.
+_PAGE_SQL = """
+    ranked AS (
+        SELECT c.direction, bs.id, bs.standard_name, c.depth,
+               row_number() OVER (
+                   PARTITION BY c.direction ORDER BY c.depth, bs.standard_name COLLATE "C", bs.id
+               ) - 1 AS position
+        FROM closure c
+        JOIN brain_structures bs ON bs.id = c.id
+    )
+    SELECT direction, id, standard_name, depth
+    FROM (
+        SELECT r.*, CASE r.direction WHEN 'ancestor' THEN $4::int ELSE $5::int END AS page_offset
+        FROM ranked r
+    ) paged
+    WHERE position >= page_offset
+      AND ($6::int IS NULL OR position <= page_offset + $6)
+    ORDER BY direction, position
+    """
+
+# Both directions are walked in one statement, breadth-first. Each row of a
+# walk is one whole level: the structures first reached at that depth, and
+# every structure seen so far, which are not expanded again. Every structure
+# is therefore visited once, at its shortest depth, even when it can be reached
+# over many paths or the hierarchy model contains a cycle. $3 stops the walk at
+# a maximum depth, and $7 restricts it to "ancestors" or "descendants".
+HIERARCHY_QUERY = """
+    WITH RECURSIVE ancestors(depth, ids, seen) AS (
+        SELECT 0, ARRAY[$1::int], ARRAY[$1::int]
+        WHERE $7::text IS NULL OR $7::text = 'ancestors'
+        UNION ALL
+        SELECT a.depth + 1, level.ids, a.seen || level.ids
+        FROM ancestors a
+        CROSS JOIN LATERAL (
+            SELECT array_agg(n.id) AS ids
+            FROM (
+                SELECT sr.parent_id AS id
+                FROM structure_parents sr
+                WHERE sr.child_id = ANY(a.ids)
+                  AND ($2::text IS NULL OR sr.hierarchy_model_name = $2)
+                EXCEPT
+                SELECT unnest(a.seen)
+            ) n
+        ) level
+        WHERE level.ids IS NOT NULL
+          AND ($3::int IS NULL OR a.depth < $3)
+    ),
+    descendants(depth, ids, seen) AS (
+        SELECT 0, ARRAY[$1::int], ARRAY[$1::int]
+        WHERE $7::text IS NULL OR $7::text = 'descendants'
+        UNION ALL
+        SELECT d.depth + 1, level.ids, d.seen || level.ids
+        FROM descendants d
+        CROSS JOIN LATERAL (
+            SELECT array_agg(n.id) AS ids
+            FROM (
+                SELECT sr.child_id AS id
+                FROM structure_parents sr
+                WHERE sr.parent_id = ANY(d.ids)
+                  AND ($2::text IS NULL OR sr.hierarchy_model_name = $2)
+                EXCEPT
+                SELECT unnest(d.seen)
+            ) n
+        ) level
+        WHERE level.ids IS NOT NULL
+          AND ($3::int IS NULL OR d.depth < $3)
+    ),
+    closure(direction, id, depth) AS (
+        SELECT 'ancestor', unnest(ids), depth FROM ancestors WHERE depth > 0
+        UNION ALL
+        SELECT 'descendant', unnest(ids), depth FROM descendants WHERE depth > 0
+    ),
+    """ + _PAGE_SQL
+
+# The same lookup against structure_closure, where each direction is a single
+# indexed range scan. Requires a hierarchy model.
+CLOSURE_HIERARCHY_QUERY = """
+    WITH closure(direction, id, depth) AS (
+        SELECT 'ancestor', ancestor_id, depth
+        FROM structure_closure
+        WHERE hierarchy_model_name = $2 AND descendant_id = $1
+          AND ($3::int IS NULL OR depth <= $3)
+          AND ($7::text IS NULL OR $7::text = 'ancestors')
+        UNION ALL
+        SELECT 'descendant', descendant_id, depth
+        FROM structure_closure
+        WHERE hierarchy_model_name = $2 AND ancestor_id = $1
+          AND ($3::int IS NULL OR depth <= $3)
+          AND ($7::text IS NULL OR $7::text = 'descendants')
+    ),
+""" + _PAGE_SQL
+
+async def _fetch_with_closure(conn, name: str, use_closure: bool, closure_query: str, recursive_query: str,
+                              *args):
+    """
+    Runs closure_query when use_closure is set and structure_closure is in use,
+    and recursive_query otherwise or if the closure table has gone away.
+    The query metrics record them as name_closure and name respectively.
+    """
+    if use_closure and is_closure_enabled():
+        try:
+            with track_query(f"{name}_closure"):
+                return await conn.fetch(closure_query, *args)
+        except (asyncpg.exceptions.UndefinedTableError, asyncpg.exceptions.UndefinedFunctionError) as e:
+            logger.warning("structure_closure is not available, using recursive hierarchy queries: %s", e)
+            disable_closure()
+    with track_query(name):
+        return await conn.fetch(recursive_query, *args)
+
+async def fetch_hierarchy(conn, structure_id: int, hierarchy_model: str = None,
+                          window: HierarchyWindow = FULL_HIERARCHY):
+    """
+    Fetches the ancestors and descendants of a brain structure in one query.
+
+    Args:
+        conn (asyncpg.Connection): The connection to run the query on.
+        structure_id (int): The ID of the brain structure.
+        hierarchy_model (str, optional): The hierarchy model to follow. When omitted,
+            edges from every hierarchy model are followed.
+        window (HierarchyWindow, optional): The depth limit and page to return.
+            Defaults to every ancestor and descendant.
+
+    Returns:
+        dict: A dictionary with "ancestors" and "descendants" lists, each ordered by
+              depth (nearest first) and containing structure IDs, names and depths,
+              and the "next_cursor" of the following page.
+    """
+    rows = await _fetch_with_closure(
+        # The closure table is kept per hierarchy model
+        conn, "hierarchy", hierarchy_model is not None, CLOSURE_HIERARCHY_QUERY, HIERARCHY_QUERY,
+        structure_id, hierarchy_model, window.max_depth,
+        window.ancestors_offset, window.descendants_offset, window.limit, window.direction
+    )
+
+    hierarchy = {"ancestors": [], "descendants": []}
+    for r in rows:
+        key = "ancestors" if r["direction"] == "ancestor" else "descendants"
+        hierarchy[key].append({"structure_id": r["id"], "name": r["standard_name"], "depth": r["depth"]})
+    return window.paginate(hierarchy["ancestors"], hierarchy["descendants"])
+
+# Direct children of a structure with their child and descendant counts. The
+# hierarchy model defaults to the first one (by name) that contains the
+# structure. The walk collects the structures below each child with UNION, which
+# drops (child, structure) pairs that were already reached, so every structure
+# is expanded once per child however many paths lead to it, and cycles end the
+# walk. The target structure is always returned as one row (with NULL child
+# columns when it has no children), so a missing structure can be told apart
+# from a leaf.
+CHILDREN_QUERY = """
+    WITH RECURSIVE model(name) AS (
+        SELECT COALESCE($2::text, (
+            SELECT MIN(hierarchy_model_name COLLATE "C")
+            FROM structure_parents
+            WHERE child_id = $1 OR parent_id = $1
+        ))
+    ),
+    walk(root, id) AS (
+        SELECT sr.child_id, sr.child_id
+        FROM structure_parents sr
+        WHERE sr.parent_id = $1
+          AND sr.hierarchy_model_name = (SELECT name FROM model)
+          AND sr.parent_id <> sr.child_id
+        UNION
+        SELECT w.root, sr.child_id
+        FROM walk w
+        JOIN structure_parents sr ON sr.parent_id = w.id
+        WHERE sr.hierarchy_model_name = (SELECT name FROM model)
+    ),
+    counts AS (
+        SELECT w.root,
+               (
+                   SELECT COUNT(*) FROM structure_parents sr
+                   WHERE sr.parent_id = w.root
+                     AND sr.child_id <> w.root
+                     AND sr.hierarchy_model_name = (SELECT name FROM model)
+               ) AS child_count,
+               COUNT(*) - 1 AS descendant_count
+        FROM walk w
+        GROUP BY w.root
+    )
+    SELECT (SELECT name FROM model) AS hierarchy_model,
+           bs.id, bs.standard_name, c.child_count, c.descendant_count
+    FROM brain_structures t
+    LEFT JOIN counts c ON true
+    LEFT JOIN brain_structures bs ON bs.id = c.root
+    WHERE t.id = $1
+    ORDER BY bs.standard_name COLLATE "C", bs.id
+    """
+
+# CHILDREN_QUERY with descendant counts read from structure_closure
+CLOSURE_CHILDREN_QUERY = """
+    WITH model(name) AS (
+        SELECT COALESCE($2::text, (
+            SELECT MIN(hierarchy_model_name COLLATE "C")
+            FROM structure_parents
+            WHERE child_id = $1 OR parent_id = $1
+        ))
+    ),
+    kids AS (
+        SELECT DISTINCT sr.child_id AS id
+        FROM structure_parents sr
+        WHERE sr.parent_id = $1
+          AND sr.child_id <> $1
+          AND sr.hierarchy_model_name = (SELECT name FROM model)
+    )
+    SELECT (SELECT name FROM model) AS hierarchy_model,
+           bs.id, bs.standard_name,
+           (
+               SELECT COUNT(*) FROM structure_closure sc
+               WHERE sc.hierarchy_model_name = (SELECT name FROM model)
+                 AND sc.ancestor_id = k.id AND sc.depth = 1
+           ) AS child_count,
+           (
+               SELECT COUNT(*) FROM structure_closure sc
+               WHERE sc.hierarchy_model_name = (SELECT name FROM model)
+                 AND sc.ancestor_id = k.id
+           ) AS descendant_count
+    FROM brain_structures t
+    LEFT JOIN kids k ON true
+    LEFT JOIN brain_structures bs ON bs.id = k.id
+    WHERE t.id = $1
+    ORDER BY bs.standard_name COLLATE "C", bs.id
+    """
+
+def child_entry(structure_id: int, name: str, child_count: int, descendant_count: int) -> dict:
+    """
+    Builds one entry of a children response.
+    """
+    return {
+        "structure_id": structure_id,
+        "name": name,
+        "has_children": child_count > 0,
+        "child_count": child_count,
+        "descendant_count": descendant_count
+    }
+
+async def fetch_children(conn, structure_id: int, hierarchy_model: str = None):
+    """
+    Fetches the direct children of a brain structure with their descendant counts in one query.
+
+    Args:
+        conn (asyncpg.Connection): The connection to run the query on.
+        structure_id (int): The ID of the brain structure.
+        hierarchy_model (str, optional): The hierarchy model to follow. Defaults to the
+            first hierarchy model that contains the structure.
+
+    Returns:
+        dict: The "current_hierarchy_model" and the "children", ordered by name, each with
+              has_children, child_count and descendant_count.
+        None: If the structure is not found.
+    """
+    # The default model is resolved inside the query, so the closure table can always be used
+    rows = await _fetch_with_closure(
+        conn, "hierarchy_children", True, CLOSURE_CHILDREN_QUERY, CHILDREN_QUERY, structure_id, hierarchy_model
+    )
+    if not rows:
+        return None
+    return {
+        "current_hierarchy_model": rows[0]["hierarchy_model"],
+        "children": [
+            child_entry(r["id"], r["standard_name"], r["child_count"], r["descendant_count"])
+            for r in rows if r["id"] is not None
+        ]
+    }
+
+# Which of the candidate structures ($3) lie below a structure. The hierarchy
+# model defaults as in CHILDREN_QUERY, and the target structure is always
+# returned as one row, so a missing structure can be told apart from an empty
+# result.
+SUBTREE_QUERY = """
+    WITH RECURSIVE model(name) AS (
+        SELECT COALESCE($2::text, (
+            SELECT MIN(hierarchy_model_name COLLATE "C")
+            FROM structure_parents
+            WHERE child_id = $1 OR parent_id = $1
+        ))
+    ),
+    descendants(id) AS (
+        SELECT sr.child_id
+        FROM structure_parents sr
+        WHERE sr.parent_id = $1
+          AND sr.hierarchy_model_name = (SELECT name FROM model)
+          AND sr.child_id <> $1
+        UNION
+        SELECT sr.child_id
+        FROM descendants d
+        JOIN structure_parents sr ON sr.parent_id = d.id
+        WHERE sr.hierarchy_model_name = (SELECT name FROM model)
+          AND sr.child_id <> $1
+    )
+    SELECT (SELECT name FROM model) AS hierarchy_model, m.id
+    FROM brain_structures t
+    LEFT JOIN (
+        SELECT id FROM descendants WHERE id = ANY($3::int[])
+    ) m ON true
+    WHERE t.id = $1
+    """
+
+# SUBTREE_QUERY against structure_closure
+CLOSURE_SUBTREE_QUERY = """
+    WITH model(name) AS (
+        SELECT COALESCE($2::text, (
+            SELECT MIN(hierarchy_model_name COLLATE "C")
+            FROM structure_parents
+            WHERE child_id = $1 OR parent_id = $1
+        ))
+    )
+    SELECT (SELECT name FROM model) AS hierarchy_model, m.id
+    FROM brain_structures t
+    LEFT JOIN (
+        SELECT descendant_id AS id
+        FROM structure_closure
+        WHERE hierarchy_model_name = (SELECT name FROM model)
+          AND ancestor_id = $1
+          AND descendant_id = ANY($3::int[])
+    ) m ON true
+    WHERE t.id = $1
+    """
+
+async def fetch_subtree_members(conn, structure_id: int, candidate_ids: list, hierarchy_model: str = None):
+    """
+    Picks the structures that lie below a brain structure.
+
+    Args:
+        conn (asyncpg.Connection): The connection to run the query on.
+        structure_id (int): The ID of the brain structure whose subtree is tested.
+        candidate_ids (list): The IDs of the structures to test.
+        hierarchy_model (str, optional): The hierarchy model to follow. Defaults to the
+            first hierarchy model that contains the structure.
+
+    Returns:
+        dict: The "current_hierarchy_model" and the "contained" candidate IDs, in the
+              order they were given.
+        None: If the structure is not found.
+    """
+    rows = await _fetch_with_closure(
+        conn, "hierarchy_subtree", True, CLOSURE_SUBTREE_QUERY, SUBTREE_QUERY,
+        structure_id, hierarchy_model, list(candidate_ids)
+    )
+    if not rows:
+        return None
+    found = {r["id"] for r in rows}
+    return {
+        "current_hierarchy_model": rows[0]["hierarchy_model"],
+        "contained": [candidate_id for candidate_id in dict.fromkeys(candidate_ids) if candidate_id in found]
+    }
+
+# The part of a hierarchy model above two structures ($1 and $2): every
+# structure on the way up from either of them, with its parents (one row per
+# parent). The hierarchy model defaults to the first one (by name) that
+# contains both. The walk collects edges with UNION, so each edge is followed
+# once however many paths lead to it. The rows of $1 and $2 also report
+# whether they are in any hierarchy model and in the one used.
+ANCESTOR_GRAPH_QUERY = """
+    WITH RECURSIVE model(name) AS (
+        SELECT COALESCE($3::text, (
+            SELECT MIN(shared.name COLLATE "C")
+            FROM (
+                SELECT hierarchy_model_name AS name FROM structure_parents
+                WHERE child_id = $1 OR parent_id = $1
+                INTERSECT
+                SELECT hierarchy_model_name FROM structure_parents
+                WHERE child_id = $2 OR parent_id = $2
+            ) shared
+        ))
+    ),
+    up(parent_id, child_id) AS (
+        SELECT sr.parent_id, sr.child_id
+        FROM structure_parents sr
+        WHERE sr.child_id IN ($1, $2)
+          AND sr.hierarchy_model_name = (SELECT name FROM model)
+        UNION
+        SELECT sr.parent_id, sr.child_id
+        FROM up u
+        JOIN structure_parents sr ON sr.child_id = u.parent_id
+        WHERE sr.hierarchy_model_name = (SELECT name FROM model)
+    )
+    SELECT (SELECT name FROM model) AS hierarchy_model, bs.id, bs.standard_name, u.parent_id,
+           CASE WHEN bs.id IN ($1, $2) THEN EXISTS (
+               SELECT 1 FROM structure_parents sr WHERE sr.child_id = bs.id OR sr.parent_id = bs.id
+           ) END AS in_hierarchy,
+           CASE WHEN bs.id IN ($1, $2) THEN EXISTS (
+               SELECT 1 FROM structure_parents sr
+               WHERE (sr.child_id = bs.id OR sr.parent_id = bs.id)
+                 AND sr.hierarchy_model_name = (SELECT name FROM model)
+           ) END AS in_model
+    FROM brain_structures bs
+    LEFT JOIN up u ON u.child_id = bs.id
+    WHERE bs.id IN ($1, $2) OR bs.id IN (SELECT parent_id FROM up)
+    """
+
+# ANCESTOR_GRAPH_QUERY with the structures above $1 and $2 read from
+# structure_closure, so only their parent edges are looked up
+CLOSURE_ANCESTOR_GRAPH_QUERY = """
+    WITH model(name) AS (
+        SELECT COALESCE($3::text, (
+            SELECT MIN(shared.name COLLATE "C")
+            FROM (
+                SELECT hierarchy_model_name AS name FROM structure_parents
+                WHERE child_id = $1 OR parent_id = $1
+                INTERSECT
+                SELECT hierarchy_model_name FROM structure_parents
+                WHERE child_id = $2 OR parent_id = $2
+            ) shared
+        ))
+    ),
+    nodes(id) AS (
+        SELECT $1::int
+        UNION
+        SELECT $2::int
+        UNION
+        SELECT ancestor_id
+        FROM structure_closure
+        WHERE hierarchy_model_name = (SELECT name FROM model)
+          AND descendant_id IN ($1, $2)
+    ),
+    up(parent_id, child_id) AS (
+        SELECT sr.parent_id, sr.child_id
+        FROM structure_parents sr
+        WHERE sr.child_id IN (SELECT id FROM nodes)
+          AND sr.hierarchy_model_name = (SELECT name FROM model)
+    )
+    SELECT (SELECT name FROM model) AS hierarchy_model, bs.id, bs.standard_name, u.parent_id,
+           CASE WHEN bs.id IN ($1, $2) THEN EXISTS (
+               SELECT 1 FROM structure_parents sr WHERE sr.child_id = bs.id OR sr.parent_id = bs.id
+           ) END AS in_hierarchy,
+           CASE WHEN bs.id IN ($1, $2) THEN EXISTS (
+               SELECT 1 FROM structure_parents sr
+               WHERE (sr.child_id = bs.id OR sr.parent_id = bs.id)
+                 AND sr.hierarchy_model_name = (SELECT name FROM model)
+           ) END AS in_model
+    FROM brain_structures bs
+    LEFT JOIN up u ON u.child_id = bs.id
+    WHERE bs.id IN ($1, $2) OR bs.id IN (SELECT parent_id FROM up)
+    """
+
+async def fetch_ancestor_graph(conn, a_id: int, b_id: int, hierarchy_model: str = None):
+    """
+    Fetches the part of a hierarchy model above two brain structures, for finding
+    their common ancestor without the hierarchy index.
+
+    Args:
+        conn (asyncpg.Connection): The connection to run the query on.
+        a_id (int): The ID of the first brain structure.
+        b_id (int): The ID of the second brain structure.
+        hierarchy_model (str, optional): The hierarchy model to follow. Defaults to the
+            first hierarchy model that contains both structures.
+
+    Returns:
+        dict: The "hierarchy_model" (None if the structures share none), the "names" of
+              both structures and of everything above them by ID, the (parent_id,
+              child_id) "edges" between them, and whether both structures are
+              "members" of the hierarchy model.
+        None: If either structure is in no hierarchy model.
+    """
+    rows = await _fetch_with_closure(
+        conn, "hierarchy_ancestor_graph", True, CLOSURE_ANCESTOR_GRAPH_QUERY, ANCESTOR_GRAPH_QUERY,
+        a_id, b_id, hierarchy_model
+    )
+    names, edges, membership = {}, [], {}
+    for r in rows:
+        names[r["id"]] = r["standard_name"]
+        if r["parent_id"] is not None:
+            edges.append((r["parent_id"], r["id"]))
+        if r["in_hierarchy"] is not None:
+            membership[r["id"]] = (r["in_hierarchy"], r["in_model"])
+    if not all(membership.get(structure_id, (False,))[0] for structure_id in (a_id, b_id)):
+        return None
+    return {
+        "hierarchy_model": rows[0]["hierarchy_model"],
+        "names": names,
+        "edges": edges,
+        "members": membership[a_id][1] and membership[b_id][1]
+    }
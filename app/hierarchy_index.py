@@ -0,0 +1,692 @@
+import asyncio
+import logging
+from array import array
+from bisect import bisect_right
+from .hierarchy import FULL_HIERARCHY, child_entry, fetch_ancestor_graph
+from .metrics import acquire, track_query
+
+logger = logging.getLogger(__name__)
+
+# The index that is currently in use. It is replaced as a whole on reload so
+# readers never observe a half-built index.
+current_index = None
+
+# Serializes loads so concurrent reloads do not read structure_parents twice.
+# Created on first use so it belongs to the running event loop.
+_load_lock = None
+
+class IntervalLabeling:
+    """
+    Interval labels of one hierarchy model, for ancestry tests without walking the hierarchy.
+
+    Strongly connected components (i.e. cycles) are collapsed and numbered in
+    DFS postorder, so every component is numbered after everything below it.
+    The label of a component is the sorted set of number ranges that covers
+    itself and every component reachable from it. In a forest each label is a
+    single range, as in a nested set; a structure with several parents adds the
+    ranges of its other subtrees to the labels of its ancestors.
+    """
+
+    __slots__ = ("component", "cyclic", "interval_offsets", "interval_starts", "interval_ends", "size_prefix")
+
+    def __init__(self, graph, node_count: int):
+        self.component, members = _strongly_connected_components(graph, node_count)
+        self.cyclic = bytearray(1 if len(nodes) > 1 else 0 for nodes in members)
+
+        self.size_prefix = array("l", [0])
+        for nodes in members:
+            self.size_prefix.append(self.size_prefix[-1] + len(nodes))
+
+        self.interval_offsets = array("l", [0])
+        self.interval_starts = array("l")
+        self.interval_ends = array("l")
+        for number, nodes in enumerate(members):
+            # Components below this one are numbered lower and already labelled
+            ranges = [(number, number)]
+            for node in nodes:
+                for child in graph.children(node):
+                    below = self.component[child]
+                    if below != number:
+                        ranges.extend(self.intervals(below))
+            ranges.sort()
+            merged_start, merged_end = ranges[0]
+            for start, end in ranges[1:]:
+                if start <= merged_end + 1:
+                    merged_end = max(merged_end, end)
+                else:
+                    self.interval_starts.append(merged_start)
+                    self.interval_ends.append(merged_end)
+                    merged_start, merged_end = start, end
+            self.interval_starts.append(merged_start)
+            self.interval_ends.append(merged_end)
+            self.interval_offsets.append(len(self.interval_starts))
+
+    def intervals(self, component: int) -> list:
+        """
+        Returns the (start, end) component number ranges of a component's label.
+        """
+        first, last = self.interval_offsets[component], self.interval_offsets[component + 1]
+        return list(zip(self.interval_starts[first:last], self.interval_ends[first:last]))
+
+    def is_descendant(self, node: int, ancestor: int) -> bool:
+        """
+        Returns whether node is below ancestor. A node is never its own
+        descendant, not even through a cycle or a self-loop.
+        """
+        if node == ancestor:
+            return False
+        component, ancestor_component = self.component[node], self.component[ancestor]
+        if component < 0 or ancestor_component < 0:
+            return False
+        if component == ancestor_component:
+            return bool(self.cyclic[component])
+        first, last = self.interval_offsets[ancestor_component], self.interval_offsets[ancestor_component + 1]
+        position = bisect_right(self.interval_starts, component, first, last) - 1
+        return position >= first and component <= self.interval_ends[position]
+
+    def descendant_count(self, node: int) -> int:
+        """
+        Returns the number of distinct structures below node.
+        """
+        component = self.component[node]
+        if component < 0:
+            return 0
+        first, last = self.interval_offsets[component], self.interval_offsets[component + 1]
+        total = sum(
+            self.size_prefix[self.interval_ends[i] + 1] - self.size_prefix[self.interval_starts[i]]
+            for i in range(first, last)
+        )
+        # The node itself is covered by its own component's range
+        return total - 1
+
+class BinaryLifting:
+    """
+    Ancestor jump table of a forest-shaped hierarchy model (no structure with
+    several parents, no cycles), for lowest common ancestor queries in
+    logarithmic time.
+
+    up[k][node] is the ancestor 2**k levels above node; roots point to themselves.
+    """
+
+    __slots__ = ("depth", "up")
+
+    def __init__(self, graph, node_count: int):
+        parent = array("l", range(node_count))
+        for node in range(node_count):
+            parents = graph.parents(node)
+            if parents:
+                parent[node] = parents[0]
+
+        self.depth = array("l", [0]) * node_count
+        for root in range(node_count):
+            if parent[root] != root:
+                continue
+            stack = [root]
+            while stack:
+                node = stack.pop()
+                for child in graph.children(node):
+                    self.depth[child] = self.depth[node] + 1
+                    stack.append(child)
+
+        self.up = [parent]
+        max_depth = max(self.depth, default=0)
+        while (1 << len(self.up)) <= max_depth:
+            previous = self.up[-1]
+            self.up.append(array("l", (previous[previous[node]] for node in range(node_count))))
+
+    def lowest_common_ancestor(self, a: int, b: int):
+        """
+        Returns the lowest common ancestor of two nodes (a node counts as its own
+        ancestor), or None if they are in different trees.
+        """
+        if self.depth[a] < self.depth[b]:
+            a, b = b, a
+        difference, level = self.depth[a] - self.depth[b], 0
+        while difference:
+            if difference & 1:
+                a = self.up[level][a]
+            difference >>= 1
+            level += 1
+        if a == b:
+            return a
+        for jumps in reversed(self.up):
+            if jumps[a] != jumps[b]:
+                a, b = jumps[a], jumps[b]
+        parent = self.up[0]
+        return parent[a] if parent[a] == parent[b] else None
+
+def _strongly_connected_components(graph, node_count: int):
+    """
+    Finds the strongly connected components of a hierarchy model (Tarjan's algorithm, iteratively).
+
+    Components are numbered in the order they are completed, which puts every
+    component after all components reachable from it.
+
+    Returns:
+        tuple: The component number of every node (-1 for nodes outside the model)
+               and the member nodes of each component.
+    """
+    component = array("l", [-1]) * node_count
+    visit_index = array("l", [-1]) * node_count
+    low = array("l", [0]) * node_count
+    on_stack = bytearray(node_count)
+    stack = []
+    members = []
+    counter = 0
+
+    for root in range(node_count):
+        if visit_index[root] != -1 or not graph.has_node(root):
+            continue
+        visit_index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = 1
+        work = [(root, 0)]
+        while work:
+            node, next_child = work[-1]
+            children = graph.children(node)
+            if next_child < len(children):
+                work[-1] = (node, next_child + 1)
+                child = children[next_child]
+                if visit_index[child] == -1:
+                    visit_index[child] = low[child] = counter
+                    counter += 1
+                    stack.append(child)
+                    on_stack[child] = 1
+                    work.append((child, 0))
+                elif on_stack[child]:
+                    low[node] = min(low[node], visit_index[child])
+                continue
+
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                low[parent] = min(low[parent], low[node])
+            if low[node] == visit_index[node]:
+                nodes = []
+                while True:
+                    member = stack.pop()
+                    on_stack[member] = 0
+                    component[member] = len(members)
+                    nodes.append(member)
+                    if member == node:
+                        break
+                members.append(nodes)
+
+    return component, members
+
+class HierarchyGraph:
+    """
+    Parent/child adjacency of a single hierarchy model in CSR form.
+
+    Nodes are dense indexes into the owning HierarchyIndex. The children of node i
+    are children_targets[children_offsets[i]:children_offsets[i + 1]], and the
+    parents are stored the same way in the parents_* arrays. The labeling
+    answers ancestry tests, and the lifting table (for forests only) lowest
+    common ancestor queries.
+    """
+
+    __slots__ = ("children_offsets", "children_targets", "parents_offsets", "parents_targets",
+                 "self_loops", "labeling", "lifting")
+
+    def __init__(self, node_count: int, edges: list, rank: list):
+        self.children_offsets, self.children_targets = _build_csr(node_count, edges, rank)
+        self.parents_offsets, self.parents_targets = _build_csr(
+            node_count, [(child, parent) for parent, child in edges], rank
+        )
+        # Structures listed as their own child, which the children of a
+        # structure leave out as the database queries do
+        self.self_loops = bytearray(node_count)
+        for parent, child in edges:
+            if parent == child:
+                self.self_loops[parent] = 1
+        self.labeling = IntervalLabeling(self, node_count)
+        # Lowest common ancestors of forests come from a jump table; other
+        # models are searched breadth-first
+        is_forest = (
+            not any(self.labeling.cyclic)
+            and not any(self.self_loops)
+            and all(self.parents_offsets[node + 1] - self.parents_offsets[node] <= 1 for node in range(node_count))
+        )
+        self.lifting = BinaryLifting(self, node_count) if is_forest else None
+
+    def children(self, node: int):
+        return self.children_targets[self.children_offsets[node]:self.children_offsets[node + 1]]
+
+    def parents(self, node: int):
+        return self.parents_targets[self.parents_offsets[node]:self.parents_offsets[node + 1]]
+
+    def child_count(self, node: int) -> int:
+        """
+        Returns the number of children of node, not counting a self-loop.
+        """
+        return self.children_offsets[node + 1] - self.children_offsets[node] - self.self_loops[node]
+
+    def has_node(self, node: int) -> bool:
+        return (self.children_offsets[node] != self.children_offsets[node + 1]
+                or self.parents_offsets[node] != self.parents_offsets[node + 1])
+
+def _build_csr(node_count: int, edges: list, rank: list):
+    """
+    Builds CSR offset and target arrays from (source, target) pairs.
+
+    Targets of each source are ordered by rank, i.e. by structure name.
+    """
+    edges = sorted(edges, key=lambda e: (e[0], rank[e[1]]))
+    offsets = array("l", [0]) * (node_count + 1)
+    for source, _ in edges:
+        offsets[source + 1] += 1
+    for i in range(node_count):
+        offsets[i + 1] += offsets[i]
+    targets = array("l", [target for _, target in edges])
+    return offsets, targets
+
+class HierarchyIndex:
+    """
+    In-memory copy of structure_parents, keyed by hierarchy_model_name.
+
+    Answers the hierarchy parts of a brain structure detail request (parents,
+    children, transitive ancestors/descendants and available hierarchy models)
+    without querying the database.
+    """
+
+    def __init__(self, names: dict, edges: list):
+        """
+        Args:
+            names (dict): Mapping of structure ID to standard name.
+            edges (list): (hierarchy_model_name, parent_id, child_id) tuples.
+        """
+        self.structure_ids = array("q", sorted(names))
+        self.positions = {structure_id: i for i, structure_id in enumerate(self.structure_ids)}
+        self.names = [names[structure_id] for structure_id in self.structure_ids]
+
+        # Rank of every node when ordered by name, used to keep adjacency lists
+        # and traversal levels in a stable, readable order.
+        order = sorted(range(len(self.names)), key=lambda i: (self.names[i] or "", self.structure_ids[i]))
+        self.rank = [0] * len(order)
+        for position, node in enumerate(order):
+            self.rank[node] = position
+
+        edges_by_model = {}
+        for model, parent_id, child_id in edges:
+            if model is None or parent_id not in self.positions or child_id not in self.positions:
+                continue
+            edges_by_model.setdefault(model, set()).add((self.positions[parent_id], self.positions[child_id]))
+
+        self.graphs = {
+            model: HierarchyGraph(len(self.structure_ids), list(model_edges), self.rank)
+            for model, model_edges in edges_by_model.items()
+        }
+        self.model_names = sorted(self.graphs)
+
+    def _entry(self, node: int) -> dict:
+        return {"structure_id": self.structure_ids[node], "name": self.names[node]}
+
+    def _walk(self, graph: HierarchyGraph, start: int, upwards: bool, max_depth: int = None) -> list:
+        """
+        Breadth-first walk from start, returning (node, depth) pairs.
+
+        Each node is reported once at its shortest depth, which also guards
+        against cycles in the hierarchy. The walk stops after max_depth levels.
+        """
+        neighbours = graph.parents if upwards else graph.children
+        seen = bytearray(len(self.structure_ids))
+        seen[start] = 1
+        frontier = [start]
+        depth = 0
+        visited = []
+        while frontier and (max_depth is None or depth < max_depth):
+            depth += 1
+            next_frontier = []
+            for node in frontier:
+                for neighbour in neighbours(node):
+                    if not seen[neighbour]:
+                        seen[neighbour] = 1
+                        next_frontier.append(neighbour)
+            next_frontier.sort(key=self.rank.__getitem__)
+            visited.extend((node, depth) for node in next_frontier)
+            frontier = next_frontier
+        return visited
+
+    def models_for(self, structure_id: int) -> list:
+        """
+        Returns the names of the hierarchy models that contain the structure.
+        """
+        node = self.positions.get(structure_id)
+        if node is None:
+            return []
+        return [model for model in self.model_names if self.graphs[model].has_node(node)]
+
+    def _page(self, walk: list, offset: int, window) -> list:
+        """
+        Returns the entries of a walk from offset onwards, plus one beyond the page limit.
+        """
+        end = None if window.limit is None else offset + window.limit + 1
+        return [{**self._entry(node), "depth": depth} for node, depth in walk[offset:end]]
+
+    def describe(self, structure_id: int, hierarchy_model: str = None, fields=None,
+                 window=FULL_HIERARCHY) -> dict:
+        """
+        Builds the hierarchy section of a brain structure detail response.
+
+        Args:
+            structure_id (int): The ID of the brain structure.
+            hierarchy_model (str, optional): The hierarchy model to use. Defaults to the
+                first model that contains the structure.
+            fields (collection, optional): The requested detail fields. The parents,
+                children and hierarchy sections are left empty when not requested.
+            window (HierarchyWindow, optional): The depth limit and page of the
+                hierarchy section. Defaults to every ancestor and descendant.
+
+        Returns:
+            dict: The parents, children, hierarchy, hierarchy_models and
+                  current_hierarchy_model entries of the detail response.
+        """
+        hierarchy_models = self.models_for(structure_id)
+        if not hierarchy_model and hierarchy_models:
+            hierarchy_model = hierarchy_models[0]
+
+        node = self.positions.get(structure_id)
+        graph = self.graphs.get(hierarchy_model)
+        parents, children, ancestors, descendants = [], [], [], []
+        if node is not None and graph is not None:
+            if fields is None or "parents" in fields:
+                parents = [self._entry(p) for p in graph.parents(node)]
+            if fields is None or "children" in fields:
+                children = [self._entry(c) for c in graph.children(node)]
+            if (fields is None or "hierarchy" in fields) and window.includes("ancestors"):
+                ancestors = self._page(
+                    self._walk(graph, node, True, window.max_depth), window.ancestors_offset, window
+                )
+            if (fields is None or "hierarchy" in fields) and window.includes("descendants"):
+                descendants = self._page(
+                    self._walk(graph, node, False, window.max_depth), window.descendants_offset, window
+                )
+
+        return {
+            "parents": parents,
+            "children": children,
+            "hierarchy": window.paginate(ancestors, descendants),
+            "hierarchy_models": hierarchy_models,
+            "current_hierarchy_model": hierarchy_model
+        }
+
+    def describe_children(self, structure_id: int, hierarchy_model: str = None) -> dict:
+        """
+        Lists the direct children of a brain structure with their descendant counts.
+
+        Args:
+            structure_id (int): The ID of the brain structure.
+            hierarchy_model (str, optional): The hierarchy model to use. Defaults to the
+                first model that contains the structure.
+
+        Returns:
+            dict: The "current_hierarchy_model" and the "children" entries of a children response.
+        """
+        if not hierarchy_model:
+            hierarchy_models = self.models_for(structure_id)
+            hierarchy_model = hierarchy_models[0] if hierarchy_models else None
+
+        node = self.positions.get(structure_id)
+        graph = self.graphs.get(hierarchy_model)
+        children = []
+        if node is not None and graph is not None:
+            children = [
+                child_entry(
+                    self.structure_ids[child], self.names[child],
+                    graph.child_count(child), graph.labeling.descendant_count(child)
+                )
+                for child in graph.children(node) if child != node
+            ]
+        return {"current_hierarchy_model": hierarchy_model, "children": children}
+
+    def subtree_members(self, structure_id: int, candidate_ids: list, hierarchy_model: str = None) -> dict:
+        """
+        Picks the structures that lie below a brain structure.
+
+        Args:
+            structure_id (int): The ID of the brain structure whose subtree is tested.
+            candidate_ids (list): The IDs of the structures to test.
+            hierarchy_model (str, optional): The hierarchy model to use. Defaults to the
+                first model that contains the structure.
+
+        Returns:
+            dict: The "current_hierarchy_model" and the "contained" candidate IDs, in
+                  the order they were given.
+        """
+        if not hierarchy_model:
+            hierarchy_models = self.models_for(structure_id)
+            hierarchy_model = hierarchy_models[0] if hierarchy_models else None
+
+        node = self.positions.get(structure_id)
+        graph = self.graphs.get(hierarchy_model)
+        contained = []
+        if node is not None and graph is not None:
+            for candidate_id in dict.fromkeys(candidate_ids):
+                candidate = self.positions.get(candidate_id)
+                if candidate is not None and graph.labeling.is_descendant(candidate, node):
+                    contained.append(candidate_id)
+        return {"current_hierarchy_model": hierarchy_model, "contained": contained}
+
+    def _nearest_common_ancestor(self, graph: HierarchyGraph, a: int, b: int):
+        """
+        Breadth-first search upwards from a and b at once, for the common ancestor
+        nearest to both (by combined distance, then by name).
+
+        The side on the lower level is expanded next. A common ancestor not reached
+        yet is further than the next level of a side that is still searching, so
+        the search stops once that bound exceeds the best distance found, rather
+        than after visiting every ancestor of both.
+
+        Returns:
+            tuple: The common ancestor (None if there is none), and for a and b the
+                   ancestors reached, as node: (distance, node it was reached from).
+        """
+        reached = ({a: (0, None)}, {b: (0, None)})
+        frontiers = [[a], [b]]
+        levels = [0, 0]
+        best = (0, self.rank[a], a) if a == b else None
+        while frontiers[0] or frontiers[1]:
+            # Expand side 0 unless side 1 is on a lower level or side 0 is done
+            side = 0 if frontiers[0] and (not frontiers[1] or levels[0] <= levels[1]) else 1
+            if best is not None and levels[side] + 1 > best[0]:
+                break
+            level = levels[side] = levels[side] + 1
+            mine, theirs = reached[side], reached[1 - side]
+            next_frontier = []
+            for node in frontiers[side]:
+                for parent in graph.parents(node):
+                    if parent not in mine:
+                        mine[parent] = (level, node)
+                        next_frontier.append(parent)
+            if len(next_frontier) > 1:
+                next_frontier.sort(key=self.rank.__getitem__)
+            for node in next_frontier:
+                if node in theirs:
+                    candidate = (level + theirs[node][0], self.rank[node], node)
+                    if best is None or candidate < best:
+                        best = candidate
+            frontiers[side] = next_frontier
+        return (best[2] if best is not None else None), reached[0], reached[1]
+
+    def _climb(self, graph: HierarchyGraph, node: int, ancestor: int) -> list:
+        """
+        Returns the nodes from node up to one of its ancestors in a forest.
+        """
+        path = [node]
+        while node != ancestor:
+            node = graph.lifting.up[0][node]
+            path.append(node)
+        return path
+
+    def common_ancestor(self, a_id: int, b_id: int, hierarchy_model: str = None, with_path: bool = False):
+        """
+        Finds the lowest common ancestor of two brain structures. A structure counts
+        as its own ancestor, so a structure above the other is their common ancestor.
+
+        In forest-shaped models the ancestor is unique and found with the jump table.
+        Otherwise the common ancestor nearest to both (by combined distance) is used.
+
+        Args:
+            a_id (int): The ID of the first brain structure.
+            b_id (int): The ID of the second brain structure.
+            hierarchy_model (str, optional): The hierarchy model to use. Defaults to the
+                first model that contains both structures.
+            with_path (bool, optional): Whether to include the path from a up to the
+                common ancestor and down to b.
+
+        Returns:
+            dict: The "current_hierarchy_model", the "lca" entry (None if the structures
+                  share no ancestor), "distance_a" and "distance_b", and with with_path,
+                  the "path" entries.
+            None: If either structure is in no hierarchy model.
+        """
+        a, b = self.positions.get(a_id), self.positions.get(b_id)
+        if a is None or b is None:
+            return None
+        if not hierarchy_model:
+            b_models = self.models_for(b_id)
+            shared = [model for model in self.models_for(a_id) if model in b_models]
+            hierarchy_model = shared[0] if shared else None
+
+        graph = self.graphs.get(hierarchy_model)
+        # Structures outside the model share no ancestor in it
+        if graph is not None and not (graph.has_node(a) and graph.has_node(b)):
+            graph = None
+        return self._common_ancestor_result(graph, a, b, hierarchy_model, with_path)
+
+    def _common_ancestor_result(self, graph, a: int, b: int, hierarchy_model: str, with_path: bool) -> dict:
+        """
+        Builds the common ancestor response of two nodes of a model, or of two
+        structures that are not both in it when graph is None.
+        """
+        ancestor, path = None, None
+        distance_a = distance_b = None
+        if graph is not None and graph.lifting is not None:
+            ancestor = graph.lifting.lowest_common_ancestor(a, b)
+            if ancestor is not None:
+                distance_a = graph.lifting.depth[a] - graph.lifting.depth[ancestor]
+                distance_b = graph.lifting.depth[b] - graph.lifting.depth[ancestor]
+                if with_path:
+                    path = self._climb(graph, a, ancestor) + self._climb(graph, b, ancestor)[-2::-1]
+        elif graph is not None:
+            ancestor, reached_a, reached_b = self._nearest_common_ancestor(graph, a, b)
+            if ancestor is not None:
+                distance_a, distance_b = reached_a[ancestor][0], reached_b[ancestor][0]
+                if with_path:
+                    up, node = [], ancestor
+                    while node is not None:
+                        up.append(node)
+                        node = reached_a[node][1]
+                    down, node = [], reached_b[ancestor][1]
+                    while node is not None:
+                        down.append(node)
+                        node = reached_b[node][1]
+                    path = up[::-1] + down
+
+        result = {
+            "current_hierarchy_model": hierarchy_model,
+            "lca": self._entry(ancestor) if ancestor is not None else None,
+            "distance_a": distance_a,
+            "distance_b": distance_b
+        }
+        if with_path:
+            result["path"] = [self._entry(node) for node in path] if path is not None else []
+        return result
+
+async def fetch_common_ancestor(conn, a_id: int, b_id: int, hierarchy_model: str = None, with_path: bool = False):
+    """
+    Finds the lowest common ancestor of two brain structures without the hierarchy
+    index, from the part of the hierarchy model above them. The answer is the
+    same as HierarchyIndex.common_ancestor.
+
+    Args:
+        conn (asyncpg.Connection): The connection to run the query on.
+        a_id (int): The ID of the first brain structure.
+        b_id (int): The ID of the second brain structure.
+        hierarchy_model (str, optional): The hierarchy model to use. Defaults to the
+            first model that contains both structures.
+        with_path (bool, optional): Whether to include the path from a up to the
+            common ancestor and down to b.
+
+    Returns:
+        dict: As HierarchyIndex.common_ancestor.
+        None: If either structure is in no hierarchy model.
+    """
+    ancestors = await fetch_ancestor_graph(conn, a_id, b_id, hierarchy_model)
+    if ancestors is None:
+        return None
+    model = ancestors["hierarchy_model"]
+    index = HierarchyIndex(ancestors["names"], [(model, parent, child) for parent, child in ancestors["edges"]])
+    graph = None
+    if ancestors["members"]:
+        # Two top-level structures have no edges above them, but are still in the model
+        graph = index.graphs.get(model) or HierarchyGraph(len(index.structure_ids), [], index.rank)
+    return index._common_ancestor_result(
+        graph, index.positions[a_id], index.positions[b_id], model, with_path
+    )
+
+async def load_hierarchy_index(pool):
+    """
+    Loads structure_parents into memory and makes it the current index. Call it
+    again whenever the hierarchy changes; the current index keeps serving
+    requests until the new one is fully built.
+
+    Args:
+        pool (asyncpg.pool.Pool): The database connection pool.
+
+    Returns:
+        HierarchyIndex: The newly loaded index.
+    """
+    global current_index, _load_lock
+
+    if _load_lock is None:
+        _load_lock = asyncio.Lock()
+    async with _load_lock:
+        async with acquire(pool) as conn:
+            with track_query("hierarchy_index_edges"):
+                edges = await conn.fetch(
+                    """
+                    SELECT hierarchy_model_name, parent_id, child_id
+                    FROM structure_parents
+                    """
+                )
+            with track_query("hierarchy_index_structures"):
+                structures = await conn.fetch(
+                    """
+                    SELECT bs.id, bs.standard_name
+                    FROM brain_structures bs
+                    WHERE bs.id IN (
+                        SELECT parent_id FROM structure_parents
+                        UNION
+                        SELECT child_id FROM structure_parents
+                    )
+                    """
+                )
+
+        # Building the adjacency arrays and labels is CPU-bound, so it runs in a
+        # worker thread while the event loop keeps serving requests
+        index = await asyncio.get_running_loop().run_in_executor(None, _build_index, structures, edges)
+        current_index = index
+    logger.info("Loaded hierarchy index with %d structures and %d hierarchy models",
+                len(index.structure_ids), len(index.graphs))
+    return index
+
+def _build_index(structures: list, edges: list):
+    return HierarchyIndex(
+        {s["id"]: s["standard_name"] for s in structures},
+        [(e["hierarchy_model_name"], e["parent_id"], e["child_id"]) for e in edges]
+    )
+
+def get_hierarchy_index():
+    """
+    Returns the current hierarchy index, or None if it has not been loaded.
+    """
+    return current_index
+
+def clear_hierarchy_index():
+    """
+    Drops the current hierarchy index, e.g. when the database connection is closed.
+    """
+    global current_index
+    current_index = None
@@ -0,0 +1,109 @@
+import json
+import logging
+import queue
+import random
+import sys
+from logging.handlers import QueueHandler, QueueListener
+from . import config
+
+# The attributes every LogRecord has. Anything else on a record was passed
+# through extra= and is written out as a structured field.
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+# Marks a high-frequency event that is subject to LOG_SAMPLE_RATE:
+#   logger.debug("Searching concepts", extra={"query": query, **SAMPLED})
+SAMPLED = {"sampled": True}
+
+# The listener that writes queued records from a background thread
+_listener = None
+
+def _fields(record: logging.LogRecord) -> dict:
+    return {
+        key: value for key, value in vars(record).items()
+        if key not in _RECORD_ATTRIBUTES and key != "sampled"
+    }
+
+class TextFormatter(logging.Formatter):
+    """
+    Formats records as a single line, followed by their fields as key=value pairs.
+    """
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = _fields(record)
+        if fields:
+            line += " " + " ".join(f"{key}={value!r}" for key, value in fields.items())
+        return line
+
+class JSONFormatter(logging.Formatter):
+    """
+    Formats records as one JSON object per line, with their fields as top-level keys.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **_fields(record)
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps a random share of the records marked with SAMPLED, and every other record.
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, "sampled", False) or self.rate >= 1.0:
+            return True
+        return random.random() < self.rate
+
+def setup_logging():
+    """
+    Configures the "app" logger from LOG_LEVEL, LOG_FORMAT and LOG_SAMPLE_RATE.
+
+    Records are put on an in-memory queue and written to stderr by a background
+    thread, so logging never blocks the event loop on I/O. Calling it again while
+    logging is set up does nothing.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(JSONFormatter() if config.LOG_FORMAT == "json" else TextFormatter())
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    # Dropped records are never formatted or queued
+    queue_handler.addFilter(SamplingFilter(config.LOG_SAMPLE_RATE))
+
+    logger = logging.getLogger("app")
+    logger.setLevel(config.LOG_LEVEL)
+    logger.handlers = [queue_handler]
+    logger.propagate = False
+
+    _listener = QueueListener(log_queue, handler)
+    _listener.start()
+
+def stop_logging():
+    """
+    Writes out the queued records and stops the background thread.
+    """
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    _listener = None
+    logging.getLogger("app").handlers = []
@@ -1,13 +1,28 @@
-from fastapi import FastAPI, HTTPException, Request, Depends
-from fastapi.responses import HTMLResponse, JSONResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse, Response
 from fastapi.templating import Jinja2Templates
 from contextlib import asynccontextmanager
 from pydantic import BaseModel
-from .models import search_concepts_by_name, get_concept_details, search_brain_structures_by_name, get_brain_structure_details
-from .database import connect_db, close_db
+from typing import List, Optional
+import logging
+from .models import search_concepts_by_name, get_concept_details_json, search_brain_structures_by_name, get_brain_structure_details_json, parse_structure_fields, get_brain_structure_children_json, parse_structure_ids, get_subtree_members, find_common_ancestor, get_brain_structure_batch
+from .hierarchy import parse_hierarchy_window
+from .database import connect_db, close_db, get_pool, get_pool_status
+from .search_index import rebuild_search_indexes
+from .hierarchy_index import load_hierarchy_index
+from .cache import clear_caches, cache_stats
+from .serialization import FastJSONResponse, RawJSONResponse, dumps_members
+from .compression import CompressionMiddleware, PrecompressedStaticFiles
+from .metrics import MetricsMiddleware, acquire, track_query, render as render_metrics
+from .log import setup_logging, stop_logging
+from .timing import ServerTimingMiddleware
+from . import config
 import app.database as database
 
+# Log through a background thread so requests never wait on log output
+setup_logging()
+logger = logging.getLogger(__name__)
+
 # Initialize Jinja2 templates
 templates = Jinja2Templates(directory="frontend/templates")
 
@@ -18,6 +33,17 @@ class DatabaseConnection(BaseModel):
     username: str
     password: str
     database: str
+    # Optional pool settings; unset values use the configured defaults
+    min_size: Optional[int] = None
+    max_size: Optional[int] = None
+    command_timeout: Optional[float] = None
+    max_inactive_connection_lifetime: Optional[float] = None
+    statement_cache_size: Optional[int] = None
+
+# Batch brain structure details request
+class StructureBatchRequest(BaseModel):
+    ids: List[int]
+    hierarchy_model: Optional[str] = None
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -25,15 +51,29 @@ async def lifespan(app: FastAPI):
     Lifespan context manager for application startup and shutdown.
     Handles database connection setup and teardown.
     """
+    setup_logging()
     # No automatic connection on startup - will connect when user provides credentials
     yield
     await close_db()  # Shutdown logic
+    stop_logging()
+
+# Initialize FastAPI application with lifespan. Responses are encoded with
+# orjson when FAST_JSON is enabled and orjson is installed.
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
+
+# Compress API responses for clients that accept gzip or brotli
+app.add_middleware(CompressionMiddleware, minimum_size=config.COMPRESSION_MINIMUM_SIZE)
+
+# Break down the time spent on each API request in a Server-Timing header
+if config.SERVER_TIMING:
+    app.add_middleware(ServerTimingMiddleware)
 
-# Initialize FastAPI application with lifespan
-app = FastAPI(lifespan=lifespan)
+# Record request latency by route. Added last so it wraps compression as well.
+app.add_middleware(MetricsMiddleware)
 
-# Mount static files directory
-app.mount("/static", StaticFiles(directory="frontend/static"), name="static")
+# Mount static files directory. Files are compressed once at startup and the
+# compressed variants are served to clients that accept them.
+app.mount("/static", PrecompressedStaticFiles(directory="frontend/static"), name="static")
 
 @app.get("/", response_class=HTMLResponse)
 async def home(request: Request):
@@ -65,12 +105,18 @@ async def connect_to_database(connection: DatabaseConnection):
             port=connection.port,
             username=connection.username,
             password=connection.password,
-            database=connection.database
+            database=connection.database,
+            pool_options={
+                "min_size": connection.min_size,
+                "max_size": connection.max_size,
+                "command_timeout": connection.command_timeout,
+                "max_inactive_connection_lifetime": connection.max_inactive_connection_lifetime,
+                "statement_cache_size": connection.statement_cache_size
+            }
         )
-        print(f"Database connection successful in connect_to_database endpoint. is_connected = {database.is_connected}")
         return {"status": "success", "message": "Connected to database successfully"}
     except Exception as e:
-        print(f"Error in connect_to_database endpoint: {str(e)}")
+        logger.warning("Connection request failed: %s", type(e).__name__)
         return JSONResponse(
             status_code=500,
             content={"status": "error", "message": f"Failed to connect to database: {str(e)}"}
@@ -84,9 +130,18 @@ async def get_connection_status():
     Returns:
         dict: The current connection status.
     """
-    print(f"Connection status check: is_connected = {database.is_connected}")
     return {"connected": database.is_connected}
 
+@app.get("/api/pool_status")
+async def api_pool_status():
+    """
+    API endpoint to check the configuration and utilization of the connection pool.
+
+    Returns:
+        dict: The pool settings and the number of open, idle and in-use connections.
+    """
+    return get_pool_status()
+
 @app.get("/api/search")
 async def api_search(query: str):
     """
@@ -106,7 +161,8 @@ async def api_search(query: str):
 
     try:
         results = await search_concepts_by_name(query)
-        return results
+        # Returned as a response so FastAPI does not run jsonable_encoder over it first
+        return FastJSONResponse(content=results)
     except Exception as e:
         return JSONResponse(
             status_code=503,
@@ -134,10 +190,11 @@ async def api_concept(concept_id: str):
         )
 
     try:
-        concept = await get_concept_details(concept_id)
+        concept = await get_concept_details_json(concept_id)
         if not concept:
             raise HTTPException(status_code=404, detail="Concept not found")
-        return concept
+        # The payload is already serialized by the database
+        return RawJSONResponse(content=concept)
     except HTTPException:
         # Re-raise HTTPException to maintain the 404 status
         raise
@@ -166,21 +223,139 @@ async def api_brain_search(query: str):
 
     try:
         results = await search_brain_structures_by_name(query)
-        return results
+        return FastJSONResponse(content=results)
+    except Exception as e:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "error", "message": f"Database error: {str(e)}"}
+        )
+
+@app.post("/api/brain-structure/batch")
+async def api_brain_structure_batch(batch: StructureBatchRequest):
+    """
+    API endpoint to fetch the details of many brain structures at once.
+
+    Args:
+        batch (StructureBatchRequest): The structure IDs and, optionally, the hierarchy model
+            for parents and children.
+
+    Returns:
+        dict: The details of each structure keyed by ID, or null for IDs that are not found.
+            Batches larger than config.BATCH_CHUNK_SIZE are streamed chunk by chunk. If a
+            later chunk fails, the object ends with an "error" member instead.
+    """
+    if not database.is_connected:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "error", "message": "Database not connected"}
+        )
+
+    structure_ids = list(dict.fromkeys(batch.ids))
+    if not structure_ids or len(structure_ids) > config.BATCH_MAX_SIZE:
+        return JSONResponse(
+            status_code=400,
+            content={"status": "error", "message": f"Between 1 and {config.BATCH_MAX_SIZE} structure IDs are required"}
+        )
+
+    chunk_size = max(config.BATCH_CHUNK_SIZE, 1)
+    try:
+        # The first chunk is fetched up front, so database errors still produce an error status
+        first = await get_brain_structure_batch(structure_ids[:chunk_size], batch.hierarchy_model)
+    except Exception as e:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "error", "message": f"Database error: {str(e)}"}
+        )
+    if len(structure_ids) <= chunk_size:
+        return RawJSONResponse(content=b"{" + dumps_members(first) + b"}")
+
+    async def stream():
+        yield b"{" + dumps_members(first)
+        for start in range(chunk_size, len(structure_ids), chunk_size):
+            try:
+                chunk = await get_brain_structure_batch(structure_ids[start:start + chunk_size], batch.hierarchy_model)
+            except Exception as e:
+                # The status has already been sent, so the failure is reported in the
+                # document itself, which is closed so it stays valid JSON
+                logger.warning("Error streaming brain structure batch: %s", e)
+                yield b"," + dumps_members({"error": {"status": "error", "message": f"Database error: {str(e)}"}}) + b"}"
+                return
+            yield b"," + dumps_members(chunk)
+        yield b"}"
+
+    return StreamingResponse(stream(), media_type="application/json")
+
+# Declared before /api/brain-structure/{structure_id}, which would otherwise match "lca" and "path"
+@app.get("/api/brain-structure/lca")
+async def api_brain_structure_lca(a: int, b: int, hierarchy_model: str = None):
+    """
+    API endpoint to find the nearest structure that two brain structures share as an ancestor.
+
+    Args:
+        a (int): The ID of the first brain structure.
+        b (int): The ID of the second brain structure.
+        hierarchy_model (str, optional): The hierarchy model to follow.
+
+    Returns:
+        dict: The lowest common ancestor (null if there is none) and its distance from a and b.
+
+    Raises:
+        HTTPException: If either brain structure is in no hierarchy.
+    """
+    return await _common_ancestor_response(a, b, hierarchy_model, with_path=False)
+
+@app.get("/api/brain-structure/path")
+async def api_brain_structure_path(a: int, b: int, hierarchy_model: str = None):
+    """
+    API endpoint to find the path between two brain structures through their lowest common ancestor.
+
+    Args:
+        a (int): The ID of the brain structure the path starts at.
+        b (int): The ID of the brain structure the path ends at.
+        hierarchy_model (str, optional): The hierarchy model to follow.
+
+    Returns:
+        dict: The lowest common ancestor and the structures on the path from a up to it and down to b.
+
+    Raises:
+        HTTPException: If either brain structure is in no hierarchy.
+    """
+    return await _common_ancestor_response(a, b, hierarchy_model, with_path=True)
+
+async def _common_ancestor_response(a: int, b: int, hierarchy_model: str, with_path: bool):
+    if not database.is_connected:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "error", "message": "Database not connected"}
+        )
+
+    try:
+        result = await find_common_ancestor(a, b, hierarchy_model, with_path)
     except Exception as e:
         return JSONResponse(
             status_code=503,
             content={"status": "error", "message": f"Database error: {str(e)}"}
         )
+    if result is None:
+        raise HTTPException(status_code=404, detail="Brain structure not found in any hierarchy")
+    return FastJSONResponse(content=result)
 
 @app.get("/api/brain-structure/{structure_id}")
-async def api_brain_structure(structure_id: str, hierarchy_model: str = None):
+async def api_brain_structure(structure_id: str, hierarchy_model: str = None, fields: str = None,
+                              max_depth: int = None, limit: int = None, cursor: str = None,
+                              direction: str = None):
     """
     API endpoint to fetch details of a specific brain structure.
 
     Args:
         structure_id (str): The ID of the brain structure.
         hierarchy_model (str, optional): The hierarchy model to use for the relationship tree.
+        fields (str, optional): Comma-separated list of the fields to return, e.g. "name,parents,children".
+            Sections that are not requested are not queried. Defaults to all fields.
+        max_depth (int, optional): Only include ancestors and descendants up to this many levels away.
+        limit (int, optional): The maximum number of ancestors and of descendants to return.
+        cursor (str, optional): The hierarchy's next_cursor from the previous page.
+        direction (str, optional): "ancestors" or "descendants" to include only that part of the hierarchy.
 
     Returns:
         dict: The details of the brain structure.
@@ -195,10 +370,141 @@ async def api_brain_structure(structure_id: str, hierarchy_model: str = None):
         )
 
     try:
-        structure = await get_brain_structure_details(structure_id, hierarchy_model)
+        requested_fields = parse_structure_fields(fields)
+        window = parse_hierarchy_window(max_depth, limit, cursor, direction)
+    except ValueError as e:
+        return JSONResponse(
+            status_code=400,
+            content={"status": "error", "message": str(e)}
+        )
+
+    try:
+        structure = await get_brain_structure_details_json(structure_id, hierarchy_model, requested_fields, window)
         if not structure:
             raise HTTPException(status_code=404, detail="Brain structure not found")
-        return structure
+        # The payload is serialized once and cached, so it is sent as-is
+        return RawJSONResponse(content=structure)
+    except HTTPException:
+        # Re-raise HTTPException to maintain the 404 status
+        raise
+    except Exception as e:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "error", "message": f"Database error: {str(e)}"}
+        )
+
+@app.get("/api/brain-structure/{structure_id}/children")
+async def api_brain_structure_children(structure_id: str, hierarchy_model: str = None):
+    """
+    API endpoint to fetch the direct children of a brain structure, for expanding
+    the hierarchy tree on demand.
+
+    Args:
+        structure_id (str): The ID of the brain structure.
+        hierarchy_model (str, optional): The hierarchy model to follow.
+
+    Returns:
+        dict: The children of the brain structure, each with has_children and descendant counts.
+
+    Raises:
+        HTTPException: If the brain structure is not found.
+    """
+    if not database.is_connected:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "error", "message": "Database not connected"}
+        )
+
+    try:
+        children = await get_brain_structure_children_json(structure_id, hierarchy_model)
+        if not children:
+            raise HTTPException(status_code=404, detail="Brain structure not found")
+        return RawJSONResponse(content=children)
+    except HTTPException:
+        # Re-raise HTTPException to maintain the 404 status
+        raise
+    except Exception as e:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "error", "message": f"Database error: {str(e)}"}
+        )
+
+@app.get("/api/brain-structure/{structure_id}/contains/{other_id}")
+async def api_brain_structure_contains(structure_id: str, other_id: int, hierarchy_model: str = None):
+    """
+    API endpoint to test whether a brain structure lies inside another one.
+
+    Args:
+        structure_id (str): The ID of the enclosing brain structure.
+        other_id (int): The ID of the brain structure to test.
+        hierarchy_model (str, optional): The hierarchy model to follow.
+
+    Returns:
+        dict: Whether other_id is a descendant of structure_id.
+
+    Raises:
+        HTTPException: If the brain structure is not found.
+    """
+    if not database.is_connected:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "error", "message": "Database not connected"}
+        )
+
+    try:
+        members = await get_subtree_members(structure_id, [other_id], hierarchy_model)
+        if members is None:
+            raise HTTPException(status_code=404, detail="Brain structure not found")
+        return FastJSONResponse(content={
+            "structure_id": members["structure_id"],
+            "other_id": other_id,
+            "current_hierarchy_model": members["current_hierarchy_model"],
+            "contains": other_id in members["contained"]
+        })
+    except HTTPException:
+        # Re-raise HTTPException to maintain the 404 status
+        raise
+    except Exception as e:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "error", "message": f"Database error: {str(e)}"}
+        )
+
+@app.get("/api/brain-structure/{structure_id}/subtree")
+async def api_brain_structure_subtree(structure_id: str, ids: str, hierarchy_model: str = None):
+    """
+    API endpoint to filter a list of brain structures to those inside a brain structure.
+
+    Args:
+        structure_id (str): The ID of the enclosing brain structure.
+        ids (str): Comma-separated IDs of the brain structures to filter.
+        hierarchy_model (str, optional): The hierarchy model to follow.
+
+    Returns:
+        dict: The IDs from ids that are descendants of structure_id.
+
+    Raises:
+        HTTPException: If the brain structure is not found.
+    """
+    if not database.is_connected:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "error", "message": "Database not connected"}
+        )
+
+    try:
+        candidate_ids = parse_structure_ids(ids)
+    except ValueError as e:
+        return JSONResponse(
+            status_code=400,
+            content={"status": "error", "message": str(e)}
+        )
+
+    try:
+        members = await get_subtree_members(structure_id, candidate_ids, hierarchy_model)
+        if members is None:
+            raise HTTPException(status_code=404, detail="Brain structure not found")
+        return FastJSONResponse(content=members)
     except HTTPException:
         # Re-raise HTTPException to maintain the 404 status
         raise
@@ -223,11 +529,11 @@ async def api_hierarchy_models():
         )
 
     try:
-        pool = await connect_db()
+        pool = get_pool()
         if pool is None:
             raise Exception("Database connection not available")
 
-        async with pool.acquire() as conn:
+        async with acquire(pool) as conn, track_query("hierarchy_models"):
             models = await conn.fetch(
                 """
                 SELECT DISTINCT hierarchy_model_name
@@ -236,9 +542,91 @@ async def api_hierarchy_models():
                 """
             )
 
-        return [model["hierarchy_model_name"] for model in models]
+        return FastJSONResponse(content=[model["hierarchy_model_name"] for model in models])
     except Exception as e:
         return JSONResponse(
             status_code=503,
             content={"status": "error", "message": f"Database error: {str(e)}"}
         )
+
+@app.post("/api/admin/search-index/rebuild")
+async def api_rebuild_search_index():
+    """
+    API endpoint to rebuild the in-memory search indexes after the data has changed.
+    The new indexes replace the old ones atomically once they are fully built.
+
+    Returns:
+        dict: A status message indicating success or failure.
+    """
+    if not database.is_connected:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "error", "message": "Database not connected"}
+        )
+
+    try:
+        await rebuild_search_indexes(get_pool())
+        return {"status": "success", "message": "Search indexes rebuilt"}
+    except Exception as e:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "error", "message": f"Database error: {str(e)}"}
+        )
+
+@app.post("/api/admin/hierarchy-index/reload")
+async def api_reload_hierarchy_index():
+    """
+    API endpoint to reload the in-memory hierarchy index after structure_parents has changed.
+    The new index replaces the old one atomically once it is fully built, and cached
+    brain structure responses are dropped.
+
+    Returns:
+        dict: A status message indicating success or failure.
+    """
+    if not database.is_connected:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "error", "message": "Database not connected"}
+        )
+
+    try:
+        await load_hierarchy_index(get_pool())
+        # Cached details were built from the previous index
+        clear_caches()
+        return {"status": "success", "message": "Hierarchy index reloaded"}
+    except Exception as e:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "error", "message": f"Database error: {str(e)}"}
+        )
+
+@app.get("/api/admin/cache")
+async def api_cache_stats():
+    """
+    API endpoint to inspect the response caches.
+
+    Returns:
+        dict: The size, limits and hit/miss counters of each cache.
+    """
+    return cache_stats()
+
+@app.post("/api/admin/cache/flush")
+async def api_flush_cache():
+    """
+    API endpoint to remove all entries from the response caches.
+
+    Returns:
+        dict: A status message.
+    """
+    clear_caches()
+    return {"status": "success", "message": "Caches flushed"}
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Exposes request, query, connection pool and cache metrics in the Prometheus text format.
+
+    Returns:
+        Response: The current metrics as text/plain.
+    """
+    return Response(content=render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
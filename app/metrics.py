@@ -0,0 +1,344 @@
+import logging
+import time
+from bisect import bisect_left
+from .cache import cache_stats
+from .timing import record
+
+logger = logging.getLogger(__name__)
+
+# Metrics are only updated from the event loop thread. Every update is a plain
+# attribute or list increment that never awaits, so no locks are needed.
+
+# Registered metric families and scrape-time collectors, in registration order
+registry = []
+collectors = []
+
+# Functions told about errors on pooled connections (see register_error_handler)
+error_handlers = []
+
+# Latency buckets in seconds, as used by the Prometheus client libraries
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Family:
+    """
+    A named metric with a fixed set of label names. Each combination of label
+    values has its own child, created on first use.
+    """
+
+    metric_type = None
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        registry.append(self)
+
+    def labels(self, *values):
+        """
+        Returns the child for the given label values, in labelnames order.
+        """
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        for values, child in list(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+    def _render_child(self, values: tuple, child) -> list:
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"]
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+class Counter(_Family):
+    """
+    A value that only goes up, e.g. the number of requests served.
+    """
+
+    metric_type = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+class Gauge(_Family):
+    """
+    A value that goes up and down, e.g. the number of requests in progress.
+    """
+
+    metric_type = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        # One count per bucket, plus one for values above the largest bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class Histogram(_Family):
+    """
+    A distribution of observed values (e.g. durations in seconds) in cumulative buckets.
+    """
+
+    metric_type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def _render_child(self, values: tuple, child) -> list:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+            cumulative += count
+            le = f'le="{_format_value(float(bound))}"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}")
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+        lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+def register_collector(collect):
+    """
+    Registers a function that is called on every scrape and returns metric lines,
+    for values that are cheaper to read on demand than to track (e.g. pool sizes).
+
+    Args:
+        collect (callable): Returns a list of lines in the Prometheus text format.
+    """
+    collectors.append(collect)
+
+def register_error_handler(handle):
+    """
+    Registers a function that is called with every exception raised while
+    acquiring or using a connection through acquire(), e.g. to notice that the
+    database has gone away before the next health check.
+
+    Args:
+        handle (callable): Called with the exception. It must not raise.
+    """
+    error_handlers.append(handle)
+
+def _report_error(error: BaseException):
+    for handle in error_handlers:
+        try:
+            handle(error)
+        except Exception as e:
+            logger.warning("Error handling a database error: %s", e)
+
+def render() -> bytes:
+    """
+    Renders every metric in the Prometheus text exposition format.
+    """
+    lines = []
+    for family in registry:
+        lines.extend(family.render())
+    for collect in collectors:
+        try:
+            lines.extend(collect())
+        except Exception as e:
+            logger.warning("Error collecting metrics: %s", e)
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+# HTTP metrics, recorded by MetricsMiddleware
+http_requests = Counter(
+    "http_requests_total", "HTTP requests served.", ("method", "route", "status")
+)
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "HTTP request latency.", ("method", "route")
+)
+http_requests_in_progress = Gauge(
+    "http_requests_in_progress", "HTTP requests being served."
+).labels()
+
+# Database metrics
+db_query_duration = Histogram(
+    "db_query_duration_seconds", "Database query latency by query name.", ("query",)
+)
+db_query_errors = Counter(
+    "db_query_errors_total", "Database queries that raised an error, by query name.", ("query",)
+)
+db_pool_acquire_duration = Histogram(
+    "db_pool_acquire_seconds", "Time spent waiting for a pooled connection.",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+).labels()
+db_pool_waiting = Gauge(
+    "db_pool_waiting", "Requests waiting for a pooled connection."
+).labels()
+
+class track_query:
+    """
+    Context manager that records the duration of a named database query. It can
+    also be entered with async with, e.g. together with acquire():
+
+        async with acquire(pool) as conn, track_query("structure_details"):
+            row = await conn.fetchrow(...)
+    """
+
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        db_query_duration.labels(self.name).observe(duration)
+        record(f"db-{self.name}", duration)
+        if exc_type is not None:
+            db_query_errors.labels(self.name).inc()
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+class acquire:
+    """
+    Acquires a connection from an asyncpg pool like pool.acquire(), recording
+    the wait in db_pool_acquire_seconds and db_pool_waiting. Errors raised while
+    acquiring or using the connection are passed to the registered error handlers.
+
+        async with acquire(pool) as conn:
+            ...
+    """
+
+    __slots__ = ("pool", "conn")
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.conn = None
+
+    async def __aenter__(self):
+        db_pool_waiting.inc()
+        start = time.perf_counter()
+        try:
+            self.conn = await self.pool.acquire()
+        except Exception as e:
+            _report_error(e)
+            raise
+        finally:
+            db_pool_waiting.dec()
+            duration = time.perf_counter() - start
+            db_pool_acquire_duration.observe(duration)
+            record("acquire", duration)
+        return self.conn
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if isinstance(exc, Exception):
+            _report_error(exc)
+        await self.pool.release(self.conn)
+        self.conn = None
+        return False
+
+def _route_label(scope) -> str:
+    """
+    Returns the route template of a request (e.g. "/api/concept/{concept_id}"),
+    so that requests for different IDs share a series. The router stores the
+    matched route in the shared scope; requests that matched none are "unmatched".
+    """
+    return getattr(scope.get("route"), "path", "unmatched")
+
+class MetricsMiddleware:
+    """
+    ASGI middleware that records the latency and status of every HTTP request, by route.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = "500"
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        http_requests_in_progress.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            duration = time.perf_counter() - start
+            http_requests_in_progress.dec()
+            route = _route_label(scope)
+            http_request_duration.labels(scope["method"], route).observe(duration)
+            http_requests.labels(scope["method"], route, status).inc()
+
+def _collect_caches() -> list:
+    lines = []
+    stats = cache_stats()
+    for name, metric_type, key, documentation in (
+        ("cache_hits_total", "counter", "hits", "Cache lookups that found an entry."),
+        ("cache_misses_total", "counter", "misses", "Cache lookups that found no entry."),
+        ("cache_size", "gauge", "size", "Entries in the cache."),
+        ("cache_bytes", "gauge", "bytes", "Total size of the cached values in bytes."),
+        ("cache_hit_ratio", "gauge", "hit_ratio", "Share of cache lookups that found an entry."),
+    ):
+        lines.append(f"# HELP {name} {documentation}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for cache_name, cache in stats.items():
+            value = cache[key]
+            if value is not None:
+                lines.append(f'{name}{{cache="{_escape(cache_name)}"}} {_format_value(value)}')
+    return lines
+
+register_collector(_collect_caches)
@@ -1,5 +1,114 @@
-from .database import connect_db
+import asyncio
+import logging
+import time
+from . import config
+from .cache import create_cache, cached
+from .database import get_pool, QueryFanOut
+from .singleflight import coalesce
+from .hierarchy import fetch_hierarchy, fetch_children, fetch_subtree_members, FULL_HIERARCHY
+from .hierarchy_index import get_hierarchy_index, fetch_common_ancestor
+from .log import SAMPLED
+from .metrics import acquire, track_query
+from .search import search_concepts, search_structures, is_trigram_enabled
+from .search_index import get_concept_index, get_structure_index
+from .serialization import dumps
+from .timing import record, span
+
+logger = logging.getLogger(__name__)
+
+# Caches for detail lookups. They hold serialized JSON, so cached responses are sent without re-encoding.
+concept_details_cache = create_cache("concept_details", config.DETAILS_CACHE_SIZE, config.DETAILS_CACHE_TTL,
+                                     config.DETAILS_CACHE_MAX_BYTES)
+structure_details_cache = create_cache("structure_details", config.DETAILS_CACHE_SIZE, config.DETAILS_CACHE_TTL,
+                                       config.DETAILS_CACHE_MAX_BYTES)
+structure_children_cache = create_cache("structure_children", config.DETAILS_CACHE_SIZE, config.DETAILS_CACHE_TTL,
+                                        config.DETAILS_CACHE_MAX_BYTES)
+
+# Top-level fields of a brain structure's details, which can be requested selectively
+STRUCTURE_FIELDS = frozenset([
+    "structure_id", "name", "acronym", "description", "brain_info_url", "structure_type", "neuronames_id",
+    "synonyms", "synonym_details",
+    "parents", "children", "hierarchy", "hierarchy_models", "current_hierarchy_model"
+])
+# Fields that need the synonyms query
+SYNONYM_FIELDS = frozenset(["synonyms", "synonym_details"])
+# Fields that come from the hierarchy (structure_parents)
+RELATION_FIELDS = frozenset(["parents", "children", "hierarchy", "hierarchy_models", "current_hierarchy_model"])
+# Fields that depend on which hierarchy model is used
+MODEL_DEPENDENT_FIELDS = frozenset(["parents", "children", "hierarchy", "current_hierarchy_model"])
+
+def parse_structure_fields(fields: str):
+    """
+    Parses a comma-separated list of brain structure detail fields.
+
+    Args:
+        fields (str): The field names, e.g. "name,parents,children". Empty or None means all fields.
+
+    Returns:
+        frozenset: The requested field names, or None for all fields.
+
+    Raises:
+        ValueError: If a field name is unknown.
+    """
+    if not fields:
+        return None
+    requested = frozenset(field.strip() for field in fields.split(",") if field.strip())
+    unknown = requested - STRUCTURE_FIELDS
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return requested or None
+
+def parse_structure_ids(structure_ids: str) -> list:
+    """
+    Parses a comma-separated list of brain structure IDs.
+
+    Args:
+        structure_ids (str): The IDs, e.g. "12,40,7".
+
+    Returns:
+        list: The IDs as integers, in the given order.
+
+    Raises:
+        ValueError: If an ID is not an integer or no ID is given.
+    """
+    parsed = []
+    for structure_id in (structure_ids or "").split(","):
+        structure_id = structure_id.strip()
+        if not structure_id:
+            continue
+        try:
+            parsed.append(int(structure_id))
+        except ValueError:
+            raise ValueError(f"Invalid structure ID: {structure_id} - must be an integer")
+    if not parsed:
+        raise ValueError("No structure IDs given")
+    return parsed
+
+def _structure_details_key(structure_id, hierarchy_model: str = None, fields: frozenset = None,
+                           window=FULL_HIERARCHY):
+    """
+    Builds the structure details cache and coalescing key, so that e.g. "42" and 42 share an entry.
+    """
+    try:
+        structure_id = int(structure_id)
+    except (TypeError, ValueError):
+        pass
+    return (structure_id, hierarchy_model, fields, window)
+
+def _structure_children_key(structure_id, hierarchy_model: str = None):
+    """
+    Builds the structure children cache and coalescing key.
+    """
+    return _structure_details_key(structure_id, hierarchy_model)[:2]
+
+def _search_key(name_query: str):
+    """
+    Builds the search coalescing key. Matching is case-insensitive, so queries
+    that differ only in case return the same results.
+    """
+    return name_query.lower()
 
+@coalesce(key=_search_key)
 async def search_concepts_by_name(name_query: str):
     """
     Searches for cognitive concepts by name.
@@ -10,27 +119,30 @@ async def search_concepts_by_name(name_query: str):
     Returns:
         list: A list of dictionaries containing concept IDs and names.
     """
-    print(f"Searching for concepts with query: {name_query}")
-    pool = await connect_db()
+    pool = get_pool()
     if pool is None:
-        print("Database connection not available in search_concepts_by_name")
+        logger.warning("Database connection not available in search_concepts_by_name")
         raise Exception("Database connection not available")
 
-    print("Database connection available, executing query")
-    async with pool.acquire() as conn:
-        rows = await conn.fetch(
-            """
-            SELECT concept_id, name 
-            FROM cognitive_concepts 
-            WHERE name ILIKE $1 
-            LIMIT 20
-            """,
-            f"%{name_query}%"
-        )
+    # Answer from the in-memory index when it is built. Only fall through to the
+    # database when nothing matches and it can add trigram (fuzzy) matches.
+    index = get_concept_index()
+    if index is not None:
+        with span("build"):
+            result = [{"concept_id": concept_id, "name": name} for concept_id, name in index.search(name_query)]
+        if result or not is_trigram_enabled():
+            logger.debug("Searched concepts", extra={"query": name_query, "results": len(result),
+                                                     "source": "index", **SAMPLED})
+            return result
+
+    async with acquire(pool) as conn, track_query("search_concepts"):
+        rows = await search_concepts(conn, name_query)
     result = [{"concept_id": r["concept_id"], "name": r["name"]} for r in rows]
-    print(f"Found {len(result)} concepts matching query: {name_query}")
+    logger.debug("Searched concepts", extra={"query": name_query, "results": len(result),
+                                             "source": "database", **SAMPLED})
     return result
 
+@coalesce(key=_search_key)
 async def search_brain_structures_by_name(name_query: str):
     """
     Searches for brain structures by name or synonym.
@@ -41,266 +153,269 @@ async def search_brain_structures_by_name(name_query: str):
     Returns:
         list: A list of dictionaries containing structure IDs and names.
     """
-    print(f"Searching for brain structures with query: {name_query}")
-    pool = await connect_db()
+    pool = get_pool()
     if pool is None:
-        print("Database connection not available in search_brain_structures_by_name")
+        logger.warning("Database connection not available in search_brain_structures_by_name")
         raise Exception("Database connection not available")
 
-    print("Database connection available, executing query")
-    async with pool.acquire() as conn:
-        # Search in brain_structures table
-        structure_rows = await conn.fetch(
-            """
-            SELECT id, standard_name 
-            FROM brain_structures 
-            WHERE standard_name ILIKE $1 
-            LIMIT 20
-            """,
-            f"%{name_query}%"
-        )
-
-        # Search in synonyms table
-        synonym_rows = await conn.fetch(
-            """
-            SELECT bs.id, bs.standard_name 
-            FROM brain_structures bs
-            JOIN synonyms ss ON bs.id = ss.brain_structure_id
-            WHERE ss.synonym_name ILIKE $1 
-            LIMIT 20
-            """,
-            f"%{name_query}%"
-        )
-
-    # Combine results, removing duplicates
-    result_dict = {}
-    for r in structure_rows:
-        result_dict[r["id"]] = {"structure_id": r["id"], "name": r["standard_name"]}
-
-    for r in synonym_rows:
-        result_dict[r["id"]] = {"structure_id": r["id"], "name": r["standard_name"]}
-
-    result = list(result_dict.values())
-    print(f"Found {len(result)} brain structures matching query: {name_query}")
+    # Answer from the in-memory index when it is built. Only fall through to the
+    # database when nothing matches and it can add trigram (fuzzy) matches.
+    index = get_structure_index()
+    if index is not None:
+        with span("build"):
+            result = [{"structure_id": structure_id, "name": name} for structure_id, name in index.search(name_query)]
+        if result or not is_trigram_enabled():
+            logger.debug("Searched brain structures", extra={"query": name_query, "results": len(result),
+                                                             "source": "index", **SAMPLED})
+            return result
+
+    async with acquire(pool) as conn, track_query("search_structures"):
+        # Standard names and synonyms are searched and ranked in a single query
+        rows = await search_structures(conn, name_query)
+
+    result = [{"structure_id": r["id"], "name": r["standard_name"]} for r in rows]
+    logger.debug("Searched brain structures", extra={"query": name_query, "results": len(result),
+                                                     "source": "database", **SAMPLED})
     return result
 
-async def get_concept_details(concept_id: str):
+@cached(concept_details_cache, key=lambda concept_id: concept_id)
+@coalesce(key=lambda concept_id: concept_id)
+async def get_concept_details_json(concept_id: str):
     """
-    Fetches detailed information about a specific cognitive concept.
+    Fetches detailed information about a specific cognitive concept as a JSON document.
+    The whole payload, including the class and relationships, is built by the
+    database in a single query.
 
     Args:
         concept_id (str): The ID of the concept.
 
     Returns:
-        dict: A dictionary containing the concept's details, including its name, definition, class, and relationships.
+        bytes: A UTF-8 encoded JSON object containing the concept's details, including its name, definition, class, and relationships.
         None: If the concept is not found.
     """
-    print(f"Fetching details for concept with ID: {concept_id}")
-    pool = await connect_db()
+    pool = get_pool()
     if pool is None:
-        print("Database connection not available in get_concept_details")
+        logger.warning("Database connection not available in get_concept_details_json")
         raise Exception("Database connection not available")
 
-    print("Database connection available, executing query for concept details")
-    async with pool.acquire() as conn:
-        # Fetch the main concept details
-        concept = await conn.fetchrow(
+    async with acquire(pool) as conn, track_query("concept_details"):
+        concept = await conn.fetchval(
             """
-            SELECT name, definition_text, concept_class 
-            FROM cognitive_concepts 
-            WHERE concept_id=$1
+            SELECT json_build_object(
+                'name', c.name,
+                'definition', c.definition_text,
+                'class', json_build_object(
+                    'name', CASE WHEN cc.concept_class_id IS NULL THEN 'Unknown' ELSE cc.name END,
+                    'description', CASE WHEN cc.concept_class_id IS NULL THEN '' ELSE cc.description END
+                ),
+                'relationships', COALESCE((
+                    SELECT json_agg(json_build_object(
+                        'relationship', r.relationship,
+                        'direction', r.direction,
+                        'target', COALESCE(NULLIF(rc.name, ''), NULLIF(t.name, ''), '[Unnamed]')
+                    ))
+                    FROM relationships r
+                    LEFT JOIN cognitive_concepts rc ON r.related_concept_id = rc.concept_id
+                    LEFT JOIN tasks t ON r.related_concept_id = t.task_id
+                    WHERE r.concept_id = c.concept_id
+                ), '[]'::json)
+            )::text
+            FROM cognitive_concepts c
+            LEFT JOIN concept_classes cc ON cc.concept_class_id = c.concept_class
+            WHERE c.concept_id = $1
             """,
             concept_id
         )
-        if not concept:
-            print(f"Concept with ID {concept_id} not found")
-            return None
 
-        # Fetch the concept class details
-        concept_class = await conn.fetchrow(
-            """
-            SELECT name, description 
-            FROM concept_classes 
-            WHERE concept_class_id=$1
-            """,
-            concept["concept_class"]
-        )
+    logger.debug("Fetched concept details", extra={"concept_id": concept_id, "found": concept is not None, **SAMPLED})
+    if concept is None:
+        return None
 
-        # Fetch the relationships of the concept
-        relationships = await conn.fetch(
-            """
-            SELECT r.relationship, r.direction,
-                   c.name AS concept_name, t.name AS task_name
-            FROM relationships r
-            LEFT JOIN cognitive_concepts c ON r.related_concept_id = c.concept_id
-            LEFT JOIN tasks t ON r.related_concept_id = t.task_id
-            WHERE r.concept_id = $1
-            """,
-            concept_id
+    return concept.encode("utf-8")
+
+async def _empty_rows():
+    """
+    Stands in for a query whose section was not requested.
+    """
+    return []
+
+async def _fetch_relatives(queries: QueryFanOut, structure_id: int, hierarchy_model: str, fields: frozenset,
+                           window):
+    """
+    Fetches the requested parts of a brain structure's parents, children and
+    transitive hierarchy concurrently.
+
+    Returns:
+        tuple: The parent rows, the child rows and the hierarchy dictionary.
+    """
+    # Fetch the structure's parents based on the hierarchy model
+    parents_query = """
+        SELECT p.id, p.standard_name 
+        FROM brain_structures p
+        JOIN structure_parents sr ON p.id = sr.parent_id
+        WHERE sr.child_id = $1
+        """
+
+    # Fetch the structure's children based on the hierarchy model
+    children_query = """
+        SELECT c.id, c.standard_name 
+        FROM brain_structures c
+        JOIN structure_parents sr ON c.id = sr.child_id
+        WHERE sr.parent_id = $1
+        """
+
+    if hierarchy_model:
+        parents_query += " AND sr.hierarchy_model_name = $2"
+        children_query += " AND sr.hierarchy_model_name = $2"
+        args = (structure_id, hierarchy_model)
+    else:
+        args = (structure_id,)
+
+    parents, children, hierarchy = await asyncio.gather(
+        queries.fetch("structure_parents", parents_query, *args) if "parents" in fields else _empty_rows(),
+        queries.fetch("structure_children", children_query, *args) if "children" in fields else _empty_rows(),
+        # Resolve all ancestors and descendants in a single recursive query
+        queries.run(fetch_hierarchy, structure_id, hierarchy_model, window) if "hierarchy" in fields else _empty_rows()
+    )
+    return parents, children, hierarchy or window.paginate([], [])
+
+async def _fetch_structure_relations(queries: QueryFanOut, structure_id: int, hierarchy_model: str = None,
+                                     fields: frozenset = STRUCTURE_FIELDS, window=FULL_HIERARCHY):
+    """
+    Fetches the hierarchy parts of a brain structure's details from the database.
+
+    Args:
+        queries (QueryFanOut): Runs the queries concurrently on pooled connections.
+        structure_id (int): The ID of the brain structure.
+        hierarchy_model (str, optional): The hierarchy model to use for the relationship tree.
+        fields (frozenset, optional): The requested fields. Queries for other fields are skipped.
+        window (HierarchyWindow, optional): The depth limit and page of the hierarchy.
+
+    Returns:
+        dict: The parents, children, hierarchy, hierarchy_models and current_hierarchy_model
+              entries of the structure's details.
+    """
+    # The models are needed when requested, or to pick the default model for the other sections
+    needs_models = "hierarchy_models" in fields or (
+        not hierarchy_model and not fields.isdisjoint(MODEL_DEPENDENT_FIELDS)
+    )
+
+    # Fetch available hierarchy models for this structure
+    models_query = queries.fetch(
+        "structure_models",
+        """
+        SELECT DISTINCT hierarchy_model_name COLLATE "C" AS hierarchy_model_name
+        FROM structure_parents
+        WHERE child_id = $1 OR parent_id = $1
+        ORDER BY hierarchy_model_name
+        """,
+        structure_id
+    ) if needs_models else _empty_rows()
+
+    if hierarchy_model:
+        hierarchy_models, (parents, children, hierarchy) = await asyncio.gather(
+            models_query,
+            _fetch_relatives(queries, structure_id, hierarchy_model, fields, window)
         )
+    else:
+        # The relatives depend on the default model, so the models are fetched first
+        hierarchy_models = await models_query
 
-    result = {
-        "name": concept["name"],
-        "definition": concept["definition_text"],
-        "class": {
-            "name": concept_class["name"] if concept_class else "Unknown",
-            "description": concept_class["description"] if concept_class else ""
-        },
-        "relationships": [
-            {
-                "relationship": r["relationship"],
-                "direction": r["direction"],
-                "target": r["concept_name"] or r["task_name"] or "[Unnamed]"
-            } for r in relationships
-        ]
+        # If no hierarchy model is specified but there are available models, use the first
+        # one by name, like the hierarchy index and the children and batch queries
+        if hierarchy_models:
+            hierarchy_model = hierarchy_models[0]["hierarchy_model_name"]
+            logger.debug("No hierarchy model specified, using %s", hierarchy_model, extra=SAMPLED)
+
+        parents, children, hierarchy = await _fetch_relatives(queries, structure_id, hierarchy_model, fields, window)
+
+    return {
+        "parents": [{"structure_id": p["id"], "name": p["standard_name"]} for p in parents],
+        "children": [{"structure_id": c["id"], "name": c["standard_name"]} for c in children],
+        "hierarchy": hierarchy,
+        "hierarchy_models": [model["hierarchy_model_name"] for model in hierarchy_models],
+        "current_hierarchy_model": hierarchy_model
     }
-    print(f"Returning details for concept: {result['name']}")
-    return result
 
-async def get_brain_structure_details(structure_id: str, hierarchy_model: str = None):
+@coalesce(key=_structure_details_key)
+async def get_brain_structure_details(structure_id: str, hierarchy_model: str = None, fields: frozenset = None,
+                                      window=FULL_HIERARCHY):
     """
     Fetches detailed information about a specific brain structure.
 
     Args:
         structure_id (str): The ID of the brain structure.
         hierarchy_model (str, optional): The hierarchy model to use for the relationship tree.
+        fields (frozenset, optional): The top-level fields to return (see STRUCTURE_FIELDS).
+            structure_id is always returned. Sections that are not requested are
+            neither queried nor computed. Defaults to all fields.
+        window (HierarchyWindow, optional): The depth limit and page of the transitive
+            hierarchy (see parse_hierarchy_window). Defaults to every ancestor and descendant.
 
     Returns:
         dict: A dictionary containing the structure's details, including its name, description,
               parent-child relationships, and synonyms.
         None: If the structure is not found.
     """
-    print(f"Fetching details for brain structure with ID: {structure_id}, hierarchy model: {hierarchy_model}")
-    pool = await connect_db()
+    pool = get_pool()
     if pool is None:
-        print("Database connection not available in get_brain_structure_details")
+        logger.warning("Database connection not available in get_brain_structure_details")
         raise Exception("Database connection not available")
 
     # Convert structure_id to integer
     try:
         structure_id_int = int(structure_id)
     except ValueError:
-        print(f"Invalid structure ID: {structure_id} - must be an integer")
         raise ValueError(f"Invalid structure ID: {structure_id} - must be an integer")
 
-    print("Database connection available, executing query for brain structure details")
-    async with pool.acquire() as conn:
+    requested = STRUCTURE_FIELDS if fields is None else frozenset(fields)
+
+    # The queries are independent, so they run concurrently on separate pooled
+    # connections, bounded per request by DETAIL_QUERY_CONCURRENCY
+    queries = QueryFanOut(pool, config.DETAIL_QUERY_CONCURRENCY)
+    index = get_hierarchy_index()
+    pending = [
         # Fetch the main structure details
-        structure = await conn.fetchrow(
+        queries.fetchrow(
+            "structure_details",
             """
             SELECT id, neuronames_id, standard_name, standard_acronym, definition, brain_info_url, structure_type
             FROM brain_structures 
             WHERE id=$1
             """,
             structure_id_int
-        )
-        if not structure:
-            print(f"Brain structure with ID {structure_id} not found")
-            return None
-
+        ),
         # Fetch the structure's synonyms
-        synonyms = await conn.fetch(
+        queries.fetch(
+            "structure_synonyms",
             """
             SELECT synonym_name, synonym_language, organism, synonym_source, source_title, pubmed_hit_count
             FROM synonyms 
             WHERE brain_structure_id=$1
             """,
             structure_id_int
-        )
-
-        # Fetch available hierarchy models for this structure
-        hierarchy_models = await conn.fetch(
-            """
-            SELECT DISTINCT hierarchy_model_name
-            FROM structure_parents
-            WHERE child_id = $1 OR parent_id = $1
-            """,
-            structure_id_int
-        )
-
-        # If no hierarchy model is specified but there are available models, use the first one
-        if not hierarchy_model and hierarchy_models:
-            hierarchy_model = hierarchy_models[0]["hierarchy_model_name"]
-            print(f"No hierarchy model specified, using: {hierarchy_model}")
-
-        # Fetch the structure's parents based on the hierarchy model
-        parents_query = """
-            SELECT p.id, p.standard_name 
-            FROM brain_structures p
-            JOIN structure_parents sr ON p.id = sr.parent_id
-            WHERE sr.child_id = $1
-            """
-
-        if hierarchy_model:
-            parents_query += " AND sr.hierarchy_model_name = $2"
-            parents = await conn.fetch(parents_query, structure_id_int, hierarchy_model)
-        else:
-            parents = await conn.fetch(parents_query, structure_id_int)
-
-        # Fetch the structure's children based on the hierarchy model
-        children_query = """
-            SELECT c.id, c.standard_name 
-            FROM brain_structures c
-            JOIN structure_parents sr ON c.id = sr.child_id
-            WHERE sr.parent_id = $1
-            """
-
-        if hierarchy_model:
-            children_query += " AND sr.hierarchy_model_name = $2"
-            children = await conn.fetch(children_query, structure_id_int, hierarchy_model)
-        else:
-            children = await conn.fetch(children_query, structure_id_int)
-
-        # Build the complete hierarchy tree
-        # First, get all ancestors (parents, grandparents, etc.)
-        ancestors = []
-        current_parents = parents
-        while current_parents:
-            next_level_parents = []
-            for parent in current_parents:
-                if parent["id"] not in [a["id"] for a in ancestors]:
-                    ancestors.append(parent)
-                    # Get this parent's parents
-                    higher_parents_query = """
-                        SELECT p.id, p.standard_name 
-                        FROM brain_structures p
-                        JOIN structure_parents sr ON p.id = sr.parent_id
-                        WHERE sr.child_id = $1
-                        """
-
-                    if hierarchy_model:
-                        higher_parents_query += " AND sr.hierarchy_model_name = $2"
-                        higher_parents = await conn.fetch(higher_parents_query, int(parent["id"]), hierarchy_model)
-                    else:
-                        higher_parents = await conn.fetch(higher_parents_query, int(parent["id"]))
-
-                    next_level_parents.extend(higher_parents)
-            current_parents = next_level_parents
-
-        # Then, get all descendants (children, grandchildren, etc.)
-        descendants = []
-        current_children = children
-        while current_children:
-            next_level_children = []
-            for child in current_children:
-                if child["id"] not in [d["id"] for d in descendants]:
-                    descendants.append(child)
-                    # Get this child's children
-                    lower_children_query = """
-                        SELECT c.id, c.standard_name 
-                        FROM brain_structures c
-                        JOIN structure_parents sr ON c.id = sr.child_id
-                        WHERE sr.parent_id = $1
-                        """
-
-                    if hierarchy_model:
-                        lower_children_query += " AND sr.hierarchy_model_name = $2"
-                        lower_children = await conn.fetch(lower_children_query, int(child["id"]), hierarchy_model)
-                    else:
-                        lower_children = await conn.fetch(lower_children_query, int(child["id"]))
-
-                    next_level_children.extend(lower_children)
-            current_children = next_level_children
+        ) if not requested.isdisjoint(SYNONYM_FIELDS) else _empty_rows()
+    ]
+    # Answer the hierarchy parts from memory when the index is loaded
+    if index is None and not requested.isdisjoint(RELATION_FIELDS):
+        pending.append(_fetch_structure_relations(queries, structure_id_int, hierarchy_model, requested, window))
+
+    results = await asyncio.gather(*pending)
+    structure, synonyms = results[0], results[1]
+    logger.debug("Fetched brain structure details",
+                 extra={"structure_id": structure_id_int, "hierarchy_model": hierarchy_model,
+                        "found": structure is not None, **SAMPLED})
+    if not structure:
+        return None
+
+    # Time spent assembling the result, including in-memory index lookups
+    build_start = time.perf_counter()
+    if requested.isdisjoint(RELATION_FIELDS):
+        relations = {}
+    elif index is not None:
+        relations = index.describe(structure_id_int, hierarchy_model, requested, window)
+    else:
+        relations = results[2]
 
     # Build the result
     result = {
@@ -322,14 +437,290 @@ async def get_brain_structure_details(structure_id: str, hierarchy_model: str =
                 "pubmed_hit_count": s["pubmed_hit_count"]
             } for s in synonyms
         ],
-        "parents": [{"structure_id": p["id"], "name": p["standard_name"]} for p in parents],
-        "children": [{"structure_id": c["id"], "name": c["standard_name"]} for c in children],
-        "hierarchy": {
-            "ancestors": [{"structure_id": a["id"], "name": a["standard_name"]} for a in ancestors],
-            "descendants": [{"structure_id": d["id"], "name": d["standard_name"]} for d in descendants]
-        },
-        "hierarchy_models": [model["hierarchy_model_name"] for model in hierarchy_models],
-        "current_hierarchy_model": hierarchy_model
+        **relations
     }
-    print(f"Returning details for brain structure: {result['name']}")
+    if fields is not None:
+        result = {key: value for key, value in result.items() if key == "structure_id" or key in requested}
+    record("build", time.perf_counter() - build_start)
     return result
+
+@cached(structure_details_cache, key=_structure_details_key)
+async def get_brain_structure_details_json(structure_id: str, hierarchy_model: str = None, fields: frozenset = None,
+                                           window=FULL_HIERARCHY):
+    """
+    Fetches detailed information about a specific brain structure as a serialized JSON document.
+
+    Args:
+        structure_id (str): The ID of the brain structure.
+        hierarchy_model (str, optional): The hierarchy model to use for the relationship tree.
+        fields (frozenset, optional): The top-level fields to return. Defaults to all fields.
+        window (HierarchyWindow, optional): The depth limit and page of the transitive hierarchy.
+
+    Returns:
+        bytes: The structure's details (see get_brain_structure_details) encoded as JSON.
+        None: If the structure is not found.
+    """
+    structure = await get_brain_structure_details(structure_id, hierarchy_model, fields, window)
+    if structure is None:
+        return None
+    return dumps(structure)
+
+@coalesce(key=_structure_children_key)
+async def get_brain_structure_children(structure_id: str, hierarchy_model: str = None):
+    """
+    Fetches the direct children of a brain structure, for expanding a hierarchy tree one level at a time.
+
+    Args:
+        structure_id (str): The ID of the brain structure.
+        hierarchy_model (str, optional): The hierarchy model to follow. Defaults to the
+            first hierarchy model that contains the structure.
+
+    Returns:
+        dict: The structure_id, the current_hierarchy_model and the children, each with
+              has_children, child_count and descendant_count.
+        None: If the structure is not found.
+    """
+    pool = get_pool()
+    if pool is None:
+        raise Exception("Database connection not available")
+
+    try:
+        structure_id_int = int(structure_id)
+    except ValueError:
+        raise ValueError(f"Invalid structure ID: {structure_id} - must be an integer")
+
+    index = get_hierarchy_index()
+    if index is not None and structure_id_int in index.positions:
+        with span("build"):
+            children = index.describe_children(structure_id_int, hierarchy_model)
+    else:
+        # Structures outside every hierarchy still need a lookup to tell a leaf from a missing structure
+        async with acquire(pool) as conn:
+            children = await fetch_children(conn, structure_id_int, hierarchy_model)
+        if children is None:
+            return None
+
+    return {"structure_id": structure_id_int, **children}
+
+@cached(structure_children_cache, key=_structure_children_key)
+async def get_brain_structure_children_json(structure_id: str, hierarchy_model: str = None):
+    """
+    Fetches the direct children of a brain structure as a serialized JSON document.
+
+    Args:
+        structure_id (str): The ID of the brain structure.
+        hierarchy_model (str, optional): The hierarchy model to follow.
+
+    Returns:
+        bytes: The children (see get_brain_structure_children) encoded as JSON.
+        None: If the structure is not found.
+    """
+    children = await get_brain_structure_children(structure_id, hierarchy_model)
+    if children is None:
+        return None
+    return dumps(children)
+
+async def get_subtree_members(structure_id: str, candidate_ids: list, hierarchy_model: str = None):
+    """
+    Picks the structures that lie below a brain structure, e.g. to filter results to a region.
+
+    Args:
+        structure_id (str): The ID of the brain structure whose subtree is tested.
+        candidate_ids (list): The integer IDs of the structures to test.
+        hierarchy_model (str, optional): The hierarchy model to follow. Defaults to the
+            first hierarchy model that contains the structure.
+
+    Returns:
+        dict: The structure_id, the current_hierarchy_model and the "contained" candidate IDs.
+        None: If the structure is not found.
+    """
+    pool = get_pool()
+    if pool is None:
+        raise Exception("Database connection not available")
+
+    try:
+        structure_id_int = int(structure_id)
+    except ValueError:
+        raise ValueError(f"Invalid structure ID: {structure_id} - must be an integer")
+
+    index = get_hierarchy_index()
+    if index is not None and structure_id_int in index.positions:
+        # Answered from the interval labels, without walking the hierarchy
+        with span("build"):
+            members = index.subtree_members(structure_id_int, candidate_ids, hierarchy_model)
+    else:
+        async with acquire(pool) as conn:
+            members = await fetch_subtree_members(conn, structure_id_int, candidate_ids, hierarchy_model)
+        if members is None:
+            return None
+
+    return {"structure_id": structure_id_int, **members}
+
+# Parents and children of a batch of structures. Without an explicit hierarchy
+# model, each structure uses the first model (by name) that contains it. One
+# "model" row per structure reports the model used.
+BATCH_RELATIONS_QUERY = """
+    WITH requested AS (
+        SELECT r.id, COALESCE($2::text, (
+            SELECT MIN(sp.hierarchy_model_name COLLATE "C")
+            FROM structure_parents sp
+            WHERE sp.child_id = r.id OR sp.parent_id = r.id
+        )) AS model
+        FROM unnest($1::int[]) AS r(id)
+    )
+    SELECT 'model' AS relation, r.id AS structure_id, r.model, NULL::int AS id, NULL::text AS standard_name
+    FROM requested r
+    UNION ALL
+    SELECT 'parent', r.id, r.model, p.id, p.standard_name
+    FROM requested r
+    JOIN structure_parents sr ON sr.child_id = r.id AND sr.hierarchy_model_name = r.model
+    JOIN brain_structures p ON p.id = sr.parent_id
+    UNION ALL
+    SELECT 'child', r.id, r.model, c.id, c.standard_name
+    FROM requested r
+    JOIN structure_parents sr ON sr.parent_id = r.id AND sr.hierarchy_model_name = r.model
+    JOIN brain_structures c ON c.id = sr.child_id
+    """
+
+# The parts of a structure's details included in batch responses
+BATCH_RELATION_FIELDS = frozenset(["parents", "children", "current_hierarchy_model"])
+
+async def get_brain_structure_batch(structure_ids: list, hierarchy_model: str = None) -> dict:
+    """
+    Fetches the details of many brain structures with one set-based query per part.
+
+    The transitive hierarchy and the list of available hierarchy models are not
+    included; they are available per structure from get_brain_structure_details.
+
+    Args:
+        structure_ids (list): The integer IDs of the brain structures.
+        hierarchy_model (str, optional): The hierarchy model for parents and children.
+            Defaults, per structure, to the first hierarchy model that contains it.
+
+    Returns:
+        dict: The details of each structure by ID, in the given order: name, acronym,
+              description, synonyms, parents, children and current_hierarchy_model.
+              Structures that are not found map to None.
+    """
+    pool = get_pool()
+    if pool is None:
+        raise Exception("Database connection not available")
+
+    structure_ids = list(dict.fromkeys(structure_ids))
+    queries = QueryFanOut(pool, config.DETAIL_QUERY_CONCURRENCY)
+    index = get_hierarchy_index()
+    pending = [
+        queries.fetch(
+            "batch_structures",
+            """
+            SELECT id, neuronames_id, standard_name, standard_acronym, definition, brain_info_url, structure_type
+            FROM brain_structures
+            WHERE id = ANY($1::int[])
+            """,
+            structure_ids
+        ),
+        queries.fetch(
+            "batch_synonyms",
+            """
+            SELECT brain_structure_id, synonym_name, synonym_language, organism, synonym_source,
+                   source_title, pubmed_hit_count
+            FROM synonyms
+            WHERE brain_structure_id = ANY($1::int[])
+            """,
+            structure_ids
+        )
+    ]
+    # Answer the hierarchy parts from memory when the index is loaded
+    if index is None:
+        pending.append(queries.fetch("batch_relations", BATCH_RELATIONS_QUERY, structure_ids, hierarchy_model))
+
+    results = await asyncio.gather(*pending)
+    build_start = time.perf_counter()
+    structures = {row["id"]: row for row in results[0]}
+
+    synonyms = {}
+    for s in results[1]:
+        synonyms.setdefault(s["brain_structure_id"], []).append(s)
+
+    if index is None:
+        relations = {
+            structure_id: {"parents": [], "children": [], "current_hierarchy_model": None}
+            for structure_id in structure_ids
+        }
+        for r in results[2]:
+            entry = relations[r["structure_id"]]
+            if r["relation"] == "model":
+                entry["current_hierarchy_model"] = r["model"]
+            else:
+                key = "parents" if r["relation"] == "parent" else "children"
+                entry[key].append({"structure_id": r["id"], "name": r["standard_name"]})
+    else:
+        relations = {}
+        for structure_id in structures:
+            described = index.describe(structure_id, hierarchy_model, BATCH_RELATION_FIELDS)
+            relations[structure_id] = {key: described[key] for key in BATCH_RELATION_FIELDS}
+
+    batch = {}
+    for structure_id in structure_ids:
+        structure = structures.get(structure_id)
+        if structure is None:
+            batch[structure_id] = None
+            continue
+        structure_synonyms = synonyms.get(structure_id, [])
+        batch[structure_id] = {
+            "structure_id": structure["id"],
+            "name": structure["standard_name"],
+            "acronym": structure["standard_acronym"],
+            "description": structure["definition"],
+            "brain_info_url": structure["brain_info_url"],
+            "structure_type": structure["structure_type"],
+            "neuronames_id": structure["neuronames_id"],
+            "synonyms": [s["synonym_name"] for s in structure_synonyms],
+            "synonym_details": [
+                {
+                    "name": s["synonym_name"],
+                    "language": s["synonym_language"],
+                    "organism": s["organism"],
+                    "source": s["synonym_source"],
+                    "source_title": s["source_title"],
+                    "pubmed_hit_count": s["pubmed_hit_count"]
+                } for s in structure_synonyms
+            ],
+            "parents": relations[structure_id]["parents"],
+            "children": relations[structure_id]["children"],
+            "current_hierarchy_model": relations[structure_id]["current_hierarchy_model"]
+        }
+    record("build", time.perf_counter() - build_start)
+    return batch
+
+async def find_common_ancestor(a: int, b: int, hierarchy_model: str = None, with_path: bool = False):
+    """
+    Finds the lowest common ancestor of two brain structures, from the in-memory
+    hierarchy index when it is loaded and from the part of the hierarchy above
+    them in the database otherwise.
+
+    Args:
+        a (int): The ID of the first brain structure.
+        b (int): The ID of the second brain structure.
+        hierarchy_model (str, optional): The hierarchy model to follow. Defaults to the
+            first model that contains both structures.
+        with_path (bool, optional): Whether to include the path from a to b through the ancestor.
+
+    Returns:
+        dict: The common ancestor and the distances to it (see HierarchyIndex.common_ancestor).
+        None: If either structure is in no hierarchy model.
+    """
+    pool = get_pool()
+    if pool is None:
+        raise Exception("Database connection not available")
+
+    index = get_hierarchy_index()
+    if index is not None:
+        with span("build"):
+            result = index.common_ancestor(a, b, hierarchy_model, with_path)
+    else:
+        async with acquire(pool) as conn:
+            result = await fetch_common_ancestor(conn, a, b, hierarchy_model, with_path)
+    if result is None:
+        return None
+    return {"a": a, "b": b, **result}
@@ -0,0 +1,223 @@
+import asyncio
+import asyncpg
+import logging
+from . import config
+
+logger = logging.getLogger(__name__)
+
+# Whether trigram similarity search is available. Decided when the database
+# connects; when False, searches use plain ILIKE substring matching.
+trigram_enabled = False
+
+# Columns that are searched, with the name of the trigram index managed for each
+TRIGRAM_INDEXES = [
+    ("cognitive_concepts_name_trgm_idx", "cognitive_concepts", "name"),
+    ("brain_structures_standard_name_trgm_idx", "brain_structures", "standard_name"),
+    ("synonyms_synonym_name_trgm_idx", "synonyms", "synonym_name"),
+]
+
+# Background task that creates missing trigram indexes (see setup_trigram_search)
+index_task = None
+
+async def setup_trigram_search(pool):
+    """
+    Detects pg_trgm and enables trigram search if the extension is installed.
+    When config.SEARCH_MANAGE_TRIGRAM is set, the extension is created if needed,
+    and missing trigram indexes are created by a background task, so the
+    connection is usable while they are built.
+
+    Args:
+        pool (asyncpg.pool.Pool): The database connection pool.
+
+    Returns:
+        bool: Whether trigram search is enabled.
+    """
+    global trigram_enabled, index_task
+    trigram_enabled = False
+    await stop_trigram_index_task()
+
+    async with pool.acquire() as conn:
+        installed = await conn.fetchval("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')")
+        if not installed and config.SEARCH_MANAGE_TRIGRAM:
+            try:
+                await conn.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+                installed = True
+            except Exception as e:
+                logger.info("Could not install pg_trgm: %s", e)
+
+    if not installed:
+        logger.info("pg_trgm is not available, using ILIKE search")
+        return False
+
+    # Similarity search works without the indexes, only slower, so it is enabled right away
+    trigram_enabled = True
+    logger.info("Trigram search enabled")
+    if config.SEARCH_MANAGE_TRIGRAM:
+        index_task = asyncio.create_task(_create_trigram_indexes(pool))
+    return True
+
+async def _create_trigram_indexes(pool):
+    """
+    Creates the trigram index of every searched column that has no valid one.
+    An index left invalid by an interrupted or failed concurrent build is
+    dropped and built again.
+    """
+    async with pool.acquire() as conn:
+        for index_name, table, column in TRIGRAM_INDEXES:
+            # Any existing trigram index on the column will do, whatever its name.
+            # Indexes still being built by another session are left alone.
+            indexes = await conn.fetch(
+                """
+                SELECT c.relname AS index_name, i.indisvalid,
+                       EXISTS (
+                           SELECT 1 FROM pg_stat_progress_create_index p
+                           WHERE p.index_relid = i.indexrelid
+                       ) AS building
+                FROM pg_index i
+                JOIN pg_class c ON c.oid = i.indexrelid
+                WHERE i.indrelid = to_regclass($1)
+                  AND pg_get_indexdef(i.indexrelid) LIKE '%gin_trgm_ops%'
+                  AND pg_get_indexdef(i.indexrelid) LIKE '%(' || $2 || ' %'
+                """,
+                table,
+                column
+            )
+            if any(index["indisvalid"] or index["building"] for index in indexes):
+                continue
+            try:
+                for index in indexes:
+                    logger.warning("Dropping invalid trigram index %s", index["index_name"])
+                    await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {_quote_identifier(index['index_name'])}")
+                logger.info("Creating trigram index %s on %s.%s", index_name, table, column)
+                await conn.execute(
+                    f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index_name} "
+                    f"ON {table} USING gin ({column} gin_trgm_ops)"
+                )
+                logger.info("Created trigram index %s", index_name)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Could not create trigram index %s: %s", index_name, e)
+
+def _quote_identifier(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+async def stop_trigram_index_task():
+    """
+    Cancels the background creation of trigram indexes if it is running, e.g.
+    before the connection pool is closed. An index build that is interrupted
+    leaves an invalid index, which is replaced on the next connection.
+    """
+    global index_task
+    if index_task is not None:
+        index_task.cancel()
+        try:
+            await index_task
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.warning("Error creating trigram indexes: %s", e)
+        index_task = None
+
+def _concepts_query(trigram: bool) -> str:
+    """
+    Builds the concept search query. Matches are ranked exact < prefix < substring,
+    followed by trigram-similar names when trigram search is enabled.
+    """
+    fuzzy_match = "OR name % $2" if trigram else ""
+    similarity = "similarity(name, $2) DESC," if trigram else ""
+    return f"""
+        SELECT concept_id, name
+        FROM cognitive_concepts
+        WHERE name ILIKE $1 {fuzzy_match}
+        ORDER BY
+            CASE
+                WHEN lower(name) = lower($2) THEN 0
+                WHEN name ILIKE $3 THEN 1
+                WHEN name ILIKE $1 THEN 2
+                ELSE 3
+            END,
+            {similarity}
+            name
+        LIMIT 20
+        """
+
+def _structures_query(trigram: bool) -> str:
+    """
+    Builds the brain structure search query over standard names and synonyms.
+    Matches are ranked exact < prefix < substring (< trigram-similar), with
+    standard names ahead of synonyms at each level, and each structure is
+    returned once at its best rank.
+    """
+    structure_fuzzy_match = "OR standard_name % $2" if trigram else ""
+    synonym_fuzzy_match = "OR synonym_name % $2" if trigram else ""
+    similarity = "MAX(similarity(m.matched_name, $2)) DESC," if trigram else ""
+    return f"""
+        SELECT bs.id, bs.standard_name
+        FROM (
+            SELECT id AS structure_id, standard_name AS matched_name, 0 AS source_rank
+            FROM brain_structures
+            WHERE standard_name ILIKE $1 {structure_fuzzy_match}
+            UNION ALL
+            SELECT brain_structure_id, synonym_name, 1
+            FROM synonyms
+            WHERE synonym_name ILIKE $1 {synonym_fuzzy_match}
+        ) m
+        JOIN brain_structures bs ON bs.id = m.structure_id
+        GROUP BY bs.id, bs.standard_name
+        ORDER BY MIN(
+            CASE
+                WHEN lower(m.matched_name) = lower($2) THEN 0
+                WHEN m.matched_name ILIKE $3 THEN 2
+                WHEN m.matched_name ILIKE $1 THEN 4
+                ELSE 6
+            END + m.source_rank
+        ), {similarity} bs.standard_name, bs.id
+        LIMIT 20
+        """
+
+def is_trigram_enabled() -> bool:
+    """
+    Returns whether trigram similarity search is currently enabled.
+    """
+    return trigram_enabled
+
+async def _run_search(conn, build_query, name_query: str):
+    """
+    Runs a search query, falling back to ILIKE matching if pg_trgm turns out to be unavailable.
+    """
+    global trigram_enabled
+    args = (f"%{name_query}%", name_query, f"{name_query}%")
+    if trigram_enabled:
+        try:
+            return await conn.fetch(build_query(True), *args)
+        except (asyncpg.exceptions.UndefinedFunctionError, asyncpg.exceptions.UndefinedObjectError) as e:
+            trigram_enabled = False
+            logger.warning("Trigram search failed, falling back to ILIKE search: %s", e)
+    return await conn.fetch(build_query(False), *args)
+
+async def search_concepts(conn, name_query: str):
+    """
+    Searches cognitive concepts by name.
+
+    Args:
+        conn (asyncpg.Connection): The connection to run the query on.
+        name_query (str): The search query string.
+
+    Returns:
+        list: The matching rows (concept_id, name), best matches first.
+    """
+    return await _run_search(conn, _concepts_query, name_query)
+
+async def search_structures(conn, name_query: str):
+    """
+    Searches brain structures by standard name or synonym.
+
+    Args:
+        conn (asyncpg.Connection): The connection to run the query on.
+        name_query (str): The search query string.
+
+    Returns:
+        list: The matching rows (id, standard_name), best matches first.
+    """
+    return await _run_search(conn, _structures_query, name_query)
@@ -0,0 +1,200 @@
+import asyncio
+import logging
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from .metrics import acquire, track_query
+
+logger = logging.getLogger(__name__)
+
+# The indexes that are currently in use. Both are replaced together on
+# rebuild so readers never observe a half-built or mismatched pair.
+concept_index = None
+structure_index = None
+
+# Serializes rebuilds so concurrent requests do not load the data twice.
+# Created on first use so it belongs to the running event loop.
+_rebuild_lock = None
+
+# Longest n-gram kept in the postings lists. Queries up to this length are
+# answered by a single postings lookup; longer queries start from their
+# rarest n-gram and verify each candidate.
+NGRAM_SIZE = 3
+
+class SearchIndex:
+    """
+    In-memory substring index over a list of names.
+
+    Every name is lower-cased and split into all of its 1- to NGRAM_SIZE-character
+    n-grams; each n-gram maps to a postings array of the entries containing it.
+    Results are ranked like the database search: exact < prefix < substring,
+    then by source rank (e.g. standard name before synonym), then by name.
+
+    Entries are numbered in that order within each match tier (by source rank,
+    result name and result ID), so postings arrays are already sorted by rank.
+    A search walks the tiers best first and stops once it has enough results,
+    instead of scoring every entry that contains the query.
+    """
+
+    def __init__(self, entries: list):
+        """
+        Args:
+            entries (list): (result_id, matched_name, result_name, source_rank) tuples.
+                matched_name is the text searched; result_id and result_name are
+                what a match returns, so several entries may share one result.
+        """
+        entries = sorted((e for e in entries if e[1] is not None), key=lambda e: (e[3], e[2] or "", e[0]))
+        self.result_ids = [e[0] for e in entries]
+        self.matched_names = [e[1].lower() for e in entries]
+        self.result_names = [e[2] or "" for e in entries]
+
+        # Entry positions sorted by name, for finding exact and prefix matches by bisection
+        self.name_order = array("l", sorted(range(len(entries)), key=self.matched_names.__getitem__))
+        self.sorted_names = [self.matched_names[position] for position in self.name_order]
+
+        postings = defaultdict(list)
+        prefixes = defaultdict(list)
+        sizes = range(1, NGRAM_SIZE + 1)
+        for position, name in enumerate(self.matched_names):
+            for gram in {name[start:start + size] for size in sizes for start in range(len(name) - size + 1)}:
+                postings[gram].append(position)
+            for size in sizes[:len(name)]:
+                prefixes[name[:size]].append(position)
+        self.postings = {gram: array("l", positions) for gram, positions in postings.items()}
+        # Entries by their first 1 to NGRAM_SIZE characters, so short prefix
+        # queries need no sorting
+        self.prefix_postings = {prefix: array("l", positions) for prefix, positions in prefixes.items()}
+
+    def __len__(self):
+        return len(self.matched_names)
+
+    def _candidates(self, query: str):
+        """
+        Returns the entry positions that may contain the query, using the rarest n-gram.
+        """
+        if not query:
+            return range(len(self.matched_names))
+        if len(query) <= NGRAM_SIZE:
+            return self.postings.get(query, ())
+        smallest = None
+        for start in range(len(query) - NGRAM_SIZE + 1):
+            posting = self.postings.get(query[start:start + NGRAM_SIZE])
+            if posting is None:
+                return ()
+            if smallest is None or len(posting) < len(smallest):
+                smallest = posting
+        return smallest
+
+    def _prefix_matches(self, query: str, exact_end: int):
+        """
+        Returns the positions of the entries whose name starts with, but is not, the query, in rank order.
+        """
+        if not query:
+            return range(len(self.matched_names))
+        if len(query) <= NGRAM_SIZE:
+            return self.prefix_postings.get(query, ())
+        end = bisect_left(self.sorted_names, query + "\U0010ffff", exact_end)
+        return sorted(self.name_order[exact_end:end])
+
+    def search(self, query: str, limit: int = 20) -> list:
+        """
+        Finds the entries whose name contains the query, case-insensitively.
+
+        Args:
+            query (str): The search query string.
+            limit (int): The maximum number of results.
+
+        Returns:
+            list: (result_id, result_name) tuples, best matches first, one per result.
+        """
+        query = query.lower()
+        results = []
+        if limit <= 0:
+            return results
+        seen = set()
+
+        def collect(positions, verify: bool = False) -> bool:
+            # Positions come in rank order, so the first entry seen for a result is its best match
+            for position in positions:
+                result_id = self.result_ids[position]
+                if result_id in seen or (verify and query not in self.matched_names[position]):
+                    continue
+                seen.add(result_id)
+                results.append((result_id, self.result_names[position]))
+                if len(results) >= limit:
+                    return True
+            return False
+
+        exact_start = bisect_left(self.sorted_names, query)
+        exact_end = bisect_right(self.sorted_names, query, exact_start)
+        if collect(sorted(self.name_order[exact_start:exact_end])):
+            return results
+        if collect(self._prefix_matches(query, exact_end)):
+            return results
+        # Prefix matches are skipped here as already seen; candidates found through
+        # an n-gram of a longer query still have to contain the whole query
+        collect(self._candidates(query), verify=len(query) > NGRAM_SIZE)
+        return results
+
+async def rebuild_search_indexes(pool):
+    """
+    Loads concept names, structure names and synonyms and atomically replaces
+    the current search indexes. Call this again whenever the data changes.
+
+    Args:
+        pool (asyncpg.pool.Pool): The database connection pool.
+    """
+    global concept_index, structure_index, _rebuild_lock
+
+    if _rebuild_lock is None:
+        _rebuild_lock = asyncio.Lock()
+    async with _rebuild_lock:
+        async with acquire(pool) as conn:
+            with track_query("search_index_concepts"):
+                concepts = await conn.fetch("SELECT concept_id, name FROM cognitive_concepts")
+            with track_query("search_index_structures"):
+                structures = await conn.fetch("SELECT id, standard_name FROM brain_structures")
+            with track_query("search_index_synonyms"):
+                synonyms = await conn.fetch(
+                    """
+                    SELECT s.brain_structure_id, s.synonym_name, bs.standard_name
+                    FROM synonyms s
+                    JOIN brain_structures bs ON bs.id = s.brain_structure_id
+                    """
+                )
+
+        # Building the postings is CPU-bound, so it runs in a worker thread while
+        # the event loop keeps serving requests from the current indexes
+        new_concept_index, new_structure_index = await asyncio.get_running_loop().run_in_executor(
+            None, _build_indexes, concepts, structures, synonyms
+        )
+        concept_index, structure_index = new_concept_index, new_structure_index
+        logger.info("Built search indexes with %d concept and %d structure names",
+                    len(new_concept_index), len(new_structure_index))
+
+def _build_indexes(concepts: list, structures: list, synonyms: list) -> tuple:
+    concept_index = SearchIndex([(c["concept_id"], c["name"], c["name"], 0) for c in concepts])
+    structure_index = SearchIndex(
+        [(s["id"], s["standard_name"], s["standard_name"], 0) for s in structures]
+        + [(s["brain_structure_id"], s["synonym_name"], s["standard_name"], 1) for s in synonyms]
+    )
+    return concept_index, structure_index
+
+def get_concept_index():
+    """
+    Returns the current concept search index, or None if it has not been built.
+    """
+    return concept_index
+
+def get_structure_index():
+    """
+    Returns the current brain structure search index, or None if it has not been built.
+    """
+    return structure_index
+
+def clear_search_indexes():
+    """
+    Drops the current search indexes, e.g. when the database connection is closed.
+    """
+    global concept_index, structure_index
+    concept_index, structure_index = None, None
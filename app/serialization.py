@@ -0,0 +1,78 @@
+import datetime
+import decimal
+import json
+import uuid
+from fastapi.responses import JSONResponse, Response
+from . import config
+from .timing import span
+
+# orjson is optional; without it (or with FAST_JSON disabled) the standard
+# library encoder is used
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def fast_json_enabled() -> bool:
+    """
+    Returns whether responses are encoded with orjson.
+    """
+    return config.FAST_JSON and orjson is not None
+
+def _default(value):
+    """
+    Encodes the database types that JSON has no type for, the same way with both
+    encoders: dates and times as ISO 8601 strings, UUIDs as strings, and decimals
+    as integers or floats (as FastAPI's jsonable_encoder does).
+    """
+    if isinstance(value, decimal.Decimal):
+        return int(value) if value.as_tuple().exponent >= 0 else float(value)
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def dumps(content) -> bytes:
+    """
+    Serializes content to compact UTF-8 encoded JSON.
+
+    Args:
+        content: A JSON-compatible value (dicts with string keys, lists, str, int, float,
+            bool, None), which may also contain dates, times, decimals and UUIDs.
+
+    Returns:
+        bytes: The encoded JSON document.
+    """
+    with span("serialize"):
+        if fast_json_enabled():
+            return orjson.dumps(content, default=_default)
+        return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+def dumps_members(mapping: dict) -> bytes:
+    """
+    Serializes the members of a JSON object without the enclosing braces, so an
+    object can be streamed in parts joined by commas.
+
+    Args:
+        mapping (dict): The members to encode. Keys are converted to strings.
+
+    Returns:
+        bytes: The encoded members, e.g. b'"1":{...},"2":null'.
+    """
+    return b",".join(dumps(str(key)) + b":" + dumps(value) for key, value in mapping.items())
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response encoded with dumps(), i.e. with orjson when it is enabled.
+    """
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+class RawJSONResponse(Response):
+    """
+    Response for a payload that is already serialized to JSON, sent without re-encoding.
+    """
+
+    media_type = "application/json"
@@ -0,0 +1,81 @@
+import asyncio
+from functools import wraps
+from .timing import RequestTiming, run_timed, merge
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key into one in-flight task.
+
+    While a call for a key is running, further calls for the same key wait for
+    its result instead of starting their own. Once it finishes, the next call
+    starts a new task.
+
+    The task records its Server-Timing phases separately, and every caller adds
+    them to its own request once the task is done. Callers that joined a running
+    task also report a "coalesced" phase, as they waited less than the phases show.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self.started = 0
+        self.shared = 0
+
+    async def do(self, key, func, *args, **kwargs):
+        """
+        Runs func(*args, **kwargs), or joins the call already running for key.
+
+        Args:
+            key: Identifies calls that are interchangeable.
+            func (callable): The coroutine function to run.
+
+        Returns:
+            The result of the shared call. Its exception is raised to every caller.
+        """
+        call = self._calls.get(key)
+        if call is None:
+            self.started += 1
+            timing = RequestTiming()
+            task = asyncio.ensure_future(run_timed(timing, func, *args, **kwargs))
+            self._calls[key] = task, timing
+            task.add_done_callback(lambda done: self._finish(key, done))
+            joined = None
+        else:
+            self.shared += 1
+            task, timing = call
+            joined = "shared"
+        try:
+            # A caller that is cancelled must not cancel the call for the others
+            return await asyncio.shield(task)
+        finally:
+            if task.done():
+                merge(timing, joined)
+
+    def _finish(self, key, task):
+        call = self._calls.get(key)
+        if call is not None and call[0] is task:
+            del self._calls[key]
+        # Mark the exception as retrieved in case every caller was cancelled
+        if not task.cancelled():
+            task.exception()
+
+def coalesce(key):
+    """
+    Decorator that coalesces concurrent identical calls of an async function.
+
+    Args:
+        key (callable): Builds the coalescing key from the function's arguments.
+            Calls with equal keys must be interchangeable.
+
+    Returns:
+        callable: The decorator.
+    """
+    def decorator(func):
+        flight = SingleFlight()
+
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            return await flight.do(key(*args, **kwargs), func, *args, **kwargs)
+
+        wrapper.flight = flight
+        return wrapper
+    return decorator
@@ -0,0 +1,155 @@
+import time
+from contextvars import ContextVar
+from starlette.datastructures import MutableHeaders
+
+# The timing of the request being handled. Tasks started by the request (e.g.
+# with asyncio.gather) inherit it, so concurrent queries are recorded as well.
+_current = ContextVar("request_timing", default=None)
+
+class RequestTiming:
+    """
+    Collects the time one request spends in each phase, for its Server-Timing header.
+    Durations of the same name add up, and the number of entries is kept, so a
+    query that runs once per row shows up with its count.
+    """
+
+    __slots__ = ("start", "durations", "counts", "descriptions")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.durations = {}
+        self.counts = {}
+        self.descriptions = {}
+
+    def add(self, name: str, seconds: float):
+        """
+        Adds a duration to the named phase.
+        """
+        self.durations[name] = self.durations.get(name, 0.0) + seconds
+        self.counts[name] = self.counts.get(name, 0) + 1
+
+    def describe(self, name: str, description: str):
+        """
+        Records a phase without a duration, e.g. whether the response cache was hit.
+        """
+        self.descriptions[name] = description
+
+    def merge(self, other: "RequestTiming"):
+        """
+        Adds the phases recorded by other, e.g. by a call shared with other requests.
+        """
+        for name, seconds in other.durations.items():
+            self.durations[name] = self.durations.get(name, 0.0) + seconds
+            self.counts[name] = self.counts.get(name, 0) + other.counts[name]
+        self.descriptions.update(other.descriptions)
+
+    def header(self) -> str:
+        """
+        Formats the collected phases as a Server-Timing header value (durations in
+        milliseconds). Queries also get a "db" total with the number of queries run.
+        """
+        metrics = [f'{name};desc="{description}"' for name, description in self.descriptions.items()]
+        queries, query_time = 0, 0.0
+        for name, seconds in self.durations.items():
+            count = self.counts[name]
+            if name.startswith("db-"):
+                queries += count
+                query_time += seconds
+            description = f';desc="{count}x"' if count > 1 else ""
+            metrics.append(f"{name}{description};dur={seconds * 1000:.2f}")
+        if queries:
+            label = "query" if queries == 1 else "queries"
+            metrics.append(f'db;desc="{queries} {label}";dur={query_time * 1000:.2f}')
+        metrics.append(f"total;dur={(time.perf_counter() - self.start) * 1000:.2f}")
+        return ", ".join(metrics)
+
+def record(name: str, seconds: float):
+    """
+    Adds a duration to the named phase of the current request, if it is being timed.
+    """
+    timing = _current.get()
+    if timing is not None:
+        timing.add(name, seconds)
+
+def describe(name: str, description: str):
+    """
+    Records a phase without a duration for the current request, if it is being timed.
+    """
+    timing = _current.get()
+    if timing is not None:
+        timing.describe(name, description)
+
+async def run_timed(timing: RequestTiming, func, *args, **kwargs):
+    """
+    Runs func(*args, **kwargs), recording its phases in timing instead of in the
+    current request's timing. Meant to run as a task of its own, whose context
+    is a copy, so the current request's timing is left in place.
+    """
+    _current.set(timing)
+    return await func(*args, **kwargs)
+
+def merge(timing: RequestTiming, description: str = None):
+    """
+    Adds the phases of timing to the current request, if it is being timed, and
+    with a description, reports them as a "coalesced" phase.
+    """
+    current = _current.get()
+    if current is not None:
+        current.merge(timing)
+        if description is not None:
+            current.describe("coalesced", description)
+
+class span:
+    """
+    Context manager that records the time spent in its block under a phase name
+    of the current request:
+
+        with span("build"):
+            result = {...}
+    """
+
+    __slots__ = ("name", "timing", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.timing = _current.get()
+        if self.timing is not None:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.timing is not None:
+            self.timing.add(self.name, time.perf_counter() - self.start)
+        return False
+
+class ServerTimingMiddleware:
+    """
+    ASGI middleware that adds a Server-Timing header to responses under path_prefix,
+    with the time spent waiting for connections, per named query, building and
+    serializing the result. Work done after the headers are sent (the rest of a
+    streamed body) is not included.
+    """
+
+    def __init__(self, app, path_prefix: str = "/api"):
+        self.app = app
+        self.path_prefix = path_prefix
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.path_prefix):
+            await self.app(scope, receive, send)
+            return
+
+        timing = RequestTiming()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).append("Server-Timing", timing.header())
+            await send(message)
+
+        token = _current.set(timing)
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
@@ -0,0 +1,7 @@
+"""
+Benchmarks for the Cognitive Viewer API.
+
+    python -m benchmarks.generate --dsn ... --replace   # load a synthetic dataset
+    python -m benchmarks.run --dsn ... --url ...        # measure every endpoint
+    python -m benchmarks.compare baseline.json new.json # compare two runs
+"""
@@ -0,0 +1,91 @@
+import argparse
+import json
+import sys
+
+# Compared metrics, and whether a higher value is better
+COMPARED_METRICS = (
+    ("p50_ms", False),
+    ("p95_ms", False),
+    ("p99_ms", False),
+    ("throughput_rps", True),
+)
+
+def compare_results(baseline: dict, current: dict, threshold: float = 10.0) -> list:
+    """
+    Compares two benchmark results endpoint by endpoint.
+
+    Args:
+        baseline (dict): The earlier result, as written by python -m benchmarks.run.
+        current (dict): The newer result.
+        threshold (float, optional): The change, in percent, beyond which a
+            metric counts as a regression or an improvement.
+
+    Returns:
+        list: One dict per endpoint and metric with the baseline and current values,
+              the change in percent and a status of "regression", "improvement" or "ok".
+              Endpoints that errored in only one of the runs are reported as "errors".
+    """
+    rows = []
+    for endpoint, before in baseline["endpoints"].items():
+        after = current["endpoints"].get(endpoint)
+        if after is None:
+            continue
+        if bool(before["errors"]) != bool(after["errors"]):
+            rows.append({"endpoint": endpoint, "metric": "errors", "baseline": before["errors"],
+                         "current": after["errors"], "change_pct": None,
+                         "status": "regression" if after["errors"] else "improvement"})
+        for metric, higher_is_better in COMPARED_METRICS:
+            old, new = before.get(metric), after.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old * 100
+            worse = -change if higher_is_better else change
+            if worse > threshold:
+                status = "regression"
+            elif worse < -threshold:
+                status = "improvement"
+            else:
+                status = "ok"
+            rows.append({"endpoint": endpoint, "metric": metric, "baseline": old, "current": new,
+                         "change_pct": round(change, 1), "status": status})
+    return rows
+
+def format_comparison(rows: list) -> str:
+    """
+    Formats compared metrics as a plain text table.
+    """
+    lines = [f"{'endpoint':<24} {'metric':<15} {'baseline':>12} {'current':>12} {'change':>9}  status"]
+    for row in rows:
+        change = "" if row["change_pct"] is None else f"{row['change_pct']:+.1f}%"
+        lines.append(f"{row['endpoint']:<24} {row['metric']:<15} {row['baseline']:>12} {row['current']:>12} "
+                     f"{change:>9}  {row['status']}")
+    return "\n".join(lines)
+
+def main():
+    """
+    Command-line entry point: python -m benchmarks.compare BASELINE CURRENT [--threshold PCT]
+    Exits with status 1 if any metric regressed beyond the threshold.
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.compare",
+        description="Compare two benchmark results written by python -m benchmarks.run."
+    )
+    parser.add_argument("baseline", help="The earlier result file")
+    parser.add_argument("current", help="The newer result file")
+    parser.add_argument("--threshold", type=float, default=10.0,
+                        help="Change in percent that counts as a regression (default: 10)")
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    rows = compare_results(baseline, current, args.threshold)
+    print(format_comparison(rows))
+    regressions = [row for row in rows if row["status"] == "regression"]
+    if regressions:
+        print(f"\n{len(regressions)} metric(s) regressed by more than {args.threshold}%")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+import argparse
+import asyncio
+import random
+import asyncpg
+from app.closure import build_closure, drop_closure
+
+# Tables created by the generator, in dependency order
+TABLES = (
+    "concept_classes", "cognitive_concepts", "tasks", "relationships",
+    "brain_structures", "structure_parents", "synonyms"
+)
+
+SCHEMA_DDL = """
+    CREATE TABLE concept_classes (
+        concept_class_id VARCHAR PRIMARY KEY,
+        name VARCHAR NOT NULL,
+        description TEXT
+    );
+    CREATE TABLE cognitive_concepts (
+        concept_id VARCHAR PRIMARY KEY,
+        name VARCHAR NOT NULL,
+        definition_text TEXT,
+        concept_class VARCHAR REFERENCES concept_classes(concept_class_id)
+    );
+    CREATE TABLE tasks (
+        task_id VARCHAR PRIMARY KEY,
+        name VARCHAR NOT NULL,
+        description TEXT
+    );
+    CREATE TABLE relationships (
+        concept_id VARCHAR REFERENCES cognitive_concepts(concept_id),
+        related_concept_id VARCHAR,
+        relationship VARCHAR NOT NULL,
+        direction VARCHAR NOT NULL,
+        PRIMARY KEY (concept_id, related_concept_id, relationship)
+    );
+    CREATE TABLE brain_structures (
+        id INTEGER PRIMARY KEY,
+        neuronames_id INTEGER,
+        standard_name VARCHAR NOT NULL,
+        standard_acronym VARCHAR,
+        definition TEXT,
+        brain_info_url TEXT,
+        structure_type VARCHAR
+    );
+    CREATE TABLE structure_parents (
+        parent_id INTEGER REFERENCES brain_structures(id),
+        child_id INTEGER REFERENCES brain_structures(id),
+        hierarchy_model_name VARCHAR NOT NULL,
+        PRIMARY KEY (hierarchy_model_name, parent_id, child_id)
+    );
+    CREATE TABLE synonyms (
+        id SERIAL PRIMARY KEY,
+        brain_structure_id INTEGER REFERENCES brain_structures(id),
+        synonym_name VARCHAR NOT NULL,
+        synonym_language VARCHAR,
+        organism VARCHAR,
+        synonym_source VARCHAR,
+        source_title VARCHAR,
+        pubmed_hit_count INTEGER
+    );
+    """
+
+# Created after loading, as a production database would have them
+INDEXES_DDL = """
+    CREATE INDEX idx_structure_parents_child ON structure_parents (child_id, hierarchy_model_name);
+    CREATE INDEX idx_structure_parents_parent ON structure_parents (parent_id, hierarchy_model_name);
+    CREATE INDEX idx_synonyms_structure ON synonyms (brain_structure_id);
+    CREATE INDEX idx_relationships_concept ON relationships (concept_id);
+    """
+
+# Vocabulary for plausible, prefix-searchable names
+POSITIONS = ["anterior", "posterior", "medial", "lateral", "dorsal", "ventral", "superior", "inferior",
+             "rostral", "caudal", "central", "intermediate"]
+REGIONS = ["hippocampal", "thalamic", "cortical", "striatal", "amygdaloid", "cerebellar", "pontine",
+           "olfactory", "temporal", "frontal", "parietal", "occipital", "insular", "cingulate",
+           "hypothalamic", "septal", "tegmental", "collicular", "vestibular", "cochlear"]
+PARTS = ["nucleus", "gyrus", "sulcus", "area", "field", "layer", "tract", "lobule", "complex",
+         "formation", "commissure", "fasciculus"]
+STRUCTURE_TYPES = ["gray matter", "white matter", "ventricle", "superstructure"]
+LANGUAGES = ["en", "en", "en", "la", "de", "fr"]
+ORGANISMS = [None, "human", "macaque", "rat", "mouse"]
+SOURCES = ["NeuroNames", "Paxinos", "Swanson", "Terminologia Anatomica", "BrainInfo"]
+
+QUALIFIERS = ["working", "episodic", "semantic", "spatial", "visual", "auditory", "selective",
+              "sustained", "inhibitory", "emotional", "procedural", "verbal", "motor", "social",
+              "temporal", "divided", "implicit", "explicit"]
+FACULTIES = ["memory", "attention", "control", "perception", "learning", "recognition", "processing",
+             "reasoning", "imagery", "regulation", "planning", "retrieval", "encoding", "awareness"]
+CONCEPT_RELATIONS = [("KINDOF", "parent"), ("KINDOF", "child"), ("PARTOF", "parent"), ("PARTOF", "child")]
+
+def _unique_name(rng: random.Random, seen: dict, words: list) -> str:
+    """
+    Joins one random word from each list, numbering repeats so names stay unique.
+    """
+    name = " ".join(rng.choice(choices) for choices in words)
+    seen[name] = seen.get(name, 0) + 1
+    return name if seen[name] == 1 else f"{name} {seen[name]}"
+
+def generate_structures(rng: random.Random, count: int, synonyms_per_structure: float) -> tuple:
+    """
+    Generates brain structures and their synonyms.
+
+    Returns:
+        tuple: The brain_structures rows and the synonyms rows.
+    """
+    structures, synonyms, seen = [], [], {}
+    for structure_id in range(1, count + 1):
+        name = _unique_name(rng, seen, [POSITIONS, REGIONS, PARTS]).capitalize()
+        acronym = "".join(word[0] for word in name.split() if word.isalpha()).upper() + str(structure_id)
+        structures.append((
+            structure_id, structure_id, name, acronym,
+            f"The {name.lower()} of the synthetic benchmark brain.",
+            f"http://braininfo.example.org/centraldirectory.aspx?ID={structure_id}",
+            rng.choice(STRUCTURE_TYPES)
+        ))
+        for _ in range(rng.randint(0, round(2 * synonyms_per_structure))):
+            position, region, part = name.lower().split(" ")[:3]
+            synonym = rng.choice([
+                f"{region} {part} ({position})", f"{part} {region}is {position}",
+                f"{position} {region} {part}", f"{region} {part}"
+            ])
+            synonyms.append((
+                structure_id, synonym, rng.choice(LANGUAGES), rng.choice(ORGANISMS), rng.choice(SOURCES),
+                f"{rng.choice(SOURCES)} atlas", rng.randint(0, 5000)
+            ))
+    return structures, synonyms
+
+def generate_hierarchy(rng: random.Random, structure_ids: list, model: str, depth: int, fanout: int,
+                       roots: int, extra_parent_rate: float) -> list:
+    """
+    Generates one hierarchy model as a breadth-first tree over the given structures.
+    Each structure gets between 1 and 2 * fanout - 1 children until depth levels
+    are filled or the structures run out. A share of the structures also gets a
+    second parent from a shallower level, as in atlases that classify a structure
+    in two places. Edges always point to a deeper level, so there are no cycles.
+
+    Returns:
+        list: The structure_parents rows (parent_id, child_id, hierarchy_model_name).
+    """
+    remaining = list(structure_ids)
+    level = remaining[:roots]
+    del remaining[:roots]
+    levels = [level]
+    edges = []
+    while remaining and len(levels) < depth:
+        next_level = []
+        for parent in level:
+            children = remaining[:rng.randint(1, 2 * fanout - 1)]
+            del remaining[:len(children)]
+            edges.extend((parent, child, model) for child in children)
+            next_level.extend(children)
+            if not remaining:
+                break
+        levels.append(next_level)
+        level = next_level
+
+    existing = set((parent, child) for parent, child, _ in edges)
+    for depth_index in range(2, len(levels)):
+        for child in levels[depth_index]:
+            if rng.random() < extra_parent_rate:
+                parent = rng.choice(levels[rng.randrange(depth_index)])
+                if (parent, child) not in existing:
+                    existing.add((parent, child))
+                    edges.append((parent, child, model))
+    return edges
+
+def generate_concepts(rng: random.Random, concept_count: int, task_count: int, class_count: int,
+                      relationships_per_concept: float) -> tuple:
+    """
+    Generates concept classes, cognitive concepts, tasks and the relationships between them.
+
+    Returns:
+        tuple: The concept_classes, cognitive_concepts, tasks and relationships rows.
+    """
+    classes = [
+        (f"ctp_C{n}", f"{FACULTIES[n % len(FACULTIES)].capitalize()} class {n}", f"Synthetic concept class {n}")
+        for n in range(1, class_count + 1)
+    ]
+    concepts, seen = [], {}
+    for n in range(1, concept_count + 1):
+        name = _unique_name(rng, seen, [QUALIFIERS, FACULTIES]).capitalize()
+        concept_class = rng.choice(classes)[0] if rng.random() < 0.9 else None
+        concepts.append((f"trm_{n:06d}", name, f"{name} is a synthetic benchmark concept.", concept_class))
+    tasks, seen = [], {}
+    for n in range(1, task_count + 1):
+        name = _unique_name(rng, seen, [QUALIFIERS, FACULTIES]).capitalize() + " task"
+        tasks.append((f"tsk_{n:06d}", name, f"Measures {name[:-5].lower()}."))
+
+    relationships = {}
+    for concept_id, *_ in concepts:
+        for _ in range(rng.randint(0, round(2 * relationships_per_concept))):
+            if tasks and rng.random() < 0.4:
+                related, relationship, direction = rng.choice(tasks)[0], "MEASUREDBY", "child"
+            else:
+                related = rng.choice(concepts)[0]
+                relationship, direction = rng.choice(CONCEPT_RELATIONS)
+            if related != concept_id:
+                relationships[(concept_id, related, relationship)] = direction
+    relationships = [key + (direction,) for key, direction in relationships.items()]
+    return classes, concepts, tasks, relationships
+
+async def generate_dataset(conn, args) -> dict:
+    """
+    Replaces the application tables with a synthetic dataset.
+
+    Args:
+        conn (asyncpg.Connection): The connection to load the dataset on.
+        args (argparse.Namespace): The generator settings (see main).
+
+    Returns:
+        dict: The number of rows loaded into each table.
+    """
+    rng = random.Random(args.seed)
+    structures, synonyms = generate_structures(rng, args.structures, args.synonyms)
+    structure_ids = [row[0] for row in structures]
+
+    edges = []
+    for n in range(args.models):
+        model = f"Model{n + 1}"
+        # The first model covers every structure; the others a shuffled subset,
+        # so the models disagree about where structures belong
+        if n == 0:
+            members = structure_ids
+        else:
+            members = rng.sample(structure_ids, round(len(structure_ids) * args.model_coverage))
+        edges.extend(generate_hierarchy(rng, members, model, args.depth, args.fanout, args.roots,
+                                        args.extra_parent_rate))
+
+    classes, concepts, tasks, relationships = generate_concepts(
+        rng, args.concepts, args.tasks, args.concept_classes, args.relationships
+    )
+
+    rows = {
+        "concept_classes": classes,
+        "cognitive_concepts": concepts,
+        "tasks": tasks,
+        "relationships": relationships,
+        "brain_structures": structures,
+        "structure_parents": edges,
+        "synonyms": synonyms,
+    }
+    columns = {
+        "synonyms": ["brain_structure_id", "synonym_name", "synonym_language", "organism", "synonym_source",
+                     "source_title", "pubmed_hit_count"],
+    }
+    async with conn.transaction():
+        # The closure table and its triggers would be left stale by the reload
+        await drop_closure(conn)
+        await conn.execute(f"DROP TABLE IF EXISTS {', '.join(TABLES)} CASCADE")
+        await conn.execute(SCHEMA_DDL)
+        for table in TABLES:
+            await conn.copy_records_to_table(table, records=rows[table], columns=columns.get(table))
+        await conn.execute(INDEXES_DDL)
+    await conn.execute("ANALYZE")
+    return {table: len(rows[table]) for table in TABLES}
+
+async def _existing_rows(conn) -> int:
+    """
+    Returns the number of rows in the application tables that already exist.
+    """
+    total = 0
+    for table in TABLES:
+        if await conn.fetchval("SELECT to_regclass($1) IS NOT NULL", table):
+            total += await conn.fetchval(f"SELECT COUNT(*) FROM {table}")
+    return total
+
+async def _main(args):
+    conn = await asyncpg.connect(args.dsn)
+    try:
+        existing = await _existing_rows(conn)
+        if existing and not args.replace:
+            raise SystemExit(
+                f"The database already holds {existing} rows in the application tables. "
+                "Use a dedicated benchmark database, or pass --replace to drop them."
+            )
+        counts = await generate_dataset(conn, args)
+        for table, count in counts.items():
+            print(f"{table}: {count} rows")
+        if args.closure:
+            print(f"structure_closure: {await build_closure(conn)} rows")
+    finally:
+        await conn.close()
+
+def main():
+    """
+    Command-line entry point: python -m benchmarks.generate [--dsn DSN] [options]
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.generate",
+        description="Load a reproducible synthetic dataset into a benchmark database. "
+                    "The same settings and seed always produce the same data."
+    )
+    parser.add_argument("--dsn", default=None,
+                        help="PostgreSQL connection URL. Defaults to the standard PG* environment variables.")
+    parser.add_argument("--replace", action="store_true",
+                        help="Drop the application tables if they already hold data")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed (default: 42)")
+    parser.add_argument("--structures", type=int, default=3000, help="Brain structures (default: 3000)")
+    parser.add_argument("--synonyms", type=float, default=5.0,
+                        help="Average synonyms per structure (default: 5)")
+    parser.add_argument("--models", type=int, default=3, help="Hierarchy models (default: 3)")
+    parser.add_argument("--model-coverage", type=float, default=0.6,
+                        help="Share of the structures placed in each model after the first (default: 0.6)")
+    parser.add_argument("--depth", type=int, default=10, help="Maximum hierarchy depth (default: 10)")
+    parser.add_argument("--fanout", type=int, default=4, help="Average children per structure (default: 4)")
+    parser.add_argument("--roots", type=int, default=1, help="Root structures per model (default: 1)")
+    parser.add_argument("--extra-parent-rate", type=float, default=0.02,
+                        help="Share of structures with a second parent (default: 0.02)")
+    parser.add_argument("--concepts", type=int, default=1000, help="Cognitive concepts (default: 1000)")
+    parser.add_argument("--tasks", type=int, default=800, help="Tasks (default: 800)")
+    parser.add_argument("--concept-classes", type=int, default=10, help="Concept classes (default: 10)")
+    parser.add_argument("--relationships", type=float, default=4.0,
+                        help="Average relationships per concept (default: 4)")
+    parser.add_argument("--closure", action="store_true",
+                        help="Also build the structure_closure table (see python -m app.closure)")
+    asyncio.run(_main(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
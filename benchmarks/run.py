@@ -0,0 +1,277 @@
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import subprocess
+import time
+import urllib.parse
+import asyncpg
+from .compare import compare_results, format_comparison
+from .fixtures import load_fixtures, connect_payload
+from .stats import summarize
+
+# httpx is only needed for benchmarking; it is not a dependency of the application
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+def _pick(items: list, i: int):
+    return items[i % len(items)]
+
+def _query(path: str, **params) -> str:
+    params = {key: value for key, value in params.items() if value is not None}
+    return f"{path}?{urllib.parse.urlencode(params)}" if params else path
+
+# Each scenario builds its i-th request from the fixtures: (method, path, JSON body)
+SCENARIOS = {
+    "home": lambda fx, i: ("GET", "/", None),
+    "connection_status": lambda fx, i: ("GET", "/api/connection_status", None),
+    "pool_status": lambda fx, i: ("GET", "/api/pool_status", None),
+    "search": lambda fx, i: ("GET", _query("/api/search", query=_pick(fx.concept_prefixes, i)), None),
+    "concept": lambda fx, i: ("GET", f"/api/concept/{_pick(fx.concept_ids, i)}", None),
+    "brain_search": lambda fx, i: (
+        "GET", _query("/api/brain-search", query=_pick(fx.structure_prefixes, i)), None
+    ),
+    "structure": lambda fx, i: ("GET", f"/api/brain-structure/{_pick(fx.structure_ids, i)}", None),
+    "structure_model": lambda fx, i: (
+        "GET", _query(f"/api/brain-structure/{_pick(fx.hierarchy_members, i)[0]}",
+                      hierarchy_model=_pick(fx.hierarchy_members, i)[1]), None
+    ),
+    "structure_fields": lambda fx, i: (
+        "GET", _query(f"/api/brain-structure/{_pick(fx.structure_ids, i)}", fields="name,parents,children"), None
+    ),
+    "structure_page": lambda fx, i: (
+        "GET", _query(f"/api/brain-structure/{_pick(fx.hierarchy_members, i)[0]}",
+                      hierarchy_model=_pick(fx.hierarchy_members, i)[1], max_depth=2, limit=20), None
+    ),
+    "children": lambda fx, i: (
+        "GET", _query(f"/api/brain-structure/{_pick(fx.hierarchy_members, i)[0]}/children",
+                      hierarchy_model=_pick(fx.hierarchy_members, i)[1]), None
+    ),
+    "contains": lambda fx, i: (
+        "GET", _query(f"/api/brain-structure/{_pick(fx.structure_pairs, i)[0]}/contains/"
+                      f"{_pick(fx.structure_pairs, i)[1]}", hierarchy_model=_pick(fx.structure_pairs, i)[2]), None
+    ),
+    "subtree": lambda fx, i: (
+        "GET", _query(f"/api/brain-structure/{_pick(fx.hierarchy_members, i)[0]}/subtree",
+                      ids=",".join(str(_pick(fx.structure_ids, i + n)) for n in range(50)),
+                      hierarchy_model=_pick(fx.hierarchy_members, i)[1]), None
+    ),
+    "lca": lambda fx, i: (
+        "GET", _query("/api/brain-structure/lca", a=_pick(fx.structure_pairs, i)[0],
+                      b=_pick(fx.structure_pairs, i)[1], hierarchy_model=_pick(fx.structure_pairs, i)[2]), None
+    ),
+    "path": lambda fx, i: (
+        "GET", _query("/api/brain-structure/path", a=_pick(fx.structure_pairs, i)[0],
+                      b=_pick(fx.structure_pairs, i)[1], hierarchy_model=_pick(fx.structure_pairs, i)[2]), None
+    ),
+    "batch": lambda fx, i: (
+        "POST", "/api/brain-structure/batch",
+        {"ids": [_pick(fx.structure_ids, i * 100 + n) for n in range(100)]}
+    ),
+    "hierarchy_models": lambda fx, i: ("GET", "/api/hierarchy-models", None),
+    "cache_stats": lambda fx, i: ("GET", "/api/admin/cache", None),
+    "metrics": lambda fx, i: ("GET", "/metrics", None),
+}
+
+async def _send(client, method: str, path: str, body) -> int:
+    """
+    Sends one request and reads the whole response.
+
+    Returns:
+        int: The status code, or None if the request failed without a response.
+    """
+    try:
+        response = await client.request(method, path, json=body)
+    except httpx.HTTPError:
+        return None
+    return response.status_code
+
+async def run_scenario(client, scenario, fixtures, requests: int, concurrency: int, warmup: int) -> dict:
+    """
+    Benchmarks one endpoint: warmup requests first, then requests spread over
+    concurrency workers that each send their next request as soon as the previous
+    one completes.
+
+    Returns:
+        dict: The summary (see stats.summarize), plus the number of responses per status code.
+              Responses with status 500 or above and failed requests count as errors.
+    """
+    for i in range(warmup):
+        await _send(client, *scenario(fixtures, i))
+
+    latencies, statuses = [], {}
+    errors = 0
+    pending = iter(range(warmup, warmup + requests))
+
+    async def worker():
+        nonlocal errors
+        # The workers share one iterator, so each request is sent exactly once
+        for i in pending:
+            start = time.perf_counter()
+            status = await _send(client, *scenario(fixtures, i))
+            latency = time.perf_counter() - start
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+            if status is None or status >= 500:
+                errors += 1
+            else:
+                latencies.append(latency)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    result = summarize(latencies, errors, time.perf_counter() - start)
+    result["statuses"] = statuses
+    return result
+
+def _git_commit():
+    try:
+        completed = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                   cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return completed.stdout.strip() or None
+
+def make_client(url: str, in_process: bool, timeout: float, max_connections: int):
+    """
+    Creates the HTTP client for a benchmark.
+
+    Args:
+        url (str): The server URL.
+        in_process (bool): Call the application in this process instead of the server at url.
+        timeout (float): The request timeout in seconds.
+        max_connections (int): The maximum number of concurrent connections to the server.
+
+    Returns:
+        httpx.AsyncClient: The client.
+    """
+    if in_process:
+        from app.main import app
+        # Unhandled errors become 500 responses, as they would over HTTP
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        return httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=timeout)
+    limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+    return httpx.AsyncClient(base_url=url, timeout=timeout, limits=limits)
+
+def format_results(results: dict) -> str:
+    """
+    Formats the endpoint summaries of a run as a plain text table.
+    """
+    lines = [f"{'endpoint':<20} {'requests':>8} {'errors':>6} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"]
+    for name, r in results["endpoints"].items():
+        lines.append(f"{name:<20} {r['requests']:>8} {r['errors']:>6} {r['throughput_rps']!s:>9} "
+                     f"{r['p50_ms']!s:>9} {r['p95_ms']!s:>9} {r['p99_ms']!s:>9}")
+    return "\n".join(lines)
+
+async def run_benchmarks(args) -> dict:
+    """
+    Samples fixtures, connects the server to the benchmark database and benchmarks
+    the selected endpoints one after the other.
+
+    Returns:
+        dict: The run's settings, environment, dataset row counts and a summary per endpoint.
+    """
+    conn = await asyncpg.connect(args.dsn)
+    try:
+        fixtures = await load_fixtures(conn, args.seed)
+    finally:
+        await conn.close()
+
+    names = args.endpoints.split(",") if args.endpoints else list(SCENARIOS)
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        raise SystemExit(f"Unknown endpoints: {', '.join(unknown)}. Choose from: {', '.join(SCENARIOS)}")
+
+    async with make_client(args.url, args.in_process, args.timeout, args.concurrency) as client:
+        if not args.no_connect:
+            response = await client.post("/api/connect", json=connect_payload(args.dsn or ""))
+            if response.status_code != 200:
+                raise SystemExit(f"Could not connect the server to the database: {response.text}")
+        pool = (await client.get("/api/pool_status")).json()
+
+        results = {
+            "label": args.label,
+            "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "target": "in-process" if args.in_process else args.url,
+            "settings": {
+                "requests": args.requests, "concurrency": args.concurrency, "warmup": args.warmup,
+                "seed": args.seed, "keep_cache": args.keep_cache
+            },
+            "pool": pool.get("settings"),
+            "dataset": fixtures.counts,
+            "endpoints": {}
+        }
+        for name in names:
+            if not args.keep_cache:
+                # Measure the uncached path; warmup requests may still fill the cache
+                await client.post("/api/admin/cache/flush")
+            results["endpoints"][name] = await run_scenario(
+                client, SCENARIOS[name], fixtures, args.requests, args.concurrency, args.warmup
+            )
+            print(f"{name}: p50 {results['endpoints'][name]['p50_ms']} ms, "
+                  f"{results['endpoints'][name]['throughput_rps']} req/s")
+    return results
+
+def main():
+    """
+    Command-line entry point: python -m benchmarks.run [--dsn DSN] [--url URL] [options]
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.run",
+        description="Benchmark every API endpoint against a database loaded with python -m benchmarks.generate."
+    )
+    parser.add_argument("--dsn", default=None,
+                        help="PostgreSQL connection URL of the benchmark database, used to sample request "
+                             "fixtures and to connect the server. Defaults to the standard PG* environment variables.")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="Server URL (default: http://127.0.0.1:8000)")
+    parser.add_argument("--in-process", action="store_true",
+                        help="Call the application in this process instead of over HTTP")
+    parser.add_argument("--no-connect", action="store_true",
+                        help="Do not POST /api/connect; the server is already connected")
+    parser.add_argument("--endpoints", default=None,
+                        help=f"Comma-separated endpoints to run (default: all of {', '.join(SCENARIOS)})")
+    parser.add_argument("--requests", type=int, default=200, help="Measured requests per endpoint (default: 200)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent requests (default: 8)")
+    parser.add_argument("--warmup", type=int, default=20, help="Unmeasured requests per endpoint (default: 20)")
+    parser.add_argument("--seed", type=int, default=42, help="Seed for sampling fixtures (default: 42)")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Request timeout in seconds (default: 30)")
+    parser.add_argument("--keep-cache", action="store_true",
+                        help="Do not flush the response caches before each endpoint")
+    parser.add_argument("--label", default=None, help="A name for this run, stored in the results")
+    parser.add_argument("--output", default=None,
+                        help="Results file (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--baseline", default=None, help="A previous results file to compare with")
+    parser.add_argument("--threshold", type=float, default=10.0,
+                        help="Change in percent that counts as a regression (default: 10)")
+    args = parser.parse_args()
+    if httpx is None:
+        parser.error("the benchmarks need httpx: pip install httpx")
+    if not args.no_connect and not args.dsn:
+        parser.error("--dsn is needed to connect the server (or pass --no-connect)")
+
+    results = asyncio.run(run_benchmarks(args))
+    print()
+    print(format_results(results))
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, datetime.datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print()
+        print(format_comparison(compare_results(baseline, results, args.threshold)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+import math
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    """
+    Returns the nearest-rank percentile of values sorted in ascending order.
+
+    Args:
+        sorted_values (list): The values, sorted.
+        fraction (float): The percentile as a fraction, e.g. 0.95.
+
+    Returns:
+        float: The percentile, or None if there are no values.
+    """
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+def summarize(latencies: list, errors: int, elapsed: float) -> dict:
+    """
+    Summarizes the latencies of one benchmark.
+
+    Args:
+        latencies (list): The latency of each successful request, in seconds.
+        errors (int): The number of failed requests.
+        elapsed (float): The wall-clock duration of the benchmark, in seconds.
+
+    Returns:
+        dict: The request and error counts, throughput (requests per second) and
+              min/mean/p50/p95/p99/max latency in milliseconds.
+    """
+    values = sorted(latencies)
+
+    def ms(value):
+        return None if value is None else round(value * 1000, 3)
+
+    return {
+        "requests": len(values) + errors,
+        "errors": errors,
+        "throughput_rps": round((len(values) + errors) / elapsed, 2) if elapsed > 0 else None,
+        "min_ms": ms(values[0] if values else None),
+        "mean_ms": ms(sum(values) / len(values) if values else None),
+        "p50_ms": ms(percentile(values, 0.50)),
+        "p95_ms": ms(percentile(values, 0.95)),
+        "p99_ms": ms(percentile(values, 0.99)),
+        "max_ms": ms(values[-1] if values else None),
+    }
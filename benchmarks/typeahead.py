@@ -0,0 +1,369 @@
+import argparse
+import asyncio
+import datetime
+import json
+import random
+import time
+import urllib.parse
+import asyncpg
+from .fixtures import load_fixtures, connect_payload
+from .run import make_client, httpx
+from .stats import summarize
+
+# The search box sends a query once typing has paused this long (see app.js)
+DEBOUNCE_SECONDS = 0.3
+
+class TrafficShape:
+    """
+    How simulated users type and browse. All durations are in seconds.
+    """
+
+    def __init__(self, keystroke: float = 0.18, pause_rate: float = 0.15, pause: float = 0.8,
+                 think: float = 1.0, idle: float = 2.0, brain_share: float = 0.6):
+        self.keystroke = keystroke
+        self.pause_rate = pause_rate
+        self.pause = pause
+        self.think = think
+        self.idle = idle
+        self.brain_share = brain_share
+
+class StageRecorder:
+    """
+    Collects the latency and status of every request sent during one load stage, by endpoint.
+    """
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+
+    def add(self, endpoint: str, latency: float, status):
+        self.latencies.setdefault(endpoint, [])
+        self.errors.setdefault(endpoint, 0)
+        if status is None or status >= 500:
+            self.errors[endpoint] += 1
+        else:
+            self.latencies[endpoint].append(latency)
+
+async def _timed_get(client, recorder: StageRecorder, endpoint: str, path: str):
+    start = time.perf_counter()
+    try:
+        status = (await client.get(path)).status_code
+    except httpx.HTTPError:
+        status = None
+    recorder.add(endpoint, time.perf_counter() - start, status)
+
+async def user_session(client, recorder: StageRecorder, fixtures, rng: random.Random, shape: TrafficShape):
+    """
+    Simulates one user looking something up: typing part of a name into a search
+    box, waiting for the results, then opening the details of the match.
+
+    As in the browser, a search is sent whenever typing pauses for the debounce
+    delay, and earlier searches are not cancelled. A hesitation while typing
+    therefore sends overlapping searches for successive prefixes.
+    """
+    if rng.random() < shape.brain_share:
+        target_id, name = rng.choice(fixtures.structure_names)
+        search_endpoint, search_path = "brain_search", "/api/brain-search"
+        detail_endpoint, detail_path = "structure", f"/api/brain-structure/{target_id}"
+    else:
+        target_id, name = rng.choice(fixtures.concept_names)
+        search_endpoint, search_path = "search", "/api/search"
+        detail_endpoint, detail_path = "concept", f"/api/concept/{target_id}"
+
+    typed = name[:rng.randint(min(3, len(name)), min(len(name), 12))].lower()
+    searches = []
+    for position in range(1, len(typed) + 1):
+        last = position == len(typed)
+        if last:
+            gap = None
+        elif rng.random() < shape.pause_rate:
+            gap = rng.uniform(DEBOUNCE_SECONDS, DEBOUNCE_SECONDS + shape.pause)
+        else:
+            gap = max(0.03, rng.gauss(shape.keystroke, shape.keystroke / 2))
+
+        if last or gap >= DEBOUNCE_SECONDS:
+            await asyncio.sleep(DEBOUNCE_SECONDS)
+            query = urllib.parse.urlencode({"query": typed[:position]})
+            searches.append(asyncio.ensure_future(
+                _timed_get(client, recorder, search_endpoint, f"{search_path}?{query}")
+            ))
+            if not last:
+                await asyncio.sleep(gap - DEBOUNCE_SECONDS)
+        else:
+            await asyncio.sleep(gap)
+
+    await asyncio.gather(*searches)
+    await asyncio.sleep(rng.expovariate(1 / shape.think) if shape.think > 0 else 0)
+    await _timed_get(client, recorder, detail_endpoint, detail_path)
+
+def parse_prometheus(text: str) -> dict:
+    """
+    Reads the samples of a Prometheus text exposition into a dict keyed by
+    series (name plus labels, e.g. 'db_pool_acquire_seconds_bucket{le="0.01"}').
+    """
+    samples = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        series, _, value = line.rpartition(" ")
+        try:
+            samples[series] = float(value)
+        except ValueError:
+            continue
+    return samples
+
+def _acquire_wait(before: dict, after: dict) -> dict:
+    """
+    Summarizes the connection waits between two /metrics scrapes: their count,
+    mean and the upper bound of the histogram bucket holding the 95th percentile.
+    """
+    count = after.get("db_pool_acquire_seconds_count", 0) - before.get("db_pool_acquire_seconds_count", 0)
+    total = after.get("db_pool_acquire_seconds_sum", 0) - before.get("db_pool_acquire_seconds_sum", 0)
+    if count <= 0:
+        return {"acquires": 0, "mean_ms": None, "p95_ms": None}
+
+    buckets = []
+    prefix = 'db_pool_acquire_seconds_bucket{le="'
+    for series, value in after.items():
+        if series.startswith(prefix):
+            bound = series[len(prefix):-2]
+            upper = float("inf") if bound == "+Inf" else float(bound)
+            buckets.append((upper, value - before.get(series, 0)))
+    p95 = None
+    for upper, cumulative in sorted(buckets):
+        if cumulative >= 0.95 * count:
+            p95 = None if upper == float("inf") else round(upper * 1000, 3)
+            break
+    return {"acquires": int(count), "mean_ms": round(total / count * 1000, 3), "p95_ms": p95}
+
+async def _scrape_metrics(client):
+    try:
+        response = await client.get("/metrics")
+    except httpx.HTTPError:
+        return None
+    return parse_prometheus(response.text) if response.status_code == 200 else None
+
+async def _monitor_pool(client, samples: list, interval: float):
+    """
+    Polls /api/pool_status (and the db_pool_waiting gauge, when /metrics is available)
+    until cancelled.
+    """
+    while True:
+        try:
+            status = (await client.get("/api/pool_status")).json()
+            metrics = await _scrape_metrics(client)
+            samples.append({
+                "in_use": status.get("in_use", 0),
+                "size": status.get("size", 0),
+                "waiting": None if metrics is None else metrics.get("db_pool_waiting", 0)
+            })
+        except (httpx.HTTPError, ValueError):
+            pass
+        await asyncio.sleep(interval)
+
+async def run_stage(client, fixtures, users: int, duration: float, shape: TrafficShape, seed: int) -> dict:
+    """
+    Runs users simulated users for duration seconds. Each user starts new lookup
+    sessions (see user_session), separated by idle time, until the time is up.
+
+    Returns:
+        dict: The stage's throughput, a latency summary per endpoint (see stats.summarize),
+              the connection pool utilization and the time spent waiting for connections.
+    """
+    recorder = StageRecorder()
+    pool_samples = []
+    before = await _scrape_metrics(client)
+    monitor = asyncio.ensure_future(_monitor_pool(client, pool_samples, 1.0))
+    deadline = time.perf_counter() + duration
+
+    async def user(index: int):
+        rng = random.Random(seed * 100003 + index)
+        # Spread the users' first sessions over the idle time, so they do not start in lockstep
+        await asyncio.sleep(rng.uniform(0, shape.idle))
+        while time.perf_counter() < deadline:
+            await user_session(client, recorder, fixtures, rng, shape)
+            await asyncio.sleep(rng.expovariate(1 / shape.idle) if shape.idle > 0 else 0)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(user(index) for index in range(users)))
+    elapsed = time.perf_counter() - start
+    monitor.cancel()
+    after = await _scrape_metrics(client)
+
+    endpoints = {
+        endpoint: summarize(latencies, recorder.errors[endpoint], elapsed)
+        for endpoint, latencies in sorted(recorder.latencies.items())
+    }
+    requests = sum(summary["requests"] for summary in endpoints.values())
+    errors = sum(summary["errors"] for summary in endpoints.values())
+    return {
+        "users": users,
+        "elapsed_s": round(elapsed, 2),
+        "requests": requests,
+        "errors": errors,
+        "throughput_rps": round(requests / elapsed, 2) if elapsed > 0 else None,
+        "endpoints": endpoints,
+        "pool": {
+            "max_in_use": max((s["in_use"] for s in pool_samples), default=None),
+            "max_size": max((s["size"] for s in pool_samples), default=None),
+            "max_waiting": max((s["waiting"] for s in pool_samples if s["waiting"] is not None), default=None),
+        },
+        "acquire_wait": _acquire_wait(before, after) if before is not None and after is not None else None,
+    }
+
+def find_saturation(stages: list, latency_slo_ms: float, min_gain: float, max_error_rate: float):
+    """
+    Finds the first stage at which the server stopped keeping up with added users.
+
+    A stage is saturated when its p95 search latency exceeds the latency objective,
+    when more than max_error_rate of its requests failed, or when its throughput
+    grew by less than min_gain of the growth in users since the previous stage.
+
+    Returns:
+        dict: The saturated stage's users and the reason, or None if no stage saturated.
+    """
+    previous = None
+    for stage in stages:
+        searches = [stage["endpoints"][name] for name in ("search", "brain_search") if name in stage["endpoints"]]
+        p95 = max((summary["p95_ms"] or 0 for summary in searches), default=0)
+        if p95 > latency_slo_ms:
+            return {"users": stage["users"], "reason": f"p95 search latency {p95} ms exceeds {latency_slo_ms} ms"}
+        if stage["requests"] and stage["errors"] / stage["requests"] > max_error_rate:
+            return {"users": stage["users"], "reason": f"{stage['errors']} of {stage['requests']} requests failed"}
+        if previous is not None and previous["throughput_rps"]:
+            user_growth = stage["users"] / previous["users"] - 1
+            throughput_growth = stage["throughput_rps"] / previous["throughput_rps"] - 1
+            if user_growth > 0 and throughput_growth < min_gain * user_growth:
+                return {"users": stage["users"],
+                        "reason": f"throughput grew {throughput_growth:.0%} for {user_growth:.0%} more users"}
+        previous = stage
+    return None
+
+def format_stages(stages: list) -> str:
+    """
+    Formats the stages of a load test as a plain text table.
+    """
+    lines = [f"{'users':>6} {'req/s':>8} {'errors':>6} {'search p95':>11} {'detail p95':>11} "
+             f"{'pool in use':>12} {'waiting':>8} {'wait mean':>10} {'wait p95':>9}"]
+    for stage in stages:
+        endpoints = stage["endpoints"]
+        search_p95 = max((endpoints[n]["p95_ms"] or 0 for n in ("search", "brain_search") if n in endpoints),
+                         default=None)
+        detail_p95 = max((endpoints[n]["p95_ms"] or 0 for n in ("concept", "structure") if n in endpoints),
+                         default=None)
+        wait = stage["acquire_wait"] or {}
+        lines.append(
+            f"{stage['users']:>6} {stage['throughput_rps']!s:>8} {stage['errors']:>6} {search_p95!s:>11} "
+            f"{detail_p95!s:>11} {stage['pool']['max_in_use']!s:>12} {stage['pool']['max_waiting']!s:>8} "
+            f"{wait.get('mean_ms')!s:>10} {wait.get('p95_ms')!s:>9}"
+        )
+    return "\n".join(lines)
+
+async def run_load(args) -> dict:
+    """
+    Replays typeahead traffic at each number of users in args.users, one stage after the other.
+
+    Returns:
+        dict: The settings, every stage's results and the saturation point.
+    """
+    conn = await asyncpg.connect(args.dsn)
+    try:
+        fixtures = await load_fixtures(conn, args.seed)
+    finally:
+        await conn.close()
+
+    shape = TrafficShape(args.keystroke_ms / 1000, args.pause_rate, args.pause_ms / 1000,
+                         args.think_ms / 1000, args.idle_ms / 1000, args.brain_share)
+    levels = [int(users) for users in args.users.split(",")]
+    # Every simulated user may have a few searches in flight at once
+    async with make_client(args.url, args.in_process, args.timeout, max(levels) * 4) as client:
+        if not args.no_connect:
+            response = await client.post("/api/connect", json=connect_payload(args.dsn or ""))
+            if response.status_code != 200:
+                raise SystemExit(f"Could not connect the server to the database: {response.text}")
+        pool = (await client.get("/api/pool_status")).json()
+
+        stages = []
+        for users in levels:
+            if not args.keep_cache:
+                await client.post("/api/admin/cache/flush")
+            stage = await run_stage(client, fixtures, users, args.stage_seconds, shape, args.seed)
+            stages.append(stage)
+            print(f"{users} users: {stage['throughput_rps']} req/s, {stage['errors']} errors")
+
+    return {
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "target": "in-process" if args.in_process else args.url,
+        "settings": {key: value for key, value in vars(args).items() if key not in ("dsn", "output")},
+        "pool": pool.get("settings"),
+        "dataset": fixtures.counts,
+        "stages": stages,
+        "saturation": find_saturation(stages, args.latency_slo_ms, args.min_gain, args.max_error_rate),
+    }
+
+def main():
+    """
+    Command-line entry point: python -m benchmarks.typeahead [--dsn DSN] [--url URL] [options]
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.typeahead",
+        description="Replay search-as-you-type traffic at increasing numbers of users to find "
+                    "where the server saturates and how long requests wait for database connections."
+    )
+    parser.add_argument("--dsn", default=None,
+                        help="PostgreSQL connection URL of the benchmark database, used to sample names "
+                             "and to connect the server. Defaults to the standard PG* environment variables.")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="Server URL (default: http://127.0.0.1:8000)")
+    parser.add_argument("--in-process", action="store_true",
+                        help="Call the application in this process instead of over HTTP")
+    parser.add_argument("--no-connect", action="store_true",
+                        help="Do not POST /api/connect; the server is already connected")
+    parser.add_argument("--users", default="5,10,20,40,80",
+                        help="Comma-separated numbers of concurrent users, one stage each (default: 5,10,20,40,80)")
+    parser.add_argument("--stage-seconds", type=float, default=30.0, help="Duration of each stage (default: 30)")
+    parser.add_argument("--keystroke-ms", type=float, default=180.0,
+                        help="Mean time between keystrokes (default: 180)")
+    parser.add_argument("--pause-rate", type=float, default=0.15,
+                        help="Share of keystrokes followed by a hesitation longer than the debounce delay "
+                             "(default: 0.15)")
+    parser.add_argument("--pause-ms", type=float, default=800.0,
+                        help="Longest hesitation beyond the debounce delay (default: 800)")
+    parser.add_argument("--think-ms", type=float, default=1000.0,
+                        help="Mean time between the last search results and opening the details (default: 1000)")
+    parser.add_argument("--idle-ms", type=float, default=2000.0, help="Mean time between lookups (default: 2000)")
+    parser.add_argument("--brain-share", type=float, default=0.6,
+                        help="Share of lookups on the brain structures tab (default: 0.6)")
+    parser.add_argument("--latency-slo-ms", type=float, default=300.0,
+                        help="p95 search latency above which the server counts as saturated (default: 300)")
+    parser.add_argument("--min-gain", type=float, default=0.5,
+                        help="Throughput growth, as a share of the growth in users, below which the server "
+                             "counts as saturated (default: 0.5)")
+    parser.add_argument("--max-error-rate", type=float, default=0.01,
+                        help="Share of failed requests above which the server counts as saturated (default: 0.01)")
+    parser.add_argument("--seed", type=int, default=42, help="Seed for names and timings (default: 42)")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Request timeout in seconds (default: 30)")
+    parser.add_argument("--keep-cache", action="store_true",
+                        help="Do not flush the response caches before each stage")
+    parser.add_argument("--output", default=None, help="Write the results to this JSON file")
+    args = parser.parse_args()
+    if httpx is None:
+        parser.error("the load test needs httpx: pip install httpx")
+    if not args.no_connect and not args.dsn:
+        parser.error("--dsn is needed to connect the server (or pass --no-connect)")
+
+    results = asyncio.run(run_load(args))
+    print()
+    print(format_stages(results["stages"]))
+    saturation = results["saturation"]
+    print()
+    if saturation is None:
+        print("No saturation up to the largest number of users")
+    else:
+        print(f"Saturated at {saturation['users']} users: {saturation['reason']}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
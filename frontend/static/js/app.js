@@ -495,6 +495,12 @@ async function fetchConceptFromAPI(id) {
     }
 }
 
+// Brain structure detail fields used by displayBrainStructureDetails
+const BRAIN_STRUCTURE_PAGE_FIELDS = [
+    "name", "acronym", "description", "brain_info_url", "structure_type", "neuronames_id",
+    "synonyms", "children", "hierarchy", "hierarchy_models", "current_hierarchy_model"
+].join(",");
+
 /**
  * Fetches brain structure details from the API.
  * @param {string} id - The ID of the brain structure.
@@ -508,11 +514,16 @@ async function fetchBrainStructureFromAPI(id, hierarchyModel) {
             hierarchyModel = hierarchyModelSelect.value;
         }
 
-        // Build the URL with the hierarchy model parameter if specified
-        let url = `/api/brain-structure/${id}`;
+        // Request only what the page shows. The tree needs the ancestors, but not
+        // the descendants: deeper levels are loaded on demand from /children.
+        const params = new URLSearchParams({
+            fields: BRAIN_STRUCTURE_PAGE_FIELDS,
+            direction: "ancestors"
+        });
         if (hierarchyModel) {
-            url += `?hierarchy_model=${encodeURIComponent(hierarchyModel)}`;
+            params.set("hierarchy_model", hierarchyModel);
         }
+        const url = `/api/brain-structure/${id}?${params}`;
 
         const response = await fetch(url);
         const data = await response.json();
@@ -631,6 +642,7 @@ function displayBrainStructureDetails(structure) {
     // Store the structure ID and name in the brainDetailsDiv dataset for later use
     brainDetailsDiv.dataset.structureId = structure.structure_id;
     brainDetailsDiv.dataset.structureName = structure.name;
+    brainDetailsDiv.dataset.hierarchyModel = structure.current_hierarchy_model || "";
 
     // Create the hierarchy tree HTML
     const hierarchyHtml = generateBrainHierarchyHtml(structure);
@@ -670,6 +682,11 @@ function displayBrainStructureDetails(structure) {
             </div>
         </div>
     `;
+
+    // Replace the direct children with expandable entries
+    if (structure.children.length > 0) {
+        loadBrainStructureChildren(structure.structure_id, structure.current_hierarchy_model);
+    }
 }
 
 /**
@@ -713,7 +730,7 @@ function generateBrainHierarchyHtml(structure) {
 
     // Add direct children (if any)
     if (structure.children.length > 0) {
-        html += '<ul class="list-group list-group-flush">';
+        html += '<ul class="list-group list-group-flush" id="brainStructureChildren">';
         structure.children.forEach(child => {
             html += `
                 <li class="list-group-item">
@@ -741,6 +758,120 @@ function generateBrainHierarchyHtml(structure) {
     return html;
 }
 
+/**
+ * Fetches the direct children of a brain structure from the API.
+ * @param {string} id - The ID of the brain structure.
+ * @param {string} [hierarchyModel] - The hierarchy model to follow.
+ * @returns {Promise<Object>} - A promise resolving to the children, each with has_children and descendant counts.
+ */
+async function fetchBrainStructureChildren(id, hierarchyModel) {
+    let url = `/api/brain-structure/${id}/children`;
+    if (hierarchyModel) {
+        url += `?hierarchy_model=${encodeURIComponent(hierarchyModel)}`;
+    }
+
+    const response = await fetch(url);
+    const data = await response.json();
+    if (!response.ok) {
+        throw new Error(data.message || data.detail || "Error fetching child structures");
+    }
+    return data;
+}
+
+/**
+ * Creates the list item for a child structure. Children that have children of
+ * their own get a toggle that loads them on demand. Names are set as text so
+ * they are never interpreted as markup.
+ * @param {Object} child - A child returned by the children endpoint.
+ * @returns {HTMLLIElement} - The list item.
+ */
+function createChildItem(child) {
+    const item = document.createElement("li");
+    item.className = "list-group-item";
+    item.dataset.structureId = child.structure_id;
+
+    if (child.has_children) {
+        const toggle = document.createElement("button");
+        toggle.type = "button";
+        toggle.className = "btn btn-link btn-sm p-0 me-1 tree-toggle";
+        toggle.setAttribute("aria-expanded", "false");
+        toggle.textContent = "+";
+        toggle.addEventListener("click", event => {
+            event.preventDefault();
+            toggleBrainStructureChildren(toggle);
+        });
+        item.appendChild(toggle);
+    }
+
+    const link = document.createElement("a");
+    link.href = "#";
+    link.textContent = child.name;
+    link.addEventListener("click", event => {
+        event.preventDefault();
+        fetchBrainStructureDetails(child.structure_id, child.name);
+    });
+    item.appendChild(link);
+
+    if (child.has_children) {
+        const count = document.createElement("span");
+        count.className = "text-muted small ms-1";
+        count.textContent = `(${child.descendant_count})`;
+        item.appendChild(count);
+    }
+
+    return item;
+}
+
+/**
+ * Replaces the direct children of the displayed brain structure with expandable entries.
+ * @param {string} id - The ID of the displayed brain structure.
+ * @param {string} [hierarchyModel] - The hierarchy model to follow.
+ */
+async function loadBrainStructureChildren(id, hierarchyModel) {
+    try {
+        const data = await fetchBrainStructureChildren(id, hierarchyModel);
+        const list = document.getElementById("brainStructureChildren");
+        // Another structure may have been displayed in the meantime
+        if (list && brainDetailsDiv.dataset.structureId === String(id)) {
+            list.replaceChildren(...data.children.map(createChildItem));
+        }
+    } catch (error) {
+        // The plain list of children stays in place
+        console.error("Error fetching child structures:", error);
+    }
+}
+
+/**
+ * Expands or collapses the children of a structure in the hierarchy tree,
+ * fetching them the first time the structure is expanded.
+ * @param {HTMLElement} button - The toggle button of the structure.
+ */
+async function toggleBrainStructureChildren(button) {
+    const item = button.closest("li");
+    const nested = item.querySelector(":scope > ul");
+    if (nested) {
+        const expanded = nested.classList.toggle("d-none") === false;
+        button.textContent = expanded ? "\u2212" : "+";
+        button.setAttribute("aria-expanded", String(expanded));
+        return;
+    }
+
+    button.disabled = true;
+    try {
+        const data = await fetchBrainStructureChildren(item.dataset.structureId, brainDetailsDiv.dataset.hierarchyModel);
+        const list = document.createElement("ul");
+        list.className = "list-group list-group-flush";
+        list.append(...data.children.map(createChildItem));
+        item.appendChild(list);
+        button.textContent = "\u2212";
+        button.setAttribute("aria-expanded", "true");
+    } catch (error) {
+        console.error("Error fetching child structures:", error);
+    } finally {
+        button.disabled = false;
+    }
+}
+
 /**
  * Capitalizes the first letter of a string.
  * @param {string} string - The input string.
@@ -0,0 +1,44 @@
+import asyncio
+import os
+import asyncpg
+import pytest
+from app.closure import build_closure
+from benchmarks.generate import SCHEMA_DDL, TABLES
+
+# app.main serves frontend/static relative to the working directory
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def database_url():
+    """
+    The URL of a disposable database, from TEST_DATABASE_URL. Tests that use it
+    replace its tables, so never point it at real data.
+    """
+    url = os.environ.get("TEST_DATABASE_URL")
+    if not url:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    return url
+
+@pytest.fixture
+def create_hierarchy(database_url):
+    """
+    Returns a function that replaces the tables of the test database with the
+    given structures, as (id, standard_name) pairs, and edges, as
+    (hierarchy_model_name, parent_id, child_id) tuples. With closure=True it
+    also builds structure_closure.
+    """
+    async def create(structures, edges, closure):
+        conn = await asyncpg.connect(database_url)
+        try:
+            await conn.execute("DROP TABLE IF EXISTS structure_closure, " + ", ".join(reversed(TABLES)) + " CASCADE")
+            await conn.execute(SCHEMA_DDL)
+            await conn.executemany("INSERT INTO brain_structures (id, standard_name) VALUES ($1, $2)", structures)
+            await conn.executemany(
+                "INSERT INTO structure_parents (hierarchy_model_name, parent_id, child_id) VALUES ($1, $2, $3)", edges
+            )
+            if closure:
+                await build_closure(conn)
+        finally:
+            await conn.close()
+
+    return lambda structures, edges, closure=False: asyncio.run(create(structures, edges, closure))
@@ -0,0 +1,44 @@
+import json
+import pytest
+from fastapi.testclient import TestClient
+from app import config, database
+from app import main
+from app.main import app
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(database, "is_connected", True)
+    monkeypatch.setattr(config, "BATCH_CHUNK_SIZE", 2)
+    return TestClient(app)
+
+def _details(structure_ids):
+    return {structure_id: {"structure_id": structure_id} for structure_id in structure_ids}
+
+def test_batch_streams_every_chunk(client, monkeypatch):
+    async def fetch(structure_ids, hierarchy_model=None):
+        return _details(structure_ids)
+    monkeypatch.setattr(main, "get_brain_structure_batch", fetch)
+
+    response = client.post("/api/brain-structure/batch", json={"ids": [1, 2, 3, 4, 5]})
+    assert response.status_code == 200
+    assert list(json.loads(response.content)) == ["1", "2", "3", "4", "5"]
+
+def test_batch_failing_chunk_keeps_valid_json(client, monkeypatch):
+    calls = []
+    async def fetch(structure_ids, hierarchy_model=None):
+        calls.append(structure_ids)
+        if len(calls) == 2:
+            raise Exception("connection lost")
+        return _details(structure_ids)
+    monkeypatch.setattr(main, "get_brain_structure_batch", fetch)
+
+    response = client.post("/api/brain-structure/batch", json={"ids": [1, 2, 3, 4, 5]})
+    assert response.status_code == 200
+    body = json.loads(response.content)
+    assert body == {
+        "1": {"structure_id": 1},
+        "2": {"structure_id": 2},
+        "error": {"status": "error", "message": "Database error: connection lost"}
+    }
+    # Streaming stops at the failing chunk
+    assert len(calls) == 2
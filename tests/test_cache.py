@@ -0,0 +1,109 @@
+import asyncio
+from app import cache as cache_module
+from app.cache import TTLCache, cached
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def test_entries_expire_after_ttl(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(cache_module.time, "monotonic", clock)
+    cache = TTLCache("test", maxsize=10, ttl=60, maxbytes=100)
+    cache.set("a", b"1234")
+    clock.now += 59
+    assert cache.get("a") == b"1234"
+    clock.now += 1
+    assert cache.get("a", "expired") == "expired"
+    # The expired entry no longer counts towards the limits
+    assert cache.stats()["size"] == 0 and cache.bytes == 0
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_setting_an_entry_renews_it(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(cache_module.time, "monotonic", clock)
+    cache = TTLCache("test", maxsize=10, ttl=60)
+    cache.set("a", b"old")
+    clock.now += 50
+    cache.set("a", b"new")
+    clock.now += 50
+    assert cache.get("a") == b"new"
+
+def test_entry_limit_evicts_least_recently_used():
+    cache = TTLCache("test", maxsize=2, ttl=60)
+    cache.set("a", b"1")
+    cache.set("b", b"2")
+    cache.get("a")
+    cache.set("c", b"3")
+    assert cache.get("b") is None
+    assert cache.get("a") == b"1" and cache.get("c") == b"3"
+
+def test_zero_size_disables_the_cache():
+    cache = TTLCache("test", maxsize=0, ttl=60)
+    cache.set("a", b"1")
+    assert cache.get("a") is None
+
+def test_byte_limit_evicts_least_recently_used():
+    cache = TTLCache("test", maxsize=10, ttl=60, maxbytes=10)
+    cache.set("a", b"1234")
+    cache.set("b", b"1234")
+    cache.get("a")
+    cache.set("c", b"1234")
+    assert cache.get("b") is None
+    assert cache.get("a") == b"1234" and cache.get("c") == b"1234"
+    assert cache.bytes == 8
+
+def test_value_over_byte_limit_is_not_stored():
+    cache = TTLCache("test", maxsize=10, ttl=60, maxbytes=10)
+    cache.set("a", b"1234")
+    cache.set("big", b"x" * 11)
+    assert cache.get("big") is None
+    assert cache.get("a") == b"1234"
+
+def test_replacing_an_entry_updates_bytes():
+    cache = TTLCache("test", maxsize=10, ttl=60, maxbytes=100)
+    cache.set("a", b"1234")
+    cache.set("a", b"12")
+    assert cache.bytes == 2
+    cache.clear()
+    assert cache.bytes == 0
+
+def test_set_from_before_clear_is_dropped():
+    cache = TTLCache("test", maxsize=10, ttl=60)
+    generation = cache.generation
+    cache.clear()
+    cache.set("a", b"stale", generation)
+    assert cache.get("a") is None
+    cache.set("a", b"fresh", cache.generation)
+    assert cache.get("a") == b"fresh"
+
+def test_cached_skips_none_and_results_from_before_a_flush():
+    cache = TTLCache("test", maxsize=10, ttl=60)
+    calls = []
+    release = None
+
+    @cached(cache, key=lambda structure_id: structure_id)
+    async def lookup(structure_id):
+        calls.append(structure_id)
+        if structure_id == "slow":
+            await release.wait()
+        return None if structure_id == "missing" else structure_id.encode()
+
+    async def run():
+        nonlocal release
+        release = asyncio.Event()
+        assert await lookup("missing") is None
+        assert await lookup("missing") is None
+        # A lookup that is in flight while the cache is flushed
+        slow = asyncio.ensure_future(lookup("slow"))
+        await asyncio.sleep(0)
+        cache.clear()
+        release.set()
+        assert await slow == b"slow"
+        await lookup("slow")
+
+    asyncio.run(run())
+    assert calls == ["missing", "missing", "slow", "slow"]
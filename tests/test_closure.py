@@ -0,0 +1,96 @@
+import asyncio
+import time
+import asyncpg
+from fastapi.testclient import TestClient
+from app import config, database
+from app.closure import build_closure, drop_closure, is_closure_enabled
+from app.main import app
+from benchmarks.fixtures import connect_payload
+
+MODEL = "Test"
+
+# 1 -> 2 -> 4 and 1 -> 3
+STRUCTURES = [(1, "root"), (2, "left"), (3, "right"), (4, "leaf")]
+EDGES = [(MODEL, 1, 2), (MODEL, 1, 3), (MODEL, 2, 4)]
+
+async def _execute(url, query, *args):
+    conn = await asyncpg.connect(url)
+    try:
+        await conn.execute(query, *args)
+    finally:
+        await conn.close()
+
+def _children(client, structure_id):
+    response = client.get(f"/api/brain-structure/{structure_id}/children")
+    if response.status_code == 404:
+        return set()
+    assert response.status_code == 200
+    return {child["structure_id"] for child in response.json()["children"]}
+
+def _wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.1)
+    return True
+
+def test_edge_change_reaches_responses(database_url, create_hierarchy, monkeypatch):
+    monkeypatch.setattr(config, "HIERARCHY_RELOAD_DELAY", 0.05)
+    create_hierarchy(STRUCTURES, EDGES, closure=True)
+
+    with TestClient(app) as client:
+        response = client.post("/api/connect", json=connect_payload(database_url))
+        assert response.json()["status"] == "success"
+        try:
+            assert _children(client, 2) == {4}
+            assert _children(client, 3) == set()
+
+            # Move the leaf from one branch to the other behind the application's back
+            asyncio.run(_execute(
+                database_url,
+                "UPDATE structure_parents SET parent_id = 3 WHERE child_id = 4 AND hierarchy_model_name = $1",
+                MODEL))
+
+            assert _wait_for(lambda: _children(client, 3) == {4})
+            assert _children(client, 2) == set()
+            details = client.get("/api/brain-structure/4").json()
+            assert [parent["structure_id"] for parent in details["parents"]] == [3]
+            assert [ancestor["structure_id"] for ancestor in details["hierarchy"]["ancestors"]] == [3, 1]
+        finally:
+            client.portal.call(database.close_db)
+
+async def _run(url, command):
+    conn = await asyncpg.connect(url)
+    try:
+        await command(conn)
+    finally:
+        await conn.close()
+
+def test_closure_built_after_connecting_is_used(database_url, create_hierarchy, monkeypatch):
+    monkeypatch.setattr(config, "HIERARCHY_RELOAD_DELAY", 0.05)
+    monkeypatch.setattr(database, "HEALTH_CHECK_INTERVAL", 0.1)
+    create_hierarchy(STRUCTURES, EDGES)
+
+    with TestClient(app) as client:
+        response = client.post("/api/connect", json=connect_payload(database_url))
+        assert response.json()["status"] == "success"
+        try:
+            assert not is_closure_enabled()
+            assert database.change_listener is None
+
+            asyncio.run(_run(database_url, build_closure))
+            assert _wait_for(lambda: is_closure_enabled() and database.change_listener is not None)
+
+            # Edge changes are now announced and reach responses
+            asyncio.run(_execute(
+                database_url,
+                "UPDATE structure_parents SET parent_id = 3 WHERE child_id = 4 AND hierarchy_model_name = $1",
+                MODEL))
+            assert _wait_for(lambda: _children(client, 3) == {4})
+
+            asyncio.run(_run(database_url, drop_closure))
+            assert _wait_for(lambda: not is_closure_enabled())
+            assert _children(client, 3) == {4}
+        finally:
+            client.portal.call(database.close_db)
@@ -0,0 +1,77 @@
+import os
+import time
+from starlette.applications import Starlette
+from starlette.routing import Mount
+from starlette.testclient import TestClient
+from app import compression
+from app.compression import PrecompressedStaticFiles, choose_encoding
+
+SCRIPT = "function greet() { return 'hello'; }\n" * 100
+
+def _client(directory):
+    files = PrecompressedStaticFiles(directory=str(directory))
+    return files, TestClient(Starlette(routes=[Mount("/static", files)]))
+
+def _get(client, accept_encoding="gzip", **headers):
+    return client.get("/static/app.js", headers={"Accept-Encoding": accept_encoding, **headers})
+
+def test_variants_have_their_own_etag(tmp_path):
+    (tmp_path / "app.js").write_text(SCRIPT)
+    _, client = _client(tmp_path)
+    plain = _get(client, "identity")
+    compressed = _get(client)
+    assert "content-encoding" not in plain.headers
+    assert compressed.headers["content-encoding"] == "gzip"
+    assert compressed.content == plain.content
+    assert compressed.headers["etag"] == plain.headers["etag"][:-1] + '-gz"'
+    assert compressed.headers["vary"] == plain.headers["vary"] == "Accept-Encoding"
+
+def test_conditional_requests_match_the_chosen_variant(tmp_path):
+    (tmp_path / "app.js").write_text(SCRIPT)
+    _, client = _client(tmp_path)
+    plain_etag = _get(client, "identity").headers["etag"]
+    compressed_etag = _get(client).headers["etag"]
+
+    not_modified = _get(client, **{"If-None-Match": compressed_etag})
+    assert not_modified.status_code == 304
+    assert not_modified.headers["etag"] == compressed_etag
+    # The client holds the uncompressed bytes, but would now be sent the gzip variant
+    assert _get(client, **{"If-None-Match": plain_etag}).status_code == 200
+    assert _get(client, "identity", **{"If-None-Match": plain_etag}).status_code == 304
+
+def test_changed_file_is_recompressed_off_the_request(tmp_path):
+    path = tmp_path / "app.js"
+    path.write_text(SCRIPT)
+    files, client = _client(tmp_path)
+    path.write_text(SCRIPT.replace("hello", "world"))
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    # Sent uncompressed while the new variant is being built
+    response = _get(client)
+    assert "content-encoding" not in response.headers
+    assert b"world" in response.content
+
+    deadline = time.monotonic() + 5
+    while "content-encoding" not in (response := _get(client)).headers:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    assert b"world" in response.content
+    assert not files.pending
+
+def test_encoding_negotiation(monkeypatch):
+    monkeypatch.setattr(compression, "brotli", object())
+    assert choose_encoding("gzip, deflate, br") == "br"
+    assert choose_encoding("GZIP") == "gzip"
+    assert choose_encoding("br;q=0, gzip;q=0.5") == "gzip"
+    assert choose_encoding("gzip; q=0.8, br") == "br"
+    assert choose_encoding("*") == "br"
+    assert choose_encoding("*;q=0, gzip") == "gzip"
+    assert choose_encoding("br;q=0, *") == "gzip"
+    for refused in ("", "identity", "deflate", "gzip;q=0, br;q=0", "*;q=0", "gzip;q=oops"):
+        assert choose_encoding(refused) is None
+
+def test_encoding_negotiation_without_brotli(monkeypatch):
+    monkeypatch.setattr(compression, "brotli", None)
+    assert choose_encoding("br, gzip") == "gzip"
+    assert choose_encoding("br") is None
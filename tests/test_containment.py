@@ -0,0 +1,31 @@
+import pytest
+from fastapi.testclient import TestClient
+from app import database, hierarchy_index
+from app.hierarchy_index import HierarchyIndex
+from app.main import app
+
+# 1 -> 2 -> 4 and 1 -> 3 -> 5
+NAMES = {1: "root", 2: "left", 3: "right", 4: "left leaf", 5: "right leaf"}
+EDGES = [("Test", 1, 2), ("Test", 1, 3), ("Test", 2, 4), ("Test", 3, 5)]
+
+@pytest.fixture
+def client(monkeypatch):
+    # Answered from the hierarchy index, so the pool is never used
+    monkeypatch.setattr(hierarchy_index, "current_index", HierarchyIndex(NAMES, EDGES))
+    monkeypatch.setattr(database, "is_connected", True)
+    monkeypatch.setattr(database, "db_pool", object())
+    return TestClient(app)
+
+def test_contains_single_id(client):
+    response = client.get("/api/brain-structure/2/contains/4")
+    assert response.status_code == 200
+    assert response.json() == {
+        "structure_id": 2, "other_id": 4, "current_hierarchy_model": "Test", "contains": True
+    }
+    assert client.get("/api/brain-structure/2/contains/5").json()["contains"] is False
+    assert client.get("/api/brain-structure/2/contains/2").json()["contains"] is False
+
+@pytest.mark.parametrize("other_id", ["5,4", "4,5", "5,", "abc"])
+def test_contains_rejects_anything_but_a_single_id(client, other_id):
+    response = client.get(f"/api/brain-structure/2/contains/{other_id}")
+    assert response.status_code == 422
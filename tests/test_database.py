@@ -0,0 +1,123 @@
+import asyncio
+import threading
+import time
+import asyncpg
+from fastapi.testclient import TestClient
+from app import database
+from app.main import app
+from app.metrics import acquire
+from benchmarks.fixtures import connect_payload
+
+class _FailingPool:
+    def __init__(self, error):
+        self.error = error
+
+    async def acquire(self):
+        raise self.error
+
+def _acquire_with(error):
+    async def run():
+        database.health_check_requested = asyncio.Event()
+        try:
+            async with acquire(_FailingPool(error)):
+                pass
+        except Exception:
+            pass
+        return database.health_check_requested.is_set()
+    return asyncio.run(run())
+
+def test_connection_error_marks_database_unavailable(monkeypatch):
+    monkeypatch.setattr(database, "is_connected", True)
+    monkeypatch.setattr(database, "health_check_requested", None)
+    assert _acquire_with(asyncpg.exceptions.ConnectionDoesNotExistError("connection was closed"))
+    assert database.is_connected is False
+
+def test_query_error_keeps_database_available(monkeypatch):
+    monkeypatch.setattr(database, "is_connected", True)
+    monkeypatch.setattr(database, "health_check_requested", None)
+    assert not _acquire_with(asyncpg.exceptions.UndefinedTableError("relation does not exist"))
+    # Running out of pooled connections is not a lost database either
+    assert not _acquire_with(asyncio.TimeoutError())
+    assert database.is_connected is True
+
+class _Proxy:
+    """
+    Forwards TCP connections to the database from a thread of its own, so that
+    tests can take the database away from the application and bring it back.
+    """
+
+    def __init__(self, host, port):
+        self.target = (host, port)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.server = None
+        self.port = None
+        self.writers = set()
+
+    def _call(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    async def _pipe(self, reader, writer):
+        try:
+            while data := await reader.read(65536):
+                writer.write(data)
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def _handle(self, client_reader, client_writer):
+        server_reader, server_writer = await asyncio.open_connection(*self.target)
+        self.writers.update((client_writer, server_writer))
+        await asyncio.gather(self._pipe(client_reader, server_writer), self._pipe(server_reader, client_writer))
+
+    async def _start(self):
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", self.port or 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def _stop(self):
+        self.server.close()
+        for writer in self.writers:
+            writer.transport.abort()
+        self.writers.clear()
+        await self.server.wait_closed()
+
+    def start(self):
+        self._call(self._start())
+
+    def stop(self):
+        self._call(self._stop())
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+def test_lost_database_is_noticed_before_next_health_check(database_url, monkeypatch):
+    # The interval is long enough that only an early check notices the outage
+    monkeypatch.setattr(database, "HEALTH_CHECK_INTERVAL", 600)
+    monkeypatch.setattr(database, "RECONNECT_BACKOFF_INITIAL", 0.1)
+    payload = connect_payload(database_url)
+    proxy = _Proxy(payload["host"], int(payload["port"]))
+    proxy.start()
+    payload["host"], payload["port"] = "127.0.0.1", str(proxy.port)
+    try:
+        with TestClient(app) as client:
+            assert client.post("/api/connect", json=payload).json()["status"] == "success"
+            try:
+                proxy.stop()
+                # The first failing request marks the database unavailable
+                assert client.get("/api/hierarchy-models").status_code == 503
+                assert client.get("/api/connection_status").json() == {"connected": False}
+                assert client.get("/api/hierarchy-models").json()["message"] == "Database not connected"
+
+                proxy.start()
+                deadline = time.monotonic() + 10
+                while client.get("/api/hierarchy-models").status_code != 200:
+                    assert time.monotonic() < deadline
+                    time.sleep(0.1)
+            finally:
+                client.portal.call(database.close_db)
+    finally:
+        proxy.close()
@@ -0,0 +1,138 @@
+import asyncio
+import asyncpg
+import pytest
+from app import hierarchy
+from app.hierarchy import fetch_children, fetch_hierarchy, fetch_subtree_members, parse_hierarchy_window
+from app.hierarchy_index import HierarchyIndex, fetch_common_ancestor
+
+MODEL = "Test"
+
+# Names whose order depends on the collation: by code point, upper case
+# letters come before "_", which comes before lower case letters
+STRUCTURES = [(1, "root"), (2, "beta"), (3, "Beta"), (4, "_alpha"), (5, "alpha"), (6, "Zeta"), (7, "gamma")]
+EDGES = [(MODEL, 1, child) for child in range(2, 7)] + [(MODEL, 2, 7)]
+
+async def _database_pages(url, structure_id, limit):
+    conn = await asyncpg.connect(url)
+    try:
+        pages, cursor = [], None
+        while True:
+            window = parse_hierarchy_window(limit=limit, cursor=cursor, direction="descendants")
+            page = await fetch_hierarchy(conn, structure_id, MODEL, window)
+            pages.append([entry["structure_id"] for entry in page["descendants"]])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return pages, await fetch_children(conn, structure_id, MODEL)
+    finally:
+        await conn.close()
+
+def _index_pages(index, structure_id, limit):
+    pages, cursor = [], None
+    while True:
+        window = parse_hierarchy_window(limit=limit, cursor=cursor, direction="descendants")
+        page = index.describe(structure_id, MODEL, window=window)["hierarchy"]
+        pages.append([entry["structure_id"] for entry in page["descendants"]])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return pages
+
+@pytest.mark.parametrize("closure", [False, True])
+def test_database_pages_match_the_index(database_url, create_hierarchy, monkeypatch, closure):
+    create_hierarchy(STRUCTURES, EDGES, closure=closure)
+    monkeypatch.setattr(hierarchy, "is_closure_enabled", lambda: closure)
+    index = HierarchyIndex(dict(STRUCTURES), EDGES)
+
+    pages, children = asyncio.run(_database_pages(database_url, 1, limit=2))
+    assert pages == _index_pages(index, 1, limit=2) == [[3, 6], [4, 5], [2, 7]]
+    assert children == index.describe_children(1, MODEL)
+
+def _diamond_ladder(rungs):
+    """
+    Structure 0 on top of a ladder of diamonds: each rung splits into two
+    structures that join again below, so there are 2**rungs paths to the bottom.
+    """
+    structures, edges = [(0, "top")], []
+    for rung in range(rungs):
+        top, left, right, bottom = 3 * rung, 3 * rung + 1, 3 * rung + 2, 3 * rung + 3
+        structures += [(left, f"left {rung}"), (right, f"right {rung}"), (bottom, f"bottom {rung}")]
+        edges += [(MODEL, top, left), (MODEL, top, right), (MODEL, left, bottom), (MODEL, right, bottom)]
+    return structures, edges
+
+async def _walk_ladder(url, rungs):
+    conn = await asyncpg.connect(url)
+    try:
+        # Enumerating every path would take far longer than this
+        await conn.execute("SET statement_timeout = '5s'")
+        details = await fetch_hierarchy(conn, 0, MODEL)
+        children = await fetch_children(conn, 0, MODEL)
+        subtree = await fetch_subtree_members(conn, 0, [3 * rungs, 0], MODEL)
+        return details, children, subtree
+    finally:
+        await conn.close()
+
+def test_diamonds_are_walked_once(database_url, create_hierarchy, monkeypatch):
+    rungs = 30
+    structures, edges = _diamond_ladder(rungs)
+    create_hierarchy(structures, edges)
+    monkeypatch.setattr(hierarchy, "is_closure_enabled", lambda: False)
+
+    details, children, subtree = asyncio.run(_walk_ladder(database_url, rungs))
+    assert len(details["descendants"]) == 3 * rungs
+    assert details["descendants"][-1] == {"structure_id": 3 * rungs, "name": f"bottom {rungs - 1}", "depth": 2 * rungs}
+    assert [(child["structure_id"], child["child_count"], child["descendant_count"]) for child in children["children"]] == [
+        (1, 1, 3 * rungs - 2), (2, 1, 3 * rungs - 2)
+    ]
+    assert subtree["contained"] == [3 * rungs]
+
+# 1 lists itself as a child, 2 has only a self-loop below it, and 3 and 4 form a cycle
+LOOP_STRUCTURES = [(1, "root"), (2, "leaf"), (3, "cycle a"), (4, "cycle b")]
+LOOP_EDGES = [(MODEL, 1, 1), (MODEL, 1, 2), (MODEL, 2, 2), (MODEL, 1, 3), (MODEL, 3, 4), (MODEL, 4, 3)]
+
+async def _loop_relatives(url):
+    conn = await asyncpg.connect(url)
+    try:
+        children = {structure_id: await fetch_children(conn, structure_id, MODEL) for structure_id in (1, 2, 3)}
+        subtree = {
+            structure_id: await fetch_subtree_members(conn, structure_id, [1, 2, 3, 4], MODEL)
+            for structure_id in (1, 2, 3)
+        }
+        return children, subtree
+    finally:
+        await conn.close()
+
+@pytest.mark.parametrize("closure", [False, True])
+def test_self_loops_agree_with_the_index(database_url, create_hierarchy, monkeypatch, closure):
+    create_hierarchy(LOOP_STRUCTURES, LOOP_EDGES, closure=closure)
+    monkeypatch.setattr(hierarchy, "is_closure_enabled", lambda: closure)
+    index = HierarchyIndex(dict(LOOP_STRUCTURES), LOOP_EDGES)
+
+    children, subtree = asyncio.run(_loop_relatives(database_url))
+    for structure_id in (1, 2, 3):
+        assert children[structure_id] == index.describe_children(structure_id, MODEL)
+        assert subtree[structure_id] == index.subtree_members(structure_id, [1, 2, 3, 4], MODEL)
+    assert [(child["structure_id"], child["has_children"]) for child in children[1]["children"]] == [(3, True), (2, False)]
+    assert subtree[3]["contained"] == [4]
+
+# Two parents for 4 and 5, a cycle between 6 and 7, and 8 outside the tree of 1
+DAG_STRUCTURES = [(1, "root"), (2, "left"), (3, "right"), (4, "both"), (5, "lower"), (6, "cycle a"),
+                  (7, "cycle b"), (8, "apart"), (9, "other root")]
+DAG_EDGES = [(MODEL, 1, 2), (MODEL, 1, 3), (MODEL, 2, 4), (MODEL, 3, 4), (MODEL, 3, 5), (MODEL, 4, 5),
+             (MODEL, 5, 6), (MODEL, 6, 7), (MODEL, 7, 6), (MODEL, 9, 8), ("Other", 1, 8)]
+
+async def _database_common_ancestors(url, pairs, hierarchy_model):
+    conn = await asyncpg.connect(url)
+    try:
+        return [await fetch_common_ancestor(conn, a, b, hierarchy_model, with_path=True) for a, b in pairs]
+    finally:
+        await conn.close()
+
+@pytest.mark.parametrize("closure", [False, True])
+def test_database_common_ancestors_match_the_index(database_url, create_hierarchy, monkeypatch, closure):
+    create_hierarchy(DAG_STRUCTURES, DAG_EDGES, closure=closure)
+    monkeypatch.setattr(hierarchy, "is_closure_enabled", lambda: closure)
+    index = HierarchyIndex(dict(DAG_STRUCTURES), DAG_EDGES)
+
+    pairs = [(a, b) for a, _ in DAG_STRUCTURES for b, _ in DAG_STRUCTURES] + [(1, 100), (100, 100)]
+    for hierarchy_model in (None, MODEL, "Other"):
+        found = asyncio.run(_database_common_ancestors(database_url, pairs, hierarchy_model))
+        assert found == [index.common_ancestor(a, b, hierarchy_model, with_path=True) for a, b in pairs]
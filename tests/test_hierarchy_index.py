@@ -0,0 +1,176 @@
+import random
+import pytest
+from app.hierarchy import parse_hierarchy_window
+from app.hierarchy_index import HierarchyIndex
+
+MODEL = "Test"
+
+# 4 and 5 have two parents each, 6 and 7 form a cycle, 2 lists itself as its
+# own child, and 9 is the root of a separate tree
+STRUCTURES = [(1, "root"), (2, "left"), (3, "right"), (4, "both"), (5, "lower"), (6, "cycle a"),
+              (7, "cycle b"), (8, "apart"), (9, "other root")]
+EDGES = [(MODEL, 1, 2), (MODEL, 1, 3), (MODEL, 2, 2), (MODEL, 2, 4), (MODEL, 3, 4), (MODEL, 3, 5),
+         (MODEL, 4, 5), (MODEL, 5, 6), (MODEL, 6, 7), (MODEL, 7, 6), (MODEL, 9, 8)]
+
+def _index():
+    return HierarchyIndex(dict(STRUCTURES), EDGES)
+
+def _contained(index, structure_id):
+    return index.subtree_members(structure_id, [s for s, _ in STRUCTURES], MODEL)["contained"]
+
+def test_subtree_members():
+    index = _index()
+    assert _contained(index, 1) == [2, 3, 4, 5, 6, 7]
+    assert _contained(index, 2) == [4, 5, 6, 7]
+    assert _contained(index, 5) == [6, 7]
+    # Members of a cycle lie below each other, but nothing is its own descendant
+    assert _contained(index, 6) == [7]
+    assert _contained(index, 7) == [6]
+    assert _contained(index, 8) == []
+    assert index.subtree_members(1, [5, 100, 5, 2], MODEL)["contained"] == [5, 2]
+
+def test_children_and_descendant_counts():
+    index = _index()
+    children = index.describe_children(1)
+    assert children["current_hierarchy_model"] == MODEL
+    assert [(c["structure_id"], c["child_count"], c["descendant_count"], c["has_children"])
+            for c in children["children"]] == [(2, 1, 4, True), (3, 2, 4, True)]
+    # The self-loop of 2 is neither a child nor counted
+    assert [c["structure_id"] for c in index.describe_children(2)["children"]] == [4]
+    assert [(c["structure_id"], c["child_count"], c["descendant_count"])
+            for c in index.describe_children(5)["children"]] == [(6, 1, 1)]
+    assert index.describe_children(8)["children"] == []
+
+def test_describe_walks_each_structure_once():
+    index = _index()
+    hierarchy = index.describe(5, MODEL)["hierarchy"]
+    # Levels are ordered by name
+    assert [(e["structure_id"], e["depth"]) for e in hierarchy["ancestors"]] == [(4, 1), (3, 1), (2, 2), (1, 2)]
+    assert [(e["structure_id"], e["depth"]) for e in hierarchy["descendants"]] == [(6, 1), (7, 2)]
+
+def _path_ids(result):
+    return [entry["structure_id"] for entry in result["path"]]
+
+def test_common_ancestor_in_a_dag_with_cycles():
+    index = _index()
+    graph = index.graphs[MODEL]
+    assert graph.lifting is None
+
+    # 5 is one level below 3 and two below 2, through 4
+    result = index.common_ancestor(5, 2, with_path=True)
+    assert (result["lca"]["structure_id"], result["distance_a"], result["distance_b"]) == (2, 2, 0)
+    assert _path_ids(result) == [5, 4, 2]
+    # Siblings meet at their parent
+    result = index.common_ancestor(2, 3, with_path=True)
+    assert (result["lca"]["structure_id"], result["distance_a"], result["distance_b"]) == (1, 1, 1)
+    assert _path_ids(result) == [2, 1, 3]
+    # Inside the cycle either structure is above the other, at the same combined
+    # distance, so the first by name wins
+    result = index.common_ancestor(7, 6, with_path=True)
+    assert (result["lca"]["structure_id"], result["distance_a"], result["distance_b"]) == (6, 1, 0)
+    assert _path_ids(result) == [7, 6]
+    assert index.common_ancestor(6, 6, with_path=True)["path"] == [{"structure_id": 6, "name": "cycle a"}]
+
+def test_common_ancestor_of_unrelated_structures():
+    index = _index()
+    assert index.common_ancestor(8, 5, with_path=True) == {
+        "current_hierarchy_model": MODEL, "lca": None, "distance_a": None, "distance_b": None, "path": []
+    }
+    assert index.common_ancestor(8, 5, "Missing")["lca"] is None
+    assert index.common_ancestor(1, 100) is None
+
+def test_common_ancestor_in_a_forest():
+    structures = {i: f"node {i:02d}" for i in range(1, 10)}
+    edges = [(MODEL, 1, 2), (MODEL, 1, 3), (MODEL, 2, 4), (MODEL, 2, 5), (MODEL, 4, 6), (MODEL, 3, 7), (MODEL, 8, 9)]
+    index = HierarchyIndex(structures, edges)
+    assert index.graphs[MODEL].lifting is not None
+
+    result = index.common_ancestor(6, 5, with_path=True)
+    assert (result["lca"]["structure_id"], result["distance_a"], result["distance_b"]) == (2, 2, 1)
+    assert _path_ids(result) == [6, 4, 2, 5]
+    assert _path_ids(index.common_ancestor(6, 7, with_path=True)) == [6, 4, 2, 1, 3, 7]
+    assert index.common_ancestor(4, 6)["lca"]["structure_id"] == 4
+    assert index.common_ancestor(6, 9)["lca"] is None
+
+def _upward_distances(parents, start):
+    distances, frontier = {start: 0}, [start]
+    while frontier:
+        next_frontier = []
+        for node in frontier:
+            for parent in parents.get(node, ()):
+                if parent not in distances:
+                    distances[parent] = distances[node] + 1
+                    next_frontier.append(parent)
+        frontier = next_frontier
+    return distances
+
+def test_common_ancestor_matches_exhaustive_search():
+    generator = random.Random(7)
+    for _ in range(20):
+        size = 30
+        names = {i: f"s{generator.randrange(1000):03d}" for i in range(size)}
+        # Mostly downward edges, some of them closing cycles
+        edges = {(generator.randrange(size), generator.randrange(size)) for _ in range(45)}
+        index = HierarchyIndex(names, [(MODEL, parent, child) for parent, child in edges])
+        parents = {}
+        for parent, child in edges:
+            parents.setdefault(child, set()).add(parent)
+        members = [i for i in range(size) if index.graphs[MODEL].has_node(index.positions[i])]
+
+        for a in members:
+            for b in members:
+                result = index.common_ancestor(a, b, MODEL, with_path=True)
+                up_a, up_b = _upward_distances(parents, a), _upward_distances(parents, b)
+                common = [node for node in up_a if node in up_b]
+                if not common:
+                    assert result["lca"] is None and result["path"] == []
+                    continue
+                expected = min(common, key=lambda node: (up_a[node] + up_b[node], names[node], node))
+                assert result["lca"]["structure_id"] == expected
+                assert (result["distance_a"], result["distance_b"]) == (up_a[expected], up_b[expected])
+                # The path climbs from a to the ancestor along parent edges, then descends to b
+                path = _path_ids(result)
+                assert len(path) == up_a[expected] + up_b[expected] + 1
+                assert path[0] == a and path[up_a[expected]] == expected and path[-1] == b
+                assert all(upper in parents[lower] for lower, upper in zip(path, path[1:up_a[expected] + 1]))
+                assert all(upper in parents[lower]
+                           for upper, lower in zip(path[up_a[expected]:], path[up_a[expected] + 1:]))
+
+def _pages(index, structure_id, **parameters):
+    pages, cursor = [], None
+    while True:
+        window = parse_hierarchy_window(cursor=cursor, **parameters)
+        page = index.describe(structure_id, MODEL, window=window)["hierarchy"]
+        pages.append(page)
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return pages
+
+@pytest.mark.parametrize("direction", [None, "ancestors", "descendants"])
+@pytest.mark.parametrize("limit", [1, 2, 3, 10])
+def test_cursors_page_through_the_whole_hierarchy(direction, limit):
+    index = _index()
+    full = index.describe(4, MODEL)["hierarchy"]
+    pages = _pages(index, 4, limit=limit, direction=direction)
+    for key in ("ancestors", "descendants"):
+        entries = [entry for page in pages for entry in page[key]]
+        assert entries == (full[key] if direction in (None, key) else [])
+        assert all(len(page[key]) <= limit for page in pages)
+    # Only the last page has no cursor
+    assert [page["next_cursor"] is None for page in pages] == [False] * (len(pages) - 1) + [True]
+
+def test_cursor_round_trip():
+    window = parse_hierarchy_window(max_depth=2, limit=3, direction="descendants")
+    page = window.paginate([], [{"structure_id": i} for i in range(4)])
+    assert page["next_cursor"] == "0.3"
+    following = parse_hierarchy_window(max_depth=2, limit=3, cursor=page["next_cursor"], direction="descendants")
+    assert following == window._replace(descendants_offset=3)
+    assert following.paginate([], [{"structure_id": 3}])["next_cursor"] is None
+
+@pytest.mark.parametrize("parameters", [
+    {"max_depth": 0}, {"limit": 0}, {"direction": "sideways"},
+    {"cursor": "1"}, {"cursor": "a.b"}, {"cursor": "1.-1"}, {"cursor": "1.2.3"},
+])
+def test_invalid_window_parameters(parameters):
+    with pytest.raises(ValueError):
+        parse_hierarchy_window(**parameters)
@@ -0,0 +1,51 @@
+from app.search_index import SearchIndex
+
+# (result_id, matched_name, result_name, source_rank): standard names rank 0, synonyms 1
+ENTRIES = [
+    (1, "Hippocampus", "Hippocampus", 0),
+    (2, "Hippo", "Hippo", 0),
+    (3, "Parahippocampal gyrus", "Parahippocampal gyrus", 0),
+    (4, "Ammon horn", "Ammon horn", 0),
+    (4, "hippocampal formation", "Ammon horn", 1),
+    (5, "HIPPO", "Alpha", 1),
+    (6, "Amygdala", "Amygdala", 0),
+]
+
+def test_exact_before_prefix_before_substring():
+    index = SearchIndex(ENTRIES)
+    # Exact matches, the standard name before the synonym, then prefixes, then substrings
+    assert index.search("hippo") == [(2, "Hippo"), (5, "Alpha"), (1, "Hippocampus"), (4, "Ammon horn"),
+                                     (3, "Parahippocampal gyrus")]
+
+def test_search_is_case_insensitive():
+    index = SearchIndex(ENTRIES)
+    assert index.search("HIPPOCAMP") == index.search("hippocamp") == [
+        (1, "Hippocampus"), (4, "Ammon horn"), (3, "Parahippocampal gyrus")
+    ]
+
+def test_substring_matches_rank_standard_names_first():
+    index = SearchIndex(ENTRIES)
+    assert index.search("pocampal") == [(3, "Parahippocampal gyrus"), (4, "Ammon horn")]
+
+def test_each_result_is_returned_once_at_its_best_match():
+    index = SearchIndex(ENTRIES)
+    # Ammon horn is an exact match of its own name and a substring match of its synonym
+    assert index.search("ammon horn") == [(4, "Ammon horn")]
+    assert index.search("am") == [(4, "Ammon horn"), (6, "Amygdala"), (1, "Hippocampus"),
+                                  (3, "Parahippocampal gyrus")]
+
+def test_long_queries_must_match_as_a_whole():
+    index = SearchIndex(ENTRIES)
+    # Every 3-gram of the query occurs in some name, but the query itself does not
+    assert index.search("parahippocampus") == []
+    assert index.search("gyrus") == [(3, "Parahippocampal gyrus")]
+
+def test_limit_keeps_the_best_matches():
+    index = SearchIndex(ENTRIES)
+    assert index.search("hippo", limit=2) == [(2, "Hippo"), (5, "Alpha")]
+    assert index.search("hippo", limit=0) == []
+    assert index.search("xyz") == []
+
+def test_empty_query_matches_every_result():
+    index = SearchIndex(ENTRIES)
+    assert sorted(result_id for result_id, _ in index.search("", limit=100)) == [1, 2, 3, 4, 5, 6]
@@ -0,0 +1,41 @@
+import datetime
+import decimal
+import json
+import uuid
+import pytest
+from app import config
+from app.serialization import dumps, dumps_members, orjson
+
+VALUES = [
+    None,
+    {"structure_id": 4, "name": "Ammon’s horn \"CA1\"", "acronym": None, "synonyms": [], "ratio": 0.25},
+    [datetime.datetime(2024, 1, 2, 3, 4, 5, 678), datetime.datetime(2024, 1, 2, 3, 4, 5, tzinfo=datetime.timezone.utc)],
+    [datetime.date(2024, 1, 2), datetime.time(3, 4, 5)],
+    [decimal.Decimal("1.50"), decimal.Decimal("7"), decimal.Decimal("1E+2")],
+    {"id": uuid.UUID(int=5), "nested": {"deeper": [True, False, None]}},
+]
+
+def _encode(value, fast, monkeypatch):
+    monkeypatch.setattr(config, "FAST_JSON", fast)
+    return dumps(value)
+
+@pytest.mark.skipif(orjson is None, reason="orjson is not installed")
+@pytest.mark.parametrize("value", VALUES)
+def test_orjson_and_standard_library_agree(value, monkeypatch):
+    assert _encode(value, True, monkeypatch) == _encode(value, False, monkeypatch)
+
+def test_database_types():
+    encoded = json.loads(dumps({
+        "when": datetime.date(2024, 1, 2),
+        "count": decimal.Decimal("7"),
+        "share": decimal.Decimal("0.5"),
+        "missing": None
+    }))
+    assert encoded == {"when": "2024-01-02", "count": 7, "share": 0.5, "missing": None}
+
+def test_unsupported_type_raises():
+    with pytest.raises(TypeError):
+        dumps({"value": object()})
+
+def test_members_join_into_an_object():
+    assert json.loads(b"{" + dumps_members({1: {"a": 1}, 2: None}) + b"}") == {"1": {"a": 1}, "2": None}
@@ -0,0 +1,100 @@
+import asyncio
+from app import timing
+from app.singleflight import SingleFlight
+from app.timing import RequestTiming, span
+
+async def _request(flight, key, func):
+    # Each request is timed in a task of its own, as by ServerTimingMiddleware
+    request_timing = RequestTiming()
+    timing._current.set(request_timing)
+    return await flight.do(key, func), request_timing
+
+def test_callers_share_the_timing_of_the_call():
+    flight = SingleFlight()
+
+    async def query():
+        with span("db-query"):
+            await asyncio.sleep(0.01)
+        return "result"
+
+    async def main():
+        return await asyncio.gather(*(_request(flight, "key", query) for _ in range(3)))
+
+    results = asyncio.run(main())
+    assert [result for result, _ in results] == ["result"] * 3
+    assert (flight.started, flight.shared) == (1, 2)
+    first, *joined = [request_timing for _, request_timing in results]
+    for request_timing in (first, *joined):
+        assert request_timing.counts == {"db-query": 1}
+        assert request_timing.durations["db-query"] >= 0.01
+    assert "coalesced" not in first.descriptions
+    assert all(request_timing.descriptions["coalesced"] == "shared" for request_timing in joined)
+
+def test_exception_reaches_every_caller_and_frees_the_key():
+    flight = SingleFlight()
+    calls = []
+
+    async def failing():
+        calls.append("failing")
+        await asyncio.sleep(0.01)
+        raise RuntimeError("query failed")
+
+    async def succeeding():
+        calls.append("succeeding")
+        return "result"
+
+    async def main():
+        results = await asyncio.gather(*(flight.do("key", failing) for _ in range(3)), return_exceptions=True)
+        # The failed call is not reused
+        return results, await flight.do("key", succeeding)
+
+    results, retried = asyncio.run(main())
+    assert [str(result) for result in results] == ["query failed"] * 3
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert retried == "result"
+    assert calls == ["failing", "succeeding"]
+
+def test_cancelled_caller_leaves_the_call_running_for_the_others():
+    flight = SingleFlight()
+    release = None
+
+    async def query():
+        await release.wait()
+        return "result"
+
+    async def main():
+        nonlocal release
+        release = asyncio.Event()
+        first = asyncio.ensure_future(flight.do("key", query))
+        second = asyncio.ensure_future(flight.do("key", query))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        return first, await second
+
+    first, result = asyncio.run(main())
+    assert first.cancelled()
+    assert result == "result"
+    assert (flight.started, flight.shared) == (1, 1)
+
+def test_call_whose_callers_were_all_cancelled_still_finishes():
+    flight = SingleFlight()
+    finished = []
+
+    async def query():
+        await asyncio.sleep(0.01)
+        finished.append(True)
+        raise RuntimeError("nobody is waiting")
+
+    async def main():
+        caller = asyncio.ensure_future(flight.do("key", query))
+        await asyncio.sleep(0)
+        caller.cancel()
+        await asyncio.sleep(0.05)
+        return caller
+
+    caller = asyncio.run(main())
+    assert caller.cancelled()
+    assert finished == [True]
+    assert not flight._calls